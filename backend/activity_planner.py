@@ -0,0 +1,81 @@
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+PREFERRED_CATEGORY_BONUS = 2.0
+FREE_ACTIVITY_BONUS = 0.25
+
+
+class PlannedSlot(NamedTuple):
+    index: int
+    day: int
+    start_minute: int
+
+
+def score_activities(categories: Sequence[str], costs: np.ndarray, preferred: Sequence[str]) -> np.ndarray:
+    preferred_set = {category.lower() for category in preferred}
+    is_preferred = np.fromiter((category.lower() in preferred_set for category in categories), dtype=bool, count=len(categories))
+    return 1.0 + PREFERRED_CATEGORY_BONUS * is_preferred + FREE_ACTIVITY_BONUS * (costs == 0)
+
+
+def plan_days(
+    costs: np.ndarray,
+    minutes: np.ndarray,
+    scores: np.ndarray,
+    days: int,
+    daily_budget: float,
+    minutes_per_day: int,
+    budget_used: Optional[np.ndarray] = None,
+    minutes_used: Optional[np.ndarray] = None,
+    place: Optional[Callable[[int, int], Optional[int]]] = None,
+) -> List[PlannedSlot]:
+    """Greedily pack activities into days under a per-day budget and time limit.
+
+    Activities are ranked by score per unit of the resources they consume (share of a
+    day's budget plus share of a day's time), which is the classic greedy bound for a
+    two-constraint knapsack. Each activity then goes to the feasible day with the most
+    time left, keeping days balanced instead of front-loading the first one.
+    budget_used and minutes_used carry what is already booked on each day.
+
+    place(index, day), when given, picks and reserves the start minute of an activity
+    on a day, or returns None when the day has no gap that holds it; the activity then
+    tries the next feasible day, and only placed activities are charged to a day.
+    Without it, activities start back to back from minute 0 of their day.
+    """
+    if days <= 0 or len(costs) == 0:
+        return []
+
+    costs = np.asarray(costs, dtype=np.float64)
+    minutes = np.asarray(minutes, dtype=np.int64)
+    budget_share = costs / daily_budget if daily_budget > 0 else np.where(costs > 0, np.inf, 0.0)
+    weight = budget_share + minutes / minutes_per_day
+    density = np.asarray(scores, dtype=np.float64) / np.maximum(weight, 1e-6)
+
+    # Drop anything that could never fit in a single day before ranking
+    fits_any_day = (costs <= daily_budget) & (minutes <= minutes_per_day)
+    ranked = np.flatnonzero(fits_any_day)[np.argsort(-density[fits_any_day], kind="stable")]
+
+    budget_left = np.full(days, float(daily_budget))
+    minutes_left = np.full(days, int(minutes_per_day), dtype=np.int64)
+    if budget_used is not None:
+        budget_left -= budget_used
+    if minutes_used is not None:
+        minutes_left -= minutes_used
+    plan = []
+    for index in ranked:
+        feasible = (budget_left >= costs[index]) & (minutes_left >= minutes[index])
+        if not feasible.any():
+            continue
+        # Days with the most time left first; feasible days sort ahead of the rest
+        for day in np.argsort(-np.where(feasible, minutes_left, -1), kind="stable")[:int(feasible.sum())]:
+            day = int(day)
+            start_minute = place(int(index), day) if place else int(minutes_per_day - minutes_left[day])
+            if start_minute is None:
+                continue
+            plan.append(PlannedSlot(index=int(index), day=day, start_minute=int(start_minute)))
+            budget_left[day] -= costs[index]
+            minutes_left[day] -= minutes[index]
+            break
+
+    plan.sort(key=lambda slot: (slot.day, slot.start_minute))
+    return plan
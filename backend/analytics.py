@@ -0,0 +1,218 @@
+from pathlib import Path
+from typing import Dict, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+import currencies
+
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+PARTITION_COLUMN = "updated_month"
+UNKNOWN_REGION = "Unknown"
+UNKNOWN_CATEGORY = "Other"
+
+# File suffix and pyarrow.dataset format per output format
+FORMATS = {"parquet": (".parquet", "parquet"), "arrow": (".arrow", "ipc")}
+
+# Free-text fields (descriptions, notes) stay out of the export
+SCHEMAS: Dict[str, pa.Schema] = {
+    "trips": pa.schema([
+        ("id", pa.string()), ("user_id", pa.string()), ("name", pa.string()),
+        ("start_date", TIMESTAMP), ("end_date", TIMESTAMP), ("is_public", pa.bool_()),
+        ("created_at", TIMESTAMP), ("updated_at", TIMESTAMP),
+    ]),
+    "stops": pa.schema([
+        ("id", pa.string()), ("trip_id", pa.string()), ("user_id", pa.string()), ("city_id", pa.string()),
+        ("start_date", TIMESTAMP), ("end_date", TIMESTAMP), ("order", pa.float64()), ("updated_at", TIMESTAMP),
+    ]),
+    "trip_activities": pa.schema([
+        ("id", pa.string()), ("trip_id", pa.string()), ("stop_id", pa.string()), ("user_id", pa.string()),
+        ("activity_id", pa.string()), ("date", TIMESTAMP), ("time", pa.string()), ("duration_minutes", pa.float64()),
+        ("cost", pa.float64()), ("currency", pa.string()), ("base_cost", pa.float64()), ("updated_at", TIMESTAMP),
+    ]),
+    "trip_costs": pa.schema([
+        ("id", pa.string()), ("trip_id", pa.string()), ("user_id", pa.string()), ("category", pa.string()),
+        ("amount", pa.float64()), ("currency", pa.string()), ("base_amount", pa.float64()), ("updated_at", TIMESTAMP),
+    ]),
+    "tombstones": pa.schema([
+        ("id", pa.string()), ("collection", pa.string()), ("user_id", pa.string()), ("updated_at", TIMESTAMP),
+    ]),
+}
+
+# Small reference tables, snapshotted whole on every run
+CATALOG_SCHEMAS: Dict[str, pa.Schema] = {
+    "cities": pa.schema([
+        ("id", pa.string()), ("name", pa.string()), ("country", pa.string()), ("region", pa.string()),
+        ("cost_index", pa.float64()),
+    ]),
+    "activities": pa.schema([
+        ("id", pa.string()), ("city_id", pa.string()), ("name", pa.string()), ("category", pa.string()),
+        ("cost", pa.float64()), ("currency", pa.string()),
+    ]),
+}
+
+# Rows written before multi-currency carry no currency or base value; they were in the base currency
+BASE_FALLBACKS = {"trip_activities": ("cost", "base_cost"), "trip_costs": ("amount", "base_amount")}
+
+
+def to_frame(docs: List[dict], schema: pa.Schema) -> pd.DataFrame:
+    frame = pd.DataFrame.from_records(docs, columns=schema.names)
+    for field in schema:
+        if field.type == TIMESTAMP:
+            # Dates are BSON datetimes, audit stamps are isoformat strings; older rows may mix both
+            frame[field.name] = pd.to_datetime(frame[field.name], utc=True, errors="coerce", format="ISO8601")
+        elif pa.types.is_floating(field.type):
+            frame[field.name] = pd.to_numeric(frame[field.name], errors="coerce")
+    return frame
+
+
+def normalize(name: str, frame: pd.DataFrame) -> pd.DataFrame:
+    if name in BASE_FALLBACKS:
+        value, base = BASE_FALLBACKS[name]
+        frame["currency"] = frame["currency"].fillna(currencies.BASE_CURRENCY)
+        frame[base] = frame[base].fillna(frame[value])
+    return frame
+
+
+def write_table(table: pa.Table, path: Path, file_format: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written beside the target and renamed over it, so readers never see half a file;
+    # pyarrow skips dot-prefixed files when it scans a dataset directory
+    partial = path.with_name(f".{path.name}.partial")
+    if file_format == "parquet":
+        pq.write_table(table, partial)
+    else:
+        feather.write_feather(table, partial)
+    partial.replace(path)
+
+
+def write_partitioned(name: str, docs: List[dict], out: Path, file_format: str, part: str) -> int:
+    """Write one chunk of a collection, one file per updated_at month partition."""
+    schema = SCHEMAS[name]
+    frame = normalize(name, to_frame(docs, schema))
+    suffix = FORMATS[file_format][0]
+    months = frame["updated_at"].dt.strftime("%Y-%m").fillna("unknown")
+    for month, rows in frame.groupby(months, sort=False):
+        table = pa.Table.from_pandas(rows, schema=schema, preserve_index=False)
+        write_table(table, out / name / f"{PARTITION_COLUMN}={month}" / f"part-{part}{suffix}", file_format)
+    return len(frame)
+
+
+def write_snapshot(name: str, docs: List[dict], out: Path, file_format: str):
+    schema = CATALOG_SCHEMAS[name]
+    table = pa.Table.from_pandas(to_frame(docs, schema), schema=schema, preserve_index=False)
+    write_table(table, out / "catalog" / f"{name}{FORMATS[file_format][0]}", file_format)
+
+
+def write_frame(frame: pd.DataFrame, path: Path, file_format: str):
+    write_table(pa.Table.from_pandas(frame, preserve_index=False), path, file_format)
+
+
+def _read(path: Path, file_format: str, schema: pa.Schema) -> pd.DataFrame:
+    if not path.exists():
+        return schema.empty_table().to_pandas()
+    dataset = ds.dataset(path, schema=schema, format=FORMATS[file_format][1], partitioning="hive")
+    return dataset.to_table(columns=schema.names).to_pandas()
+
+
+def load_current(out: Path, file_format: str) -> Dict[str, pd.DataFrame]:
+    """The latest version of every exported row, with deleted rows removed.
+
+    Incremental runs append a new copy of each row every time it changes, so the
+    latest updated_at per id wins. A row is dropped when its collection has a
+    tombstone for that id stamped at or after the row's last update.
+    """
+    frames = {name: _read(out / name, file_format, schema) for name, schema in SCHEMAS.items()}
+    tombstones = frames.pop("tombstones").sort_values("updated_at").drop_duplicates(["collection", "id"], keep="last")
+    for name, frame in frames.items():
+        latest = frame.sort_values("updated_at", kind="stable").drop_duplicates("id", keep="last")
+        deleted = tombstones.loc[tombstones["collection"] == name, ["id", "updated_at"]].rename(columns={"updated_at": "deleted_at"})
+        latest = latest.merge(deleted, on="id", how="left")
+        frames[name] = latest.loc[~(latest["deleted_at"] >= latest["updated_at"])].drop(columns="deleted_at").reset_index(drop=True)
+    for name, schema in CATALOG_SCHEMAS.items():
+        path = out / "catalog" / f"{name}{FORMATS[file_format][0]}"
+        frames[name] = _read(path, file_format, schema)
+    return frames
+
+
+def _month(values: pd.Series) -> pd.Series:
+    return values.dt.strftime("%Y-%m").fillna("unknown")
+
+
+def spend_items(frames: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """Every activity and cost of a live trip as (trip_id, source, month, region, category, spend).
+
+    Activities are dated and sit at a stop, so they take their own month and the
+    stop city's region, under the catalog activity's category. Costs belong to the
+    whole trip: they take the trip's start month and the region of its first stop.
+    Spend is in the base currency.
+    """
+    trips = frames["trips"][["id", "start_date"]].rename(columns={"id": "trip_id"})
+    regions = frames["cities"][["id", "region"]].rename(columns={"id": "city_id"})
+    stops = frames["stops"][["id", "trip_id", "city_id", "order"]].merge(regions, on="city_id", how="left")
+
+    activities = (
+        frames["trip_activities"][["trip_id", "stop_id", "activity_id", "date", "base_cost"]]
+        .merge(trips[["trip_id"]], on="trip_id")
+        .merge(stops[["id", "region"]].rename(columns={"id": "stop_id"}), on="stop_id")
+        .merge(frames["activities"][["id", "category"]].rename(columns={"id": "activity_id"}), on="activity_id", how="left")
+    )
+    activities = pd.DataFrame({
+        "trip_id": activities["trip_id"],
+        "source": "activity",
+        "month": _month(activities["date"]),
+        "region": activities["region"],
+        "category": activities["category"],
+        "spend": activities["base_cost"],
+    })
+
+    first_stops = stops.sort_values(["trip_id", "order"], kind="stable").drop_duplicates("trip_id")[["trip_id", "region"]]
+    costs = (
+        frames["trip_costs"][["trip_id", "category", "base_amount"]]
+        .merge(trips, on="trip_id")
+        .merge(first_stops, on="trip_id", how="left")
+    )
+    costs = pd.DataFrame({
+        "trip_id": costs["trip_id"],
+        "source": "cost",
+        "month": _month(costs["start_date"]),
+        "region": costs["region"],
+        "category": costs["category"],
+        "spend": costs["base_amount"],
+    })
+
+    items = pd.concat([activities, costs], ignore_index=True)
+    items["region"] = items["region"].fillna(UNKNOWN_REGION)
+    items["category"] = items["category"].fillna(UNKNOWN_CATEGORY)
+    items["spend"] = items["spend"].fillna(0.0)
+    return items
+
+
+def build_rollups(frames: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    items = spend_items(frames)
+
+    by_category = (
+        items.groupby(["month", "region", "category", "source"], as_index=False)
+        .agg(spend=("spend", "sum"), items=("spend", "size"), trips=("trip_id", "nunique"))
+        .sort_values(["month", "region", "spend"], ascending=[True, True, False], kind="stable")
+    )
+
+    trips = frames["trips"]
+    spend_per_trip = items.groupby("trip_id")["spend"].sum()
+    per_trip = pd.DataFrame({
+        "month": _month(trips["start_date"]),
+        "spend": trips["id"].map(spend_per_trip).fillna(0.0),
+    })
+    by_month = (
+        per_trip.groupby("month", as_index=False)
+        .agg(trips=("spend", "size"), spend=("spend", "sum"), mean_trip_spend=("spend", "mean"), median_trip_spend=("spend", "median"))
+        .sort_values("month")
+    )
+
+    rollups = {"spend_by_category_region_month": by_category, "trip_spend_by_month": by_month}
+    for frame in rollups.values():
+        frame["currency"] = currencies.BASE_CURRENCY
+    return rollups
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import httpx
+import numpy as np
+import typer
+
+import repositories
+import server
+
+CATEGORIES = ["Sightseeing", "Adventure", "Food & Dining", "Culture", "Shopping", "Entertainment", "Nature"]
+
+cli = typer.Typer(add_completion=False)
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000
+    return f"p50={np.percentile(ms, 50):.2f}ms p95={np.percentile(ms, 95):.2f}ms p99={np.percentile(ms, 99):.2f}ms"
+
+async def seed_catalog(cities: int, activities_per_city: int, seed: int):
+    rng = np.random.default_rng(seed)
+    await server.repos.cities.insert_many([
+        {"id": f"city-{i}", "name": f"City {i}", "country": f"Country {i % 40}", "region": "Bench", "cost_index": 1.0, "popularity": float(rng.uniform(1, 10))}
+        for i in range(cities)
+    ])
+    await server.repos.activities.insert_many([
+        {
+            "id": f"activity-{i}-{j}",
+            "name": f"Activity {i}-{j}",
+            "city_id": f"city-{i}",
+            "category": CATEGORIES[j % len(CATEGORIES)],
+            "cost": float(np.round(rng.gamma(2.0, 25.0), 2)),
+            "duration": "2 hours",
+            "duration_min": 120,
+            "duration_max": 120
+        }
+        for i in range(cities) for j in range(activities_per_city)
+    ])
+    await server.build_catalog_indexes()
+
+async def time_requests(client: httpx.AsyncClient, requests):
+    samples = []
+    for method, url, body in requests:
+        start = time.perf_counter()
+        response = await client.request(method, url, json=body)
+        samples.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return samples
+
+async def run_benchmark(trips: int, stops_per_trip: int, activities_per_stop: int, requests: int, seed: int):
+    # The app is driven in-process over ASGI with in-memory storage, so timings are
+    # routing, validation, handler and serialization cost with no database latency
+    server.repos = repositories.memory_repositories()
+    await seed_catalog(50, 20, seed)
+    rng = np.random.default_rng(seed + 1)
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        signup = await client.post("/api/auth/signup", json={"name": "Bench", "email": "bench@example.com", "password": "bench"})
+        client.headers["Authorization"] = f"Bearer {signup.json()['token']}"
+
+        start = time.perf_counter()
+        trip_ids, stop_ids = [], []
+        for t in range(trips):
+            trip = (await client.post("/api/trips", json={"name": f"Trip {t}", "start_date": "2030-01-01", "end_date": "2030-01-31"})).json()
+            trip_ids.append(trip['id'])
+            for s in range(stops_per_trip):
+                city = int(rng.integers(0, 50))
+                stop = (await client.post(f"/api/trips/{trip['id']}/stops", json={"city_id": f"city-{city}", "start_date": "2030-01-01", "end_date": "2030-01-31", "order": s})).json()
+                stop_ids.append(stop['id'])
+                for a in range(activities_per_stop):
+                    await client.post(
+                        f"/api/stops/{stop['id']}/activities",
+                        params={"allow_conflicts": "true"},
+                        json={"activity_id": f"activity-{city}-{a % 20}", "date": f"2030-01-{a % 28 + 1:02d}", "cost": 10.0}
+                    )
+        print(f"Seeded {trips} trips, {len(stop_ids)} stops in {time.perf_counter() - start:.1f}s")
+
+        def pick(ids):
+            return ids[int(rng.integers(0, len(ids)))]
+
+        scenarios = {
+            "GET /trips": [("GET", "/api/trips", None) for _ in range(requests)],
+            "GET /trips/{id}": [("GET", f"/api/trips/{pick(trip_ids)}", None) for _ in range(requests)],
+            "GET /trips/{id}/stops": [("GET", f"/api/trips/{pick(trip_ids)}/stops", None) for _ in range(requests)],
+            "GET /stops/{id}/activities": [("GET", f"/api/stops/{pick(stop_ids)}/activities", None) for _ in range(requests)],
+            "GET /activities?sort=cost": [("GET", f"/api/activities?city_id=city-{int(rng.integers(0, 50))}&sort=cost", None) for _ in range(requests)],
+            "GET /search/activities": [("GET", "/api/search/activities?q=activity", None) for _ in range(requests)],
+            "POST /trips/{id}/costs": [("POST", f"/api/trips/{pick(trip_ids)}/costs", {"category": "Food", "amount": 12.5}) for _ in range(requests)],
+        }
+        for name, batch in scenarios.items():
+            print(f"{name}: {percentiles(await time_requests(client, batch))}")
+
+@cli.command()
+def main(
+    trips: int = typer.Option(50, help="Trips to seed for the benchmark user"),
+    stops_per_trip: int = typer.Option(5),
+    activities_per_stop: int = typer.Option(10),
+    requests: int = typer.Option(500, help="Requests per scenario"),
+    seed: int = typer.Option(7),
+):
+    asyncio.run(run_benchmark(trips, stops_per_trip, activities_per_stop, requests, seed))
+
+if __name__ == "__main__":
+    cli()
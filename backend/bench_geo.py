@@ -0,0 +1,103 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+
+from server import geo_near_pipeline
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+CATEGORIES = ["Sightseeing", "Adventure", "Food & Dining", "Culture", "Shopping", "Entertainment", "Nature"]
+INSERT_BATCH = 10_000
+
+cli = typer.Typer(add_completion=False)
+
+def synthetic_catalog(points: int, seed: int):
+    # Cluster points around a few hundred "cities" so density looks like a real catalog
+    rng = np.random.default_rng(seed)
+    centers = np.column_stack([rng.uniform(-60, 70, 400), rng.uniform(-180, 180, 400)])
+    owner = rng.integers(0, len(centers), points)
+    lat = np.clip(centers[owner, 0] + rng.normal(0, 0.15, points), -89.9, 89.9)
+    lng = (centers[owner, 1] + rng.normal(0, 0.15, points) + 180) % 360 - 180
+    category = rng.integers(0, len(CATEGORIES), points)
+    cost = np.round(rng.gamma(2.0, 25.0, points), 2)
+    return centers, lat, lng, category, cost
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000
+    return f"p50={np.percentile(ms, 50):.2f}ms p95={np.percentile(ms, 95):.2f}ms p99={np.percentile(ms, 99):.2f}ms"
+
+async def time_queries(collection, pipelines):
+    samples = []
+    for pipeline in pipelines:
+        start = time.perf_counter()
+        await collection.aggregate(pipeline).to_list(None)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+async def run_benchmark(points: int, queries: int, seed: int, keep: bool):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    # Never touch the application database
+    collection = client[os.environ['DB_NAME'] + "_bench"]["activities"]
+    await collection.drop()
+    
+    centers, lat, lng, category, cost = synthetic_catalog(points, seed)
+    start = time.perf_counter()
+    for offset in range(0, points, INSERT_BATCH):
+        end = min(offset + INSERT_BATCH, points)
+        await collection.insert_many([
+            {
+                "id": f"bench-{i}",
+                "name": f"Activity {i}",
+                "city_id": f"city-{i % len(centers)}",
+                "category": CATEGORIES[category[i]],
+                "cost": float(cost[i]),
+                "lat": float(lat[i]),
+                "lng": float(lng[i]),
+                "location": {"type": "Point", "coordinates": [float(lng[i]), float(lat[i])]}
+            }
+            for i in range(offset, end)
+        ], ordered=False)
+    print(f"Inserted {points} points in {time.perf_counter() - start:.1f}s")
+    
+    start = time.perf_counter()
+    await collection.create_index([("location", "2dsphere"), ("category", ASCENDING), ("cost", ASCENDING)])
+    print(f"Built 2dsphere index in {time.perf_counter() - start:.1f}s")
+    
+    rng = np.random.default_rng(seed + 1)
+    probes = centers[rng.integers(0, len(centers), queries)] + rng.normal(0, 0.05, (queries, 2))
+    probes[:, 1] = (probes[:, 1] + 180) % 360 - 180
+    
+    scenarios = {
+        "radius 5km, limit 50": lambda p: geo_near_pipeline(p[0], p[1], 5, 50, {}),
+        "k-nearest 20": lambda p: geo_near_pipeline(p[0], p[1], None, 20, {}),
+        "k-nearest 20, category + max cost": lambda p: geo_near_pipeline(p[0], p[1], None, 20, {"category": "Food & Dining", "cost": {"$lte": 40}}),
+        "radius 25km, limit 100, category": lambda p: geo_near_pipeline(p[0], p[1], 25, 100, {"category": "Culture"}),
+    }
+    for name, build in scenarios.items():
+        await time_queries(collection, [build(p) for p in probes[:10]])
+        samples = await time_queries(collection, [build(p) for p in probes])
+        print(f"{name:40s} {percentiles(samples)}")
+    
+    if not keep:
+        await collection.drop()
+    client.close()
+
+@cli.command()
+def main(
+    points: int = typer.Option(500_000, help="Synthetic catalog size"),
+    queries: int = typer.Option(200, help="Queries per scenario"),
+    seed: int = typer.Option(7),
+    keep: bool = typer.Option(False, help="Keep the benchmark collection afterwards"),
+):
+    asyncio.run(run_benchmark(points, queries, seed, keep))
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,64 @@
+import time
+
+import numpy as np
+import typer
+
+from search_index import SearchIndex
+from server import ACTIVITY_SEARCH_FIELDS
+
+CATEGORIES = ["Sightseeing", "Adventure", "Food & Dining", "Culture", "Shopping", "Entertainment", "Nature"]
+
+cli = typer.Typer(add_completion=False)
+
+def synthetic_activities(count: int, vocabulary: int, seed: int):
+    # Zipf-distributed words give the skewed posting lengths of real text
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocabulary)])
+    names = np.minimum(rng.zipf(1.3, (count, 3)), vocabulary) - 1
+    descriptions = np.minimum(rng.zipf(1.3, (count, 12)), vocabulary) - 1
+    popularity = rng.integers(0, 100, count)
+    for i in range(count):
+        yield {
+            "id": f"bench-{i}",
+            "name": " ".join(words[names[i]]),
+            "description": " ".join(words[descriptions[i]]),
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "city_id": f"city-{i % 2000}",
+            "popularity": int(popularity[i]),
+        }
+
+def report(name, samples):
+    ms = np.array(samples) * 1000
+    print(f"{name:32s} p50={np.percentile(ms, 50):.2f}ms p95={np.percentile(ms, 95):.2f}ms p99={np.percentile(ms, 99):.2f}ms")
+
+@cli.command()
+def main(
+    activities: int = typer.Option(1_000_000, help="Synthetic catalog size"),
+    vocabulary: int = typer.Option(50_000),
+    queries: int = typer.Option(500),
+    seed: int = typer.Option(7),
+):
+    start = time.perf_counter()
+    index = SearchIndex.build(synthetic_activities(activities, vocabulary, seed), ACTIVITY_SEARCH_FIELDS, ["city_id", "category"])
+    print(f"Built index over {len(index)} activities in {time.perf_counter() - start:.1f}s")
+    
+    rng = np.random.default_rng(seed + 1)
+    words = [f"w{i}" for i in range(vocabulary)]
+    query_terms = [np.minimum(rng.zipf(1.3, rng.integers(1, 4)), vocabulary) - 1 for _ in range(queries)]
+    texts = [" ".join(words[t] for t in terms) for terms in query_terms]
+    
+    scenarios = {
+        "first page": lambda q: index.search(q, None, 0, 20),
+        "third page": lambda q: index.search(q, None, 40, 20),
+        "first page, category filter": lambda q: index.search(q, {"category": "Culture"}, 0, 20),
+    }
+    for name, run in scenarios.items():
+        samples = []
+        for text in texts:
+            began = time.perf_counter()
+            run(text)
+            samples.append(time.perf_counter() - began)
+        report(name, samples)
+
+if __name__ == "__main__":
+    cli()
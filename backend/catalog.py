@@ -0,0 +1,43 @@
+import re
+from typing import Optional, Tuple
+
+DEFAULT_DURATION_MINUTES = 120
+
+_DURATION_PART_RE = re.compile(
+    r"(\d+(?:\.\d+)?)(?:\s*(?:-|–|to)\s*(\d+(?:\.\d+)?))?\s*(hours?|hrs?|h|minutes?|mins?|m)\b",
+    re.IGNORECASE,
+)
+_DURATION_PHRASES = {
+    "half day": (240, 240),
+    "half-day": (240, 240),
+    "full day": (480, 480),
+    "full-day": (480, 480),
+}
+
+
+def parse_duration(text: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Parse free-text durations such as "2-3 hours" or "1 hour 30 min" into (min, max) minutes."""
+    if not text:
+        return None
+    lowered = text.strip().lower()
+    if lowered in _DURATION_PHRASES:
+        return _DURATION_PHRASES[lowered]
+
+    low = high = 0.0
+    found = False
+    for match in _DURATION_PART_RE.finditer(lowered):
+        first, second, unit = match.groups()
+        scale = 60 if unit.startswith("h") else 1
+        low += float(first) * scale
+        high += float(second or first) * scale
+        found = True
+    if not found:
+        return None
+    return round(low), round(max(low, high))
+
+
+def normalize_activity(activity: dict) -> dict:
+    """Add the numeric fields derived from an activity's free-text duration."""
+    parsed = parse_duration(activity.get("duration"))
+    activity["duration_min"], activity["duration_max"] = parsed if parsed else (None, None)
+    return activity
@@ -0,0 +1,94 @@
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+# cost_index is relative to a reference city at 100
+REFERENCE_COST_INDEX = 100.0
+ACTIVITY_QUANTILES = (0.25, 0.5, 0.75)
+
+
+class TravelStyle(NamedTuple):
+    # Lodging, food and local transport per day in a reference city, in the base currency
+    daily_living: float
+    activities_per_day: float
+    # Index into ACTIVITY_QUANTILES: which part of a city's activity prices this style pays
+    price_quantile: int
+
+
+TRAVEL_STYLES: Dict[str, TravelStyle] = {
+    "budget": TravelStyle(daily_living=70.0, activities_per_day=1.0, price_quantile=0),
+    "moderate": TravelStyle(daily_living=160.0, activities_per_day=2.0, price_quantile=1),
+    "luxury": TravelStyle(daily_living=420.0, activities_per_day=3.0, price_quantile=2),
+}
+
+
+class CityCostStats:
+    """Per-city cost inputs precomputed from the catalog, one row per city.
+
+    activity_prices[i] holds the ACTIVITY_QUANTILES of city i's activity prices.
+    Cities without activities fall back to the catalog-wide price quantiles at the
+    reference cost_index, scaled by their own cost_index, so every city gets an
+    estimate. Estimates for any set of cities are then a handful of array gathers.
+    """
+
+    def __init__(self, ids: List[str], names: List[str], countries: List[str], cost_index: np.ndarray, activity_prices: np.ndarray, activity_counts: np.ndarray):
+        self.ids = ids
+        self.names = names
+        self.countries = countries
+        self.position = {city_id: i for i, city_id in enumerate(ids)}
+        self.cost_index = cost_index
+        self.activity_prices = activity_prices
+        self.activity_counts = activity_counts
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, cities: Sequence[dict], activity_city_ids: Sequence[str], activity_costs: np.ndarray) -> "CityCostStats":
+        """Build from city docs and the city and base-currency price of every activity."""
+        ids = [city["id"] for city in cities]
+        position = {city_id: i for i, city_id in enumerate(ids)}
+        cost_index = np.array([city.get("cost_index") or 0 for city in cities], dtype=np.float64)
+        cost_index[cost_index <= 0] = REFERENCE_COST_INDEX
+
+        owners = np.fromiter((position.get(city_id, -1) for city_id in activity_city_ids), dtype=np.intp, count=len(activity_city_ids))
+        costs = np.asarray(activity_costs, dtype=np.float64)
+        known = owners >= 0
+        owners, costs = owners[known], costs[known]
+
+        # Sorted by city, then price, so each city's prices are one contiguous ascending run
+        order = np.lexsort((costs, owners))
+        owners, costs = owners[order], costs[order]
+        counts = np.bincount(owners, minlength=len(ids))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.intp)
+
+        # Linear interpolation between order statistics, as np.quantile does, for every city at once
+        quantiles = np.array(ACTIVITY_QUANTILES)
+        rank = np.maximum(counts - 1, 0)[:, None] * quantiles[None, :]
+        below = np.floor(rank).astype(np.intp)
+        above = np.minimum(below + 1, np.maximum(counts - 1, 0)[:, None])
+        last = max(len(costs) - 1, 0)
+        low = costs[np.minimum(starts[:, None] + below, last)] if len(costs) else np.zeros(rank.shape)
+        high = costs[np.minimum(starts[:, None] + above, last)] if len(costs) else np.zeros(rank.shape)
+        prices = low + (high - low) * (rank - below)
+
+        empty = counts == 0
+        if len(costs):
+            reference = np.quantile(costs * REFERENCE_COST_INDEX / cost_index[owners], quantiles)
+        else:
+            reference = np.zeros(len(quantiles))
+        prices[empty] = reference[None, :] * (cost_index[empty] / REFERENCE_COST_INDEX)[:, None]
+
+        return cls(ids, [city.get("name") for city in cities], [city.get("country") for city in cities], cost_index, prices, counts)
+
+    def positions(self, city_ids: Sequence[str]) -> Tuple[np.ndarray, List[str]]:
+        positions = np.fromiter((self.position.get(city_id, -1) for city_id in city_ids), dtype=np.intp, count=len(city_ids))
+        missing = [city_id for city_id, pos in zip(city_ids, positions.tolist()) if pos < 0]
+        return positions, missing
+
+    def estimate(self, positions: np.ndarray, days: int, style: TravelStyle) -> Dict[str, np.ndarray]:
+        """Daily living, daily activity and total trip cost per city, in the base currency."""
+        living = style.daily_living * self.cost_index[positions] / REFERENCE_COST_INDEX
+        activities = style.activities_per_day * self.activity_prices[positions, style.price_quantile]
+        daily = living + activities
+        return {"daily_living": living, "daily_activities": activities, "daily_total": daily, "total": daily * days}
@@ -0,0 +1,65 @@
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+# Amounts stored without a currency predate multi-currency support and are in the base currency
+BASE_CURRENCY = "USD"
+DEFAULT_RATES_PATH = Path(__file__).parent / "currency_rates.json"
+
+
+class RateTable:
+    """One version of the exchange rates, held as a NumPy vector for bulk conversion.
+
+    rates[i] is the number of units of codes[i] one unit of the base currency buys,
+    so converting from a to b multiplies by rates[b] / rates[a].
+    """
+
+    def __init__(self, version: str, base: str, rates: Dict[str, float]):
+        if rates.get(base) != 1.0:
+            raise ValueError(f"Rate table must quote {base} at 1.0")
+        self.version = version
+        self.base = base
+        self.codes = sorted(rates)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self.rates = np.array([rates[code] for code in self.codes], dtype=np.float64)
+        self._positions = {**self.index, None: self.index[base]}
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.index
+
+    def convertible(self, currencies: Iterable[Optional[str]]) -> np.ndarray:
+        """Which of currencies this table can convert; None stands for the base currency."""
+        return np.fromiter(map(self._positions.__contains__, currencies), dtype=bool)
+
+    def factors(self, currencies: Iterable[Optional[str]], target: str) -> np.ndarray:
+        # A C-level map over one dict lookup per row; the arithmetic is then a single gather and divide
+        positions = np.fromiter(map(self._positions.__getitem__, currencies), dtype=np.intp)
+        return self.rates[self.index[target]] / self.rates[positions]
+
+    def convert(self, amounts, currencies: Iterable[Optional[str]], target: str) -> np.ndarray:
+        """Convert amounts, each in its own currency, to target in one vectorized pass."""
+        values = np.asarray(amounts, dtype=np.float64)
+        return np.round(values * self.factors(currencies, target), 2)
+
+    def convert_one(self, amount: float, currency: Optional[str], target: str) -> float:
+        return round(float(amount) * self.rates[self.index[target]] / self.rates[self._positions[currency]], 2)
+
+    def to_base(self, amount: float, currency: Optional[str]) -> float:
+        return self.convert_one(amount, currency, self.base)
+
+
+@lru_cache(maxsize=4)
+def _load(path: str, modified_ns: int) -> RateTable:
+    with open(path) as source:
+        data = json.load(source)
+    return RateTable(str(data["version"]), data.get("base", BASE_CURRENCY), {code.upper(): float(rate) for code, rate in data["rates"].items()})
+
+
+def rate_table() -> RateTable:
+    """The current rate table, reloaded only when its file changes on disk."""
+    path = os.environ.get("CURRENCY_RATES_PATH", str(DEFAULT_RATES_PATH))
+    return _load(path, os.stat(path).st_mtime_ns)
@@ -0,0 +1,167 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator, Tuple
+
+import catalog
+import currencies
+import schedule
+
+# Yield to the socket in chunks of roughly this many characters
+CHUNK_SIZE = 64 * 1024
+ICS_LINE_OCTETS = 75
+
+CSV_COLUMNS = [
+    "type", "trip_id", "trip_name", "stop_id", "city", "country",
+    "start_date", "end_date", "time", "name", "category", "amount", "currency", "notes",
+]
+
+Record = Tuple[str, dict]
+
+
+def day_string(value) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    return value or ""
+
+
+def _jsonable(value):
+    if isinstance(value, datetime):
+        return day_string(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+async def _chunked(lines: AsyncIterator[str]) -> AsyncIterator[str]:
+    buffer = []
+    size = 0
+    async for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+async def ndjson_chunks(records: AsyncIterator[Record]) -> AsyncIterator[str]:
+    async def lines():
+        async for kind, doc in records:
+            yield json.dumps({"type": kind, **doc}, default=_jsonable) + "\n"
+    async for chunk in _chunked(lines()):
+        yield chunk
+
+
+async def csv_chunks(records: AsyncIterator[Record]) -> AsyncIterator[str]:
+    async def lines():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        trip = {}
+        async for kind, doc in records:
+            if kind == "trip":
+                trip = doc
+                row = [kind, doc["id"], doc["name"], "", "", "", day_string(doc.get("start_date")), day_string(doc.get("end_date")), "", doc["name"], "", "", "", doc.get("description") or ""]
+            elif kind == "stop":
+                row = [kind, trip.get("id"), trip.get("name"), doc["id"], doc.get("city_name") or "", doc.get("city_country") or "", day_string(doc.get("start_date")), day_string(doc.get("end_date")), "", doc.get("city_name") or "", "", "", "", ""]
+            elif kind == "activity":
+                row = [kind, trip.get("id"), trip.get("name"), doc["stop_id"], doc.get("city_name") or "", doc.get("city_country") or "", day_string(doc.get("date")), "", doc.get("time") or "", doc.get("activity_name") or "", doc.get("category") or "", doc.get("cost"), doc.get("currency") or currencies.BASE_CURRENCY, doc.get("notes") or ""]
+            else:
+                row = [kind, trip.get("id"), trip.get("name"), "", "", "", "", "", "", doc.get("description") or "", doc.get("category") or "", doc.get("amount"), doc.get("currency") or currencies.BASE_CURRENCY, ""]
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    async for chunk in _chunked(lines()):
+        yield chunk
+
+
+def _ics_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _ics_line(line: str) -> str:
+    # RFC 5545 folds content lines longer than 75 octets with CRLF plus a space
+    encoded = line.encode("utf-8")
+    if len(encoded) <= ICS_LINE_OCTETS:
+        return line + "\r\n"
+    parts = []
+    start = 0
+    limit = ICS_LINE_OCTETS
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Never split inside a multi-byte character
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode("utf-8"))
+        start = end
+        limit = ICS_LINE_OCTETS - 1
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _ics_event(uid: str, stamp: str, summary: str, start: str, end_or_duration: str, description: str = "", location: str = "") -> str:
+    lines = ["BEGIN:VEVENT", f"UID:{uid}", f"DTSTAMP:{stamp}", f"SUMMARY:{_ics_escape(summary)}", start, end_or_duration]
+    if location:
+        lines.append(f"LOCATION:{_ics_escape(location)}")
+    if description:
+        lines.append(f"DESCRIPTION:{_ics_escape(description)}")
+    lines.append("END:VEVENT")
+    return "".join(_ics_line(line) for line in lines)
+
+
+def _ics_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else date.fromisoformat(value[:10])
+
+
+async def ics_chunks(records: AsyncIterator[Record]) -> AsyncIterator[str]:
+    """One all-day event per stop and one event per trip activity.
+
+    Timed activities use floating local time, since stops carry no time zone.
+    """
+    async def lines():
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        yield "".join(_ics_line(line) for line in ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//GlobalTrotters//Itinerary Export//EN", "CALSCALE:GREGORIAN"])
+        trip = {}
+        async for kind, doc in records:
+            try:
+                if kind == "trip":
+                    trip = doc
+                elif kind == "stop":
+                    start, end = _ics_date(doc["start_date"]), _ics_date(doc["end_date"])
+                    yield _ics_event(
+                        f"stop-{doc['id']}@globaltrotters", stamp,
+                        f"{trip.get('name', '')}: {doc.get('city_name') or 'Stop'}",
+                        f"DTSTART;VALUE=DATE:{start:%Y%m%d}",
+                        # DTEND is exclusive for all-day events
+                        f"DTEND;VALUE=DATE:{end + timedelta(days=1):%Y%m%d}",
+                        location=", ".join(filter(None, [doc.get("city_name"), doc.get("city_country")]))
+                    )
+                elif kind == "activity":
+                    day = _ics_date(doc["date"])
+                    minute = schedule.parse_clock(doc.get("time"))
+                    if minute is None:
+                        start, end = f"DTSTART;VALUE=DATE:{day:%Y%m%d}", f"DTEND;VALUE=DATE:{day + timedelta(days=1):%Y%m%d}"
+                    else:
+                        start = f"DTSTART:{day:%Y%m%d}T{minute // 60:02d}{minute % 60:02d}00"
+                        end = f"DURATION:PT{doc.get('duration_minutes') or catalog.DEFAULT_DURATION_MINUTES}M"
+                    yield _ics_event(
+                        f"activity-{doc['id']}@globaltrotters", stamp,
+                        doc.get("activity_name") or "Activity", start, end,
+                        description=doc.get("notes") or "",
+                        location=", ".join(filter(None, [doc.get("city_name"), doc.get("city_country")]))
+                    )
+            except (KeyError, TypeError, ValueError):
+                # A record with unusable dates is left out rather than breaking the whole calendar
+                continue
+        yield _ics_line("END:VCALENDAR")
+    async for chunk in _chunked(lines()):
+        yield chunk
+
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv", csv_chunks),
+    "ics": ("text/calendar; charset=utf-8", "ics", ics_chunks),
+    "ndjson": ("application/x-ndjson", "ndjson", ndjson_chunks),
+}
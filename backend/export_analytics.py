@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+
+import analytics
+from feeds import WATERMARK_LAG
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+CHUNK_ROWS = 50_000
+CURSOR_BATCH = 5_000
+WATERMARK_FILE = "_watermark.json"
+TRACKED_COLLECTIONS = ["trips", "stops", "trip_activities", "trip_costs"]
+
+cli = typer.Typer(add_completion=False)
+
+
+def read_watermark(out: Path) -> dict:
+    path = out / WATERMARK_FILE
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def write_watermark(out: Path, state: dict):
+    path = out / WATERMARK_FILE
+    partial = path.with_name(f".{path.name}.partial")
+    partial.write_text(json.dumps(state, indent=2))
+    partial.replace(path)
+
+
+async def export_collection(db, name: str, window: dict, out: Path, file_format: str, run_id: str, chunk_rows: int) -> int:
+    query = {"updated_at": window}
+    if name == "tombstones":
+        query["collection"] = {"$in": TRACKED_COLLECTIONS}
+    projection = {"_id": 0, **{field: 1 for field in analytics.SCHEMAS[name].names}}
+    cursor = db[name].find(query, projection).sort("updated_at", ASCENDING).batch_size(CURSOR_BATCH)
+
+    rows = 0
+    chunk = []
+    async for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) >= chunk_rows:
+            rows += await asyncio.to_thread(analytics.write_partitioned, name, chunk, out, file_format, f"{run_id}-{rows // chunk_rows:05d}")
+            chunk = []
+    if chunk:
+        rows += await asyncio.to_thread(analytics.write_partitioned, name, chunk, out, file_format, f"{run_id}-{rows // chunk_rows:05d}")
+    return rows
+
+
+async def run(out: Path, file_format: str, full: bool, chunk_rows: int, rollups: bool):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        state = read_watermark(out)
+        if state.get("format", file_format) != file_format:
+            raise typer.BadParameter(f"{out} holds a {state['format']} export; pass --full to rebuild it as {file_format}", param_hint="--format")
+        if full:
+            for name in analytics.SCHEMAS:
+                shutil.rmtree(out / name, ignore_errors=True)
+            state = {}
+        out.mkdir(parents=True, exist_ok=True)
+
+        now = datetime.now(timezone.utc)
+        run_id = now.strftime("%Y%m%dT%H%M%SZ")
+        high = (now - WATERMARK_LAG).isoformat()
+        low = state.get("position")
+        window = {"$gt": low, "$lte": high} if low else {"$lte": high}
+        print(f"Exporting changes {'since ' + low if low else 'from the beginning'} up to {high}")
+
+        for name in analytics.SCHEMAS:
+            rows = await export_collection(db, name, window, out, file_format, run_id, chunk_rows)
+            print(f"{name}: {rows} rows")
+
+        # The catalog is small and not stamped with updated_at; snapshot it whole
+        for name, schema in analytics.CATALOG_SCHEMAS.items():
+            docs = await db[name].find({}, {"_id": 0, **{field: 1 for field in schema.names}}).to_list(None)
+            await asyncio.to_thread(analytics.write_snapshot, name, docs, out, file_format)
+            print(f"catalog {name}: {len(docs)} rows")
+
+        # Only advanced once every collection is written; a failed run repeats its window,
+        # and the duplicate rows it left behind collapse when the dataset is read
+        write_watermark(out, {"position": high, "format": file_format, "last_run": run_id})
+
+        if rollups:
+            frames = await asyncio.to_thread(analytics.load_current, out, file_format)
+            for name, frame in (await asyncio.to_thread(analytics.build_rollups, frames)).items():
+                path = out / "rollups" / f"{name}{analytics.FORMATS[file_format][0]}"
+                await asyncio.to_thread(analytics.write_frame, frame, path, file_format)
+                print(f"rollup {name}: {len(frame)} rows")
+    finally:
+        client.close()
+
+
+@cli.command()
+def main(
+    out: Path = typer.Argument(..., help="Dataset directory; created on the first run and appended to after that"),
+    file_format: str = typer.Option("parquet", "--format", help="parquet or arrow (Feather v2)"),
+    full: bool = typer.Option(False, "--full", help="Drop the exported rows and watermark and export everything again"),
+    chunk_rows: int = typer.Option(CHUNK_ROWS, help="Rows per written file"),
+    rollups: bool = typer.Option(True, "--rollups/--no-rollups", help="Rebuild the rollup tables after exporting")
+):
+    """Export trips, stops, activities and costs changed since the last run as columnar files.
+
+    Rows land under <out>/<collection>/updated_month=YYYY-MM/ and every change appends a
+    new copy of the row; deletes arrive as rows in <out>/tombstones/. Read the current
+    state with analytics.load_current. Tombstones expire after 90 days, so run at least
+    that often or deletes older than that are missed until the next --full export.
+    """
+    if file_format not in analytics.FORMATS:
+        raise typer.BadParameter("Expected parquet or arrow", param_hint="--format")
+    asyncio.run(run(out, file_format, full, chunk_rows, rollups))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,182 @@
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+# A visit weighs 2^((stop start - epoch) / half-life). Because the epoch is fixed, decaying
+# every city to "now" multiplies all of them by the same factor, so stored weights never
+# need rescaling and ranks only change when visits do.
+RECENCY_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+RECENCY_HALF_LIFE = timedelta(days=180)
+# Keeps 2^exponent finite for absurd dates
+MAX_WEIGHT_EXPONENT = 512
+# Writes stamped just before a refresh may still be in flight; leave them to the next window
+WATERMARK_LAG = timedelta(seconds=5)
+FEED_CITY_NAMES = 10
+WATERMARK_ID = "feeds"
+# Each refresh deletes whatever its own stamp did not rewrite, so two at once would delete
+# each other's rows; a lease on the watermark document lets one worker run at a time.
+# It outlasts any sane full rebuild, and a worker that dies mid-run just delays the next one
+REFRESH_LEASE = timedelta(minutes=15)
+
+
+async def _acquire_lease(db, owner: str, now: datetime) -> bool:
+    try:
+        await db.feed_watermarks.find_one_and_update(
+            {"_id": WATERMARK_ID, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"lease_owner": owner, "lease_until": now + REFRESH_LEASE}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The document exists and another worker's lease has not run out
+        return False
+    return True
+
+
+async def _release_lease(db, owner: str):
+    await db.feed_watermarks.update_one({"_id": WATERMARK_ID, "lease_owner": owner}, {"$set": {"lease_until": None}})
+
+
+def decay_factor(now: datetime) -> float:
+    return 2 ** (-((now - RECENCY_EPOCH) / RECENCY_HALF_LIFE))
+
+
+def _visit_weight() -> dict:
+    start = {"$convert": {"input": "$start_date", "to": "date", "onError": RECENCY_EPOCH, "onNull": RECENCY_EPOCH}}
+    half_life_ms = RECENCY_HALF_LIFE / timedelta(milliseconds=1)
+    exponent = {"$divide": [{"$subtract": [start, RECENCY_EPOCH]}, half_life_ms]}
+    return {"$pow": [2, {"$max": [-MAX_WEIGHT_EXPONENT, {"$min": [MAX_WEIGHT_EXPONENT, exponent]}]}]}
+
+
+def _merge(into: str) -> dict:
+    return {"$merge": {"into": into, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+
+
+async def _changed_since(db, window: dict):
+    """Cities and trips touched by stop and trip writes (and deletes) inside the window."""
+    tombstones = await db.tombstones.find(
+        {"collection": {"$in": ["stops", "trips"]}, "updated_at": window},
+        {"_id": 0, "id": 1, "collection": 1}
+    ).to_list(None)
+    deleted_stop_ids = [t["id"] for t in tombstones if t["collection"] == "stops"]
+    deleted_trip_ids = {t["id"] for t in tombstones if t["collection"] == "trips"}
+
+    # Deleted stops only leave their id behind; their visit row still knows the city and trip
+    gone = await db.city_visits.find({"_id": {"$in": deleted_stop_ids}}, {"city_id": 1, "trip_id": 1}).to_list(None)
+    await db.city_visits.delete_many({"_id": {"$in": deleted_stop_ids}})
+
+    city_ids = set(await db.stops.distinct("city_id", {"updated_at": window}))
+    city_ids |= {visit["city_id"] for visit in gone}
+    trip_ids = set(await db.stops.distinct("trip_id", {"updated_at": window}))
+    trip_ids |= set(await db.trips.distinct("id", {"updated_at": window}))
+    trip_ids |= {visit["trip_id"] for visit in gone} | deleted_trip_ids
+    return list(city_ids), list(trip_ids)
+
+
+async def refresh_feeds(db) -> Optional[dict]:
+    """Bring city_rankings and public_trip_feed up to date with writes since the last run.
+
+    The first run (no watermark) rebuilds everything. Later runs only read stops, trips
+    and tombstones stamped after the watermark and recompute the cities and trips they
+    touch, writing results with $merge. Every worker may call this; only the one holding
+    the refresh lease does the work, the others get None back.
+    """
+    now = datetime.now(timezone.utc)
+    owner = secrets.token_urlsafe(8)
+    if not await _acquire_lease(db, owner, now):
+        return None
+    try:
+        return await _refresh(db, now)
+    finally:
+        await _release_lease(db, owner)
+
+
+async def _refresh(db, now: datetime) -> dict:
+    stamp = now.isoformat()
+    high = (now - WATERMARK_LAG).isoformat()
+    state = await db.feed_watermarks.find_one({"_id": WATERMARK_ID})
+    low = state.get("position") if state else None
+    window = {"$lte": high} if low is None else {"$gt": low, "$lte": high}
+
+    # One visit row per stop, replaced whenever the stop is written
+    await db.stops.aggregate([
+        {"$match": {"updated_at": window}},
+        {"$project": {"_id": "$id", "trip_id": 1, "city_id": 1, "weight": _visit_weight(), "refreshed_at": {"$literal": stamp}}},
+        _merge("city_visits")
+    ]).to_list(None)
+
+    if low is None:
+        await db.city_visits.delete_many({"refreshed_at": {"$ne": stamp}})
+        await _refresh_city_rankings(db, {}, stamp)
+        await _refresh_public_trip_feed(db, {}, stamp)
+    else:
+        city_ids, trip_ids = await _changed_since(db, window)
+        if city_ids:
+            await _refresh_city_rankings(db, {"city_id": {"$in": city_ids}}, stamp)
+        if trip_ids:
+            await _refresh_public_trip_feed(db, {"id": {"$in": trip_ids}}, stamp)
+
+    await db.feed_watermarks.update_one({"_id": WATERMARK_ID}, {"$max": {"position": high}}, upsert=True)
+    return {"from": low, "to": high}
+
+
+async def _refresh_city_rankings(db, city_match: dict, stamp: str):
+    # A trip that stops in a city twice counts once, at its most recent visit
+    await db.city_visits.aggregate([
+        {"$match": city_match},
+        {"$group": {"_id": {"city_id": "$city_id", "trip_id": "$trip_id"}, "weight": {"$max": "$weight"}}},
+        {"$group": {"_id": "$_id.city_id", "trip_count": {"$sum": 1}, "weight": {"$sum": "$weight"}}},
+        {"$lookup": {"from": "cities", "localField": "_id", "foreignField": "id", "as": "city"}},
+        {"$unwind": "$city"},
+        {"$project": {
+            "_id": 1,
+            "name": "$city.name",
+            "country": "$city.country",
+            "region": "$city.region",
+            "image_url": "$city.image_url",
+            "trip_count": 1,
+            "weight": 1,
+            "refreshed_at": {"$literal": stamp}
+        }},
+        _merge("city_rankings")
+    ]).to_list(None)
+    # Cities in scope that the pipeline did not rewrite have lost their last visit
+    await db.city_rankings.delete_many({**({"_id": city_match["city_id"]} if city_match else {}), "refreshed_at": {"$ne": stamp}})
+
+
+async def _refresh_public_trip_feed(db, trip_match: dict, stamp: str):
+    await db.trips.aggregate([
+        {"$match": {**trip_match, "is_public": True}},
+        {"$lookup": {
+            "from": "stops",
+            "localField": "id",
+            "foreignField": "trip_id",
+            "pipeline": [{"$sort": {"order": 1}}, {"$project": {"_id": 0, "city_id": 1}}],
+            "as": "stops"
+        }},
+        {"$lookup": {
+            "from": "cities",
+            "localField": "stops.city_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "name": 1}}],
+            "as": "cities"
+        }},
+        {"$project": {
+            "_id": "$id",
+            "name": 1,
+            "description": 1,
+            "cover_photo": 1,
+            "share_token": 1,
+            "start_date": 1,
+            "end_date": 1,
+            "stop_count": {"$size": "$stops"},
+            "city_names": {"$slice": ["$cities.name", FEED_CITY_NAMES]},
+            # Trips published before the stamp existed fall back to their last update
+            "published_at": {"$ifNull": ["$published_at", "$updated_at"]},
+            "refreshed_at": {"$literal": stamp}
+        }},
+        _merge("public_trip_feed")
+    ]).to_list(None)
+    # Trips in scope that the pipeline did not rewrite have gone private or been deleted
+    await db.public_trip_feed.delete_many({**({"_id": trip_match["id"]} if trip_match else {}), "refreshed_at": {"$ne": stamp}})
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import secrets
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import importer
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+cli = typer.Typer(add_completion=False)
+
+def print_progress(job: dict):
+    counts = ", ".join(f"{name} {value}" for name, value in sorted(job.get("counts", {}).items()))
+    print(f"rows {job['rows_done']}: {counts}; {job.get('error_count', 0)} errors")
+
+async def run(path: Path, email: Optional[str], resume: Optional[str]):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if resume:
+            job = await db.imports.find_one({"id": resume}, {"_id": 0, "errors": 0})
+            if not job:
+                raise typer.BadParameter(f"No import {resume}", param_hint="--resume")
+            if job["status"] == "completed":
+                print(f"Import {resume} already completed")
+                return
+            print(f"Resuming import {resume} after row {job['rows_done']}")
+        else:
+            file_format = importer.detect_format(path.name)
+            if not file_format:
+                raise typer.BadParameter("Expected a .csv, .ndjson or .jsonl file", param_hint="path")
+            user = await db.users.find_one({"email": email}, {"_id": 0, "id": 1}) if email else None
+            if not user:
+                raise typer.BadParameter(f"No user with email {email!r}", param_hint="--email")
+            now = datetime.now(timezone.utc).isoformat()
+            job = {
+                "id": secrets.token_urlsafe(16),
+                "user_id": user["id"],
+                "filename": path.name,
+                "format": file_format,
+                "status": "queued",
+                "rows_done": 0,
+                "counts": {},
+                "error_count": 0,
+                "errors": [],
+                "error": None,
+                "created_at": now,
+                "updated_at": now
+            }
+            await db.imports.insert_one(dict(job))
+            print(f"Started import {job['id']}; rerun with --resume {job['id']} if it stops")
+
+        try:
+            job = await importer.run_import(db, job, str(path), print_progress)
+        except Exception as exc:
+            await db.imports.update_one({"id": job["id"]}, {"$set": {"status": "failed", "error": str(exc), "updated_at": datetime.now(timezone.utc).isoformat()}})
+            raise
+        print(f"Import {job['id']} completed with {job['error_count']} row errors")
+        for row_error in job["errors"][:20]:
+            print(f"  row {row_error['row']}: {row_error['error']}")
+    finally:
+        client.close()
+
+@cli.command()
+def main(
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, help="CSV or NDJSON file in the export format"),
+    email: Optional[str] = typer.Option(None, help="Owner of the imported trips"),
+    resume: Optional[str] = typer.Option(None, help="Continue a failed import by id, from its last checkpoint"),
+):
+    asyncio.run(run(path, email, resume))
+
+if __name__ == "__main__":
+    cli()
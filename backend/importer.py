@@ -0,0 +1,383 @@
+import asyncio
+import base64
+import csv
+import hashlib
+import json
+import os
+import secrets
+from datetime import date, datetime, timezone
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+import catalog
+import currencies
+import schedule
+import stop_order
+import summaries
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+ROW_TYPES = ("trip", "stop", "activity", "cost")
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(filename: Optional[str]) -> Optional[str]:
+    return FORMATS.get(os.path.splitext(filename or "")[1].lower())
+
+
+def stable_id(user_id: str, kind: str, ref: str) -> str:
+    # Re-running or resuming an import upserts the same documents instead of duplicating them
+    digest = hashlib.sha256(f"{user_id}:{kind}:{ref}".encode("utf-8")).digest()
+    return base64.urlsafe_b64encode(digest[:16]).decode("ascii").rstrip("=")
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _csv_row(row: dict) -> dict:
+    # Same columns as the CSV export, so exported files import unchanged
+    get = lambda key: _text(row.get(key))
+    kind = (get("type") or "").lower()
+    if kind == "trip":
+        return {"type": kind, "ref": get("trip_id"), "name": get("trip_name") or get("name"), "description": get("notes"), "start_date": get("start_date"), "end_date": get("end_date")}
+    if kind == "stop":
+        return {"type": kind, "ref": get("stop_id"), "trip_ref": get("trip_id"), "city": get("city"), "country": get("country"), "start_date": get("start_date"), "end_date": get("end_date")}
+    if kind == "activity":
+        return {"type": kind, "trip_ref": get("trip_id"), "stop_ref": get("stop_id"), "name": get("name"), "date": get("start_date"), "time": get("time"), "amount": get("amount"), "currency": get("currency"), "notes": get("notes")}
+    if kind == "cost":
+        return {"type": kind, "trip_ref": get("trip_id"), "category": get("category"), "amount": get("amount"), "currency": get("currency"), "description": get("name")}
+    return {"type": kind}
+
+
+def _ndjson_row(doc: dict) -> dict:
+    # Same records as the NDJSON export
+    kind = _text(doc.get("type")) or ""
+    if kind == "trip":
+        return {"type": kind, "ref": _text(doc.get("id")), "name": _text(doc.get("name")), "description": _text(doc.get("description")), "start_date": _text(doc.get("start_date")), "end_date": _text(doc.get("end_date"))}
+    if kind == "stop":
+        return {"type": kind, "ref": _text(doc.get("id")), "trip_ref": _text(doc.get("trip_id")), "city": _text(doc.get("city_name")), "country": _text(doc.get("city_country")), "start_date": _text(doc.get("start_date")), "end_date": _text(doc.get("end_date")), "order": doc.get("order")}
+    if kind == "activity":
+        return {"type": kind, "ref": _text(doc.get("id")), "trip_ref": _text(doc.get("trip_id")), "stop_ref": _text(doc.get("stop_id")), "name": _text(doc.get("activity_name")), "date": _text(doc.get("date")), "time": _text(doc.get("time")), "amount": doc.get("cost"), "currency": _text(doc.get("currency")), "notes": _text(doc.get("notes")), "duration_minutes": doc.get("duration_minutes")}
+    if kind == "cost":
+        return {"type": kind, "ref": _text(doc.get("id")), "trip_ref": _text(doc.get("trip_id")), "category": _text(doc.get("category")), "amount": doc.get("amount"), "currency": _text(doc.get("currency")), "description": _text(doc.get("description"))}
+    return {"type": kind}
+
+
+def read_rows(stream, file_format: str) -> Iterator[dict]:
+    if file_format == "csv":
+        for row in csv.DictReader(stream):
+            yield _csv_row(row)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            doc = json.loads(line)
+        except ValueError as exc:
+            yield {"type": "", "error": f"Invalid JSON: {exc}"}
+            continue
+        yield _ndjson_row(doc) if isinstance(doc, dict) else {"type": "", "error": "Each line must be a JSON object"}
+
+
+def _day(value: Optional[str], field: str) -> date:
+    if not value:
+        raise RowError(f"{field} is required")
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        raise RowError(f"{field} must be YYYY-MM-DD")
+
+
+def _bson_date(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def _amount(value, field: str) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{field} must be a number")
+
+
+def _currency(value: Optional[str], rates: currencies.RateTable) -> str:
+    code = (value or currencies.BASE_CURRENCY).upper()
+    if code not in rates:
+        raise RowError(f"Unsupported currency {value!r}")
+    return code
+
+
+def _stored_day(value) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    try:
+        return date.fromisoformat(value[:10])
+    except (TypeError, ValueError):
+        return None
+
+
+class ItineraryImporter:
+    """Validates and writes import rows one batch at a time.
+
+    Names are resolved in bulk: the city catalog is loaded once, activities are
+    looked up with one query per batch, and trips or stops defined before a resume
+    point are fetched from the database in one query per batch. Documents get ids
+    derived from the file's own references, so every write is an idempotent upsert
+    and a batch can safely be replayed.
+    """
+
+    def __init__(self, db, user_id: str):
+        self.db = db
+        self.user_id = user_id
+        self.cities: Optional[Dict[Tuple[str, str], str]] = None
+        self.cities_by_name: Dict[str, List[str]] = {}
+        self.activities: Dict[Tuple[str, str], dict] = {}
+        self.trips: Dict[str, Tuple[date, date]] = {}
+        self.stops: Dict[str, Tuple[str, date, date]] = {}
+        self.last_order: Dict[str, float] = {}
+        self.rates = currencies.rate_table()
+
+    async def _load_cities(self):
+        self.cities = {}
+        async for city in self.db.cities.find({}, {"_id": 0, "id": 1, "name": 1, "country": 1}):
+            name = city["name"].lower()
+            self.cities[(name, (city.get("country") or "").lower())] = city["id"]
+            self.cities_by_name.setdefault(name, []).append(city["id"])
+
+    def _city_id(self, name: Optional[str], country: Optional[str]) -> str:
+        if not name:
+            raise RowError("city is required")
+        if country:
+            city_id = self.cities.get((name.lower(), country.lower()))
+        else:
+            matches = self.cities_by_name.get(name.lower(), [])
+            if len(matches) > 1:
+                raise RowError(f"City {name!r} is ambiguous; add its country")
+            city_id = matches[0] if matches else None
+        if not city_id:
+            raise RowError(f"Unknown city {name!r}")
+        return city_id
+
+    async def _prefetch(self, rows: List[Tuple[int, dict]]):
+        if self.cities is None:
+            await self._load_cities()
+
+        # Parents written before a resume point are not in memory yet
+        trip_ids = {stable_id(self.user_id, "trip", row["trip_ref"]) for _, row in rows if row.get("trip_ref")} - self.trips.keys()
+        if trip_ids:
+            async for trip in self.db.trips.find({"id": {"$in": list(trip_ids)}, "user_id": self.user_id}, {"_id": 0, "id": 1, "start_date": 1, "end_date": 1}):
+                self.trips[trip["id"]] = (_stored_day(trip["start_date"]), _stored_day(trip["end_date"]))
+        stop_ids = {stable_id(self.user_id, "stop", row["stop_ref"]) for _, row in rows if row.get("stop_ref")} - self.stops.keys()
+        if stop_ids:
+            async for stop in self.db.stops.find({"id": {"$in": list(stop_ids)}, "user_id": self.user_id}, {"_id": 0, "id": 1, "trip_id": 1, "city_id": 1, "start_date": 1, "end_date": 1, "order": 1}):
+                self.stops[stop["id"]] = (stop["city_id"], _stored_day(stop["start_date"]), _stored_day(stop["end_date"]))
+                self._saw_order(stop["trip_id"], stop.get("order") or 0)
+
+        # Activities are matched by exact name within the stop's city; stops from this batch count too
+        city_ids = set()
+        names = set()
+        for _, row in rows:
+            if row["type"] == "stop" and row.get("city"):
+                try:
+                    city_ids.add(self._city_id(row.get("city"), row.get("country")))
+                except RowError:
+                    pass
+            elif row["type"] == "activity" and row.get("name"):
+                names.add(row["name"])
+                stop = self.stops.get(stable_id(self.user_id, "stop", row.get("stop_ref") or ""))
+                if stop:
+                    city_ids.add(stop[0])
+        wanted = {(city_id, name) for city_id in city_ids for name in names} - self.activities.keys()
+        if wanted:
+            async for activity in self.db.activities.find(
+                {"city_id": {"$in": list({city_id for city_id, _ in wanted})}, "name": {"$in": list({name for _, name in wanted})}},
+                {"_id": 0, "id": 1, "city_id": 1, "name": 1, "cost": 1, "currency": 1, "duration": 1, "duration_max": 1}
+            ):
+                self.activities[(activity["city_id"], activity["name"])] = activity
+
+    def _trip(self, number: int, row: dict, now: str):
+        if not row.get("ref"):
+            raise RowError("trip id is required")
+        if not row.get("name"):
+            raise RowError("trip name is required")
+        start, end = _day(row.get("start_date"), "start_date"), _day(row.get("end_date"), "end_date")
+        if end < start:
+            raise RowError("end_date is before start_date")
+        trip_id = stable_id(self.user_id, "trip", row["ref"])
+        self.trips[trip_id] = (start, end)
+        doc = {"id": trip_id, "user_id": self.user_id, "name": row["name"], "description": row.get("description"), "start_date": _bson_date(start), "end_date": _bson_date(end), "updated_at": now}
+        on_insert = {"is_public": False, "share_token": secrets.token_urlsafe(32), "created_at": now, "cover_photo": None, "version": 1}
+        return "trips", doc, on_insert
+
+    def _saw_order(self, trip_id: str, order: float):
+        # Stops without an explicit order go one gap after the last key seen for their trip
+        self.last_order[trip_id] = max(self.last_order.get(trip_id, order), order)
+
+    def _parent_trip(self, row: dict) -> str:
+        trip_id = stable_id(self.user_id, "trip", row.get("trip_ref") or "")
+        if not row.get("trip_ref") or trip_id not in self.trips:
+            raise RowError(f"Unknown trip {row.get('trip_ref')!r}")
+        return trip_id
+
+    def _stop(self, number: int, row: dict, now: str):
+        if not row.get("ref"):
+            raise RowError("stop id is required")
+        trip_id = self._parent_trip(row)
+        city_id = self._city_id(row.get("city"), row.get("country"))
+        start, end = _day(row.get("start_date"), "start_date"), _day(row.get("end_date"), "end_date")
+        if end < start:
+            raise RowError("end_date is before start_date")
+        stop_id = stable_id(self.user_id, "stop", row["ref"])
+        order = row.get("order")
+        if isinstance(order, bool) or not isinstance(order, (int, float)):
+            order = stop_order.after(self.last_order.get(trip_id))
+        self._saw_order(trip_id, order)
+        self.stops[stop_id] = (city_id, start, end)
+        doc = {"id": stop_id, "trip_id": trip_id, "user_id": self.user_id, "city_id": city_id, "start_date": _bson_date(start), "end_date": _bson_date(end), "order": order, "updated_at": now}
+        return "stops", doc, {}
+
+    def _activity(self, number: int, row: dict, now: str):
+        trip_id = self._parent_trip(row)
+        stop_id = stable_id(self.user_id, "stop", row.get("stop_ref") or "")
+        if not row.get("stop_ref") or stop_id not in self.stops:
+            raise RowError(f"Unknown stop {row.get('stop_ref')!r}")
+        city_id, stop_start, stop_end = self.stops[stop_id]
+        activity = self.activities.get((city_id, row.get("name")))
+        if not activity:
+            raise RowError(f"Unknown activity {row.get('name')!r} for this stop's city")
+        day = _day(row.get("date"), "date")
+        if stop_start and stop_end and not stop_start <= day <= stop_end:
+            raise RowError("date is outside the stop's dates")
+        if row.get("time") and schedule.parse_clock(row["time"]) is None:
+            raise RowError("time must be HH:MM")
+        if row.get("amount") in (None, ""):
+            cost, currency = activity.get("cost", 0.0), activity.get("currency") or currencies.BASE_CURRENCY
+        else:
+            cost, currency = _amount(row["amount"], "amount"), _currency(row.get("currency"), self.rates)
+        duration = row.get("duration_minutes")
+        if not isinstance(duration, int) or duration <= 0:
+            duration = activity.get("duration_max") or (catalog.parse_duration(activity.get("duration")) or (0, catalog.DEFAULT_DURATION_MINUTES))[1]
+        ref = row.get("ref") or f"{row.get('stop_ref')}/row-{number}"
+        doc = {
+            "id": stable_id(self.user_id, "activity", ref),
+            "stop_id": stop_id,
+            "trip_id": trip_id,
+            "user_id": self.user_id,
+            "activity_id": activity["id"],
+            "date": _bson_date(day),
+            "time": row.get("time"),
+            "duration_minutes": duration,
+            "cost": cost,
+            "currency": currency,
+            "base_cost": self.rates.to_base(cost, currency),
+            "notes": row.get("notes"),
+            "updated_at": now
+        }
+        return "trip_activities", doc, {}
+
+    def _cost(self, number: int, row: dict, now: str):
+        trip_id = self._parent_trip(row)
+        if not row.get("category"):
+            raise RowError("category is required")
+        ref = row.get("ref") or f"{row.get('trip_ref')}/row-{number}"
+        amount, currency = _amount(row.get("amount"), "amount"), _currency(row.get("currency"), self.rates)
+        doc = {
+            "id": stable_id(self.user_id, "cost", ref),
+            "trip_id": trip_id,
+            "user_id": self.user_id,
+            "category": row["category"],
+            "amount": amount,
+            "currency": currency,
+            "base_amount": self.rates.to_base(amount, currency),
+            "description": row.get("description"),
+            "updated_at": now
+        }
+        return "trip_costs", doc, {}
+
+    async def process(self, rows: List[Tuple[int, dict]]) -> Tuple[Dict[str, int], List[dict]]:
+        """Validate and write one batch of (row number, row); returns written counts and row errors."""
+        await self._prefetch(rows)
+        now = datetime.now(timezone.utc).isoformat()
+        builders = {"trip": self._trip, "stop": self._stop, "activity": self._activity, "cost": self._cost}
+        writes: Dict[str, List[UpdateOne]] = {"trips": [], "stops": [], "trip_activities": [], "trip_costs": []}
+        errors = []
+        for number, row in rows:
+            try:
+                if row.get("error"):
+                    raise RowError(row["error"])
+                if row["type"] not in builders:
+                    raise RowError(f"type must be one of {', '.join(ROW_TYPES)}")
+                collection, doc, on_insert = builders[row["type"]](number, row, now)
+            except RowError as exc:
+                errors.append({"row": number, "error": str(exc)})
+                continue
+            update = {"$set": doc}
+            if on_insert:
+                update["$setOnInsert"] = on_insert
+            writes[collection].append(UpdateOne({"id": doc["id"], "user_id": self.user_id}, update, upsert=True))
+
+        # Parents first, so a crash between collections never leaves children pointing nowhere on replay
+        counts = {}
+        for collection, requests in writes.items():
+            if requests:
+                await self.db[collection].bulk_write(requests, ordered=False)
+            counts[collection] = len(requests)
+        return counts, errors
+
+
+def _next_batch(rows: Iterator[dict], size: int) -> List[dict]:
+    return list(islice(rows, size))
+
+
+async def run_import(db, job: dict, path: str, on_progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """Import the file at path for the import document job, continuing after job["rows_done"].
+
+    Progress is checkpointed to the imports collection after every batch. Parsing
+    runs in a worker thread so a large file never blocks the event loop.
+    """
+    importer = ItineraryImporter(db, job["user_id"])
+    rows_done = job.get("rows_done", 0)
+    row_number = 0
+    await db.imports.update_one({"id": job["id"]}, {"$set": {"status": "running", "error": None, "updated_at": datetime.now(timezone.utc).isoformat()}})
+    with open(path, newline="", encoding="utf-8-sig") as stream:
+        rows = read_rows(stream, job["format"])
+        while True:
+            batch = await asyncio.to_thread(_next_batch, rows, BATCH_SIZE)
+            if not batch:
+                break
+            numbered = [(row_number + offset + 1, row) for offset, row in enumerate(batch)]
+            row_number += len(batch)
+            # Rows up to the checkpoint were written by an earlier run
+            pending = [(number, row) for number, row in numbered if number > rows_done]
+            if not pending:
+                continue
+
+            counts, errors = await importer.process(pending)
+            update = {
+                "$set": {"rows_done": row_number, "updated_at": datetime.now(timezone.utc).isoformat()},
+                "$inc": {**{f"counts.{name}": value for name, value in counts.items()}, "error_count": len(errors)},
+            }
+            if errors:
+                update["$push"] = {"errors": {"$each": errors, "$slice": MAX_REPORTED_ERRORS}}
+            job = await db.imports.find_one_and_update({"id": job["id"]}, update, projection={"_id": 0, "errors": 0}, return_document=True)
+            if on_progress:
+                on_progress(job)
+
+    # Counters are cheaper to rebuild once than to keep exact through replayed upserts
+    await summaries.rebuild_summaries(db, [job["user_id"]])
+    now = datetime.now(timezone.utc).isoformat()
+    return await db.imports.find_one_and_update(
+        {"id": job["id"]},
+        {"$set": {"status": "completed", "updated_at": now, "finished_at": now}},
+        projection={"_id": 0},
+        return_document=True
+    )
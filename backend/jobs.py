@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import random
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo import ASCENDING
+
+from repositories import Repository
+
+logger = logging.getLogger(__name__)
+
+# A claimed job belongs to its worker until the lease runs out; the heartbeat renews it well before
+LEASE = timedelta(seconds=60)
+HEARTBEAT_SECONDS = 20
+POLL_SECONDS = 2.0
+DEFAULT_MAX_ATTEMPTS = 5
+BACKOFF_BASE = timedelta(seconds=5)
+BACKOFF_MAX = timedelta(minutes=30)
+ACTIVE_STATUSES = ["queued", "running"]
+
+JobHandler = Callable[[dict], Awaitable[Optional[dict]]]
+
+
+def backoff(attempt: int) -> timedelta:
+    # Exponential with full jitter, so jobs that failed together do not retry in lockstep
+    ceiling = min(BACKOFF_BASE * 2 ** max(attempt - 1, 0), BACKOFF_MAX)
+    return ceiling * random.uniform(0.5, 1.0)
+
+
+async def enqueue(jobs: Repository, job_type: str, payload: dict, user_id: Optional[str] = None, max_attempts: int = DEFAULT_MAX_ATTEMPTS, delay: Optional[timedelta] = None) -> dict:
+    now = datetime.now(timezone.utc)
+    job = {
+        "id": secrets.token_urlsafe(16),
+        "type": job_type,
+        "payload": payload,
+        "user_id": user_id,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "run_at": now + (delay or timedelta(0)),
+        "lease_until": None,
+        "worker_id": None,
+        "error": None,
+        "result": None,
+        "created_at": now.isoformat(),
+        "updated_at": now.isoformat(),
+        "finished_at": None
+    }
+    await jobs.insert(job)
+    return job
+
+
+async def run_now(jobs: Repository, job_id: str):
+    """Bring a delayed job forward to now, if no worker has claimed it yet."""
+    await jobs.update({"id": job_id, "status": "queued"}, {"run_at": datetime.now(timezone.utc)})
+
+
+class JobWorker:
+    """Runs queued jobs from the jobs collection until cancelled.
+
+    Jobs are claimed atomically, oldest run_at first, and held under a lease that a
+    heartbeat keeps renewing. A worker that dies simply stops renewing, and once the
+    lease lapses any worker may claim the job again, so work survives restarts.
+    Failures are retried with exponential backoff until max_attempts is spent.
+    Concurrency limits apply per job type within this worker.
+    """
+
+    def __init__(self, jobs: Repository, handlers: Dict[str, JobHandler], concurrency: Dict[str, int]):
+        self.jobs = jobs
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.worker_id = secrets.token_urlsafe(8)
+        self.running: Dict[str, Dict[asyncio.Task, dict]] = {job_type: {} for job_type in handlers}
+        self.wakeup = asyncio.Event()
+
+    def notify(self):
+        # Lets jobs enqueued by this process start without waiting for the next poll
+        self.wakeup.set()
+
+    async def run(self):
+        try:
+            while True:
+                self.wakeup.clear()
+                for job_type in self.handlers:
+                    while len(self.running[job_type]) < self.concurrency.get(job_type, 1):
+                        job = await self._claim(job_type)
+                        if not job:
+                            break
+                        self._start(job)
+                # Not wait_for: on Python 3.11 it drops a cancel that lands as the wakeup fires,
+                # and shutdown then waits on this loop forever
+                woken = asyncio.ensure_future(self.wakeup.wait())
+                try:
+                    await asyncio.wait([woken], timeout=POLL_SECONDS)
+                finally:
+                    woken.cancel()
+        finally:
+            await self._release_all()
+
+    async def _claim(self, job_type: str) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        job = await self.jobs.update(
+            {
+                "type": job_type,
+                "run_at": {"$lte": now},
+                # Running jobs whose lease lapsed were abandoned by a worker that died
+                "$or": [{"status": "queued"}, {"status": "running", "lease_until": {"$lt": now}}]
+            },
+            {"status": "running", "worker_id": self.worker_id, "lease_until": now + LEASE, "updated_at": now.isoformat()},
+            {"attempts": 1},
+            sort=[("run_at", ASCENDING)]
+        )
+        if job and job["attempts"] > job["max_attempts"]:
+            # Only reachable when the job keeps taking its worker down with it
+            await self._finish(job, {"status": "failed", "error": job.get("error") or "Worker lost the job too many times", "finished_at": now})
+            return await self._claim(job_type)
+        return job
+
+    def _start(self, job: dict):
+        task = asyncio.create_task(self._execute(job))
+        tasks = self.running[job["type"]]
+        tasks[task] = job
+
+        def done(finished: asyncio.Task):
+            tasks.pop(finished, None)
+            self.wakeup.set()
+        task.add_done_callback(done)
+
+    async def _heartbeat(self, job: dict):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            await self.jobs.update({"id": job["id"], "worker_id": self.worker_id}, {"lease_until": datetime.now(timezone.utc) + LEASE})
+
+    async def _finish(self, job: dict, changes: dict) -> Optional[dict]:
+        # Guarded by worker_id: a worker that lost its lease must not overwrite the new owner's state
+        now = datetime.now(timezone.utc)
+        return await self.jobs.update(
+            {"id": job["id"], "worker_id": self.worker_id},
+            {**changes, "lease_until": None, "updated_at": now.isoformat()}
+        )
+
+    async def _execute(self, job: dict):
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            result = await self.handlers[job["type"]](job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.exception("Job %s (%s) failed on attempt %s", job["id"], job["type"], job["attempts"])
+            if job["attempts"] < job["max_attempts"]:
+                await self._finish(job, {"status": "queued", "error": str(exc), "run_at": datetime.now(timezone.utc) + backoff(job["attempts"])})
+            else:
+                await self._finish(job, {"status": "failed", "error": str(exc), "finished_at": datetime.now(timezone.utc)})
+        else:
+            await self._finish(job, {"status": "completed", "result": result, "error": None, "finished_at": datetime.now(timezone.utc)})
+        finally:
+            heartbeat.cancel()
+
+    async def _release_all(self):
+        # On shutdown, hand running jobs straight back to the queue without spending an attempt
+        running = {task: job for tasks in self.running.values() for task, job in tasks.items()}
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        for job in running.values():
+            await self.jobs.update(
+                {"id": job["id"], "worker_id": self.worker_id, "status": "running"},
+                {"status": "queued", "lease_until": None, "worker_id": None, "run_at": datetime.now(timezone.utc)},
+                {"attempts": -1}
+            )
@@ -0,0 +1,191 @@
+import base64
+import binascii
+import io
+import re
+import secrets
+from typing import AsyncIterator, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from PIL import Image
+from starlette.concurrency import run_in_threadpool
+
+MEDIA_URL_PREFIX = "/api/media/"
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 256 * 1024
+STREAM_CHUNK_BYTES = 256 * 1024
+THUMBNAIL_SIZE = (320, 320)
+# Pillow format names of the accepted image types; the stored type comes from the bytes, not the client
+IMAGE_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+_DATA_URL_RE = re.compile(r"^data:(?P<content_type>[\w.+-]+/[\w.+-]+)?(?P<params>(;[^;,]*)*?);base64,", re.IGNORECASE)
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def media_url(media_id: str) -> str:
+    return f"{MEDIA_URL_PREFIX}{media_id}"
+
+
+def thumbnail_id(media_id: str) -> str:
+    return f"{media_id}_thumb"
+
+
+def is_data_url(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith("data:")
+
+
+def decode_data_url(value: str) -> Tuple[str, bytes]:
+    match = _DATA_URL_RE.match(value)
+    if not match:
+        raise HTTPException(status_code=400, detail="Unsupported data URL")
+    content_type = (match.group("content_type") or "application/octet-stream").lower()
+    try:
+        data = base64.b64decode(value[match.end():], validate=False)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid base64 payload")
+    return content_type, data
+
+
+def _sniff_format(source) -> Optional[str]:
+    # Image.open only parses the header, so this stays cheap for large files
+    try:
+        with Image.open(source) as image:
+            return image.format
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+async def _sniff_content_type(source) -> str:
+    content_type = IMAGE_FORMATS.get(await run_in_threadpool(_sniff_format, source))
+    if content_type is None:
+        raise HTTPException(status_code=415, detail="Unsupported media type")
+    return content_type
+
+
+def _render_thumbnail(source) -> Optional[bytes]:
+    try:
+        with Image.open(source) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            out = io.BytesIO()
+            image.save(out, format="JPEG", quality=80, optimize=True)
+            return out.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+async def _store_thumbnail(bucket: AsyncIOMotorGridFSBucket, media_id: str, source, metadata: dict) -> bool:
+    thumb = await run_in_threadpool(_render_thumbnail, source)
+    if thumb is None:
+        return False
+    await bucket.upload_from_stream_with_id(
+        thumbnail_id(media_id),
+        f"{media_id}_thumb.jpg",
+        thumb,
+        metadata={**metadata, "content_type": "image/jpeg", "variant": "thumb"},
+    )
+    return True
+
+
+async def store_upload(bucket: AsyncIOMotorGridFSBucket, upload: UploadFile, owner_id: str, kind: str) -> dict:
+    content_type = await _sniff_content_type(upload.file)
+    await upload.seek(0)
+    media_id = secrets.token_urlsafe(16)
+    metadata = {"owner_id": owner_id, "kind": kind, "content_type": content_type}
+
+    grid_in = bucket.open_upload_stream_with_id(media_id, upload.filename or media_id, metadata=metadata)
+    length = 0
+    try:
+        while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+            length += len(chunk)
+            if length > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail="File too large")
+            await grid_in.write(chunk)
+    except BaseException:
+        await grid_in.abort()
+        raise
+    await grid_in.close()
+
+    await upload.seek(0)
+    has_thumbnail = await _store_thumbnail(bucket, media_id, upload.file, metadata)
+    return {
+        "id": media_id,
+        "url": media_url(media_id),
+        "thumbnail_url": f"{media_url(media_id)}?variant=thumb" if has_thumbnail else None,
+        "content_type": content_type,
+        "length": length,
+    }
+
+
+async def store_bytes(bucket: AsyncIOMotorGridFSBucket, data: bytes, owner_id: str, kind: str) -> str:
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+    content_type = await _sniff_content_type(io.BytesIO(data))
+    media_id = secrets.token_urlsafe(16)
+    metadata = {"owner_id": owner_id, "kind": kind, "content_type": content_type}
+    await bucket.upload_from_stream_with_id(media_id, media_id, data, metadata=metadata)
+    await _store_thumbnail(bucket, media_id, io.BytesIO(data), metadata)
+    return media_url(media_id)
+
+
+async def externalize(bucket: AsyncIOMotorGridFSBucket, value: Optional[str], owner_id: str, kind: str) -> Optional[str]:
+    """Replace an inline data URL with a media store URL; other values pass through."""
+    if not is_data_url(value):
+        return value
+    _, data = decode_data_url(value)
+    return await store_bytes(bucket, data, owner_id, kind)
+
+
+async def copy(bucket: AsyncIOMotorGridFSBucket, value: Optional[str], owner_id: str, kind: str) -> Optional[str]:
+    """Store a copy of a media store upload under another owner; other values pass through.
+
+    An upload that no longer exists copies to None.
+    """
+    if not value or not value.startswith(MEDIA_URL_PREFIX):
+        return value
+    try:
+        grid_out = await bucket.open_download_stream(value[len(MEDIA_URL_PREFIX):])
+    except NoFile:
+        return None
+    return await store_bytes(bucket, await grid_out.read(), owner_id, kind)
+
+
+async def discard(bucket: AsyncIOMotorGridFSBucket, url: str):
+    """Delete a stored upload and its thumbnail when the write meant to reference it failed."""
+    media_id = url[len(MEDIA_URL_PREFIX):]
+    for file_id in (media_id, thumbnail_id(media_id)):
+        try:
+            await bucket.delete(file_id)
+        except NoFile:
+            pass
+
+
+def parse_range(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into an inclusive (start, end) pair."""
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        raise HTTPException(status_code=416, detail="Invalid range", headers={"Content-Range": f"bytes */{length}"})
+    first, last = match.groups()
+    if first == "":
+        start, end = max(length - int(last), 0), length - 1
+    else:
+        start = int(first)
+        end = min(int(last), length - 1) if last else length - 1
+    if start >= length or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{length}"})
+    return start, end
+
+
+async def iter_grid_out(grid_out, start: int, end: int) -> AsyncIterator[bytes]:
+    grid_out.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = await grid_out.read(min(STREAM_CHUNK_BYTES, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
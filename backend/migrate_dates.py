@@ -0,0 +1,78 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, UpdateOne
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+from datetime import date, datetime, timezone
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+BATCH_SIZE = 1000
+
+DATE_FIELDS = {
+    "trips": ["start_date", "end_date"],
+    "stops": ["start_date", "end_date"],
+    "trip_activities": ["date"],
+}
+
+def to_bson_date(value: str):
+    try:
+        day = date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+async def migrate_collection(collection_name: str, fields: list):
+    batch = []
+    updated = 0
+    skipped = 0
+    # Only string-typed values are touched, so the script can be rerun after a partial failure
+    query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {"_id": 1, **{field: 1 for field in fields}}
+    async for doc in db[collection_name].find(query, projection):
+        changes = {}
+        for field in fields:
+            if isinstance(doc.get(field), str):
+                converted = to_bson_date(doc[field])
+                if converted is None:
+                    print(f"{collection_name} {doc['_id']}: cannot parse {field}={doc[field]!r}, left as is")
+                    skipped += 1
+                    continue
+                changes[field] = converted
+        if changes:
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": changes}))
+        if len(batch) >= BATCH_SIZE:
+            result = await db[collection_name].bulk_write(batch, ordered=False)
+            updated += result.modified_count
+            batch = []
+    if batch:
+        result = await db[collection_name].bulk_write(batch, ordered=False)
+        updated += result.modified_count
+    
+    print(f"{collection_name}: converted {updated}, skipped {skipped}")
+
+async def migrate_dates():
+    print("Converting date strings to BSON dates...")
+    
+    for collection_name, fields in DATE_FIELDS.items():
+        await migrate_collection(collection_name, fields)
+    
+    # Finished jobs expire through a TTL index, which only sees BSON dates; these keep their time of day
+    result = await db.jobs.update_many({"finished_at": {"$type": "string"}}, [{"$set": {"finished_at": {"$toDate": "$finished_at"}}}])
+    print(f"jobs: converted {result.modified_count} finished_at stamps")
+    
+    await db.trips.create_index([("user_id", ASCENDING), ("start_date", ASCENDING)])
+    await db.trips.create_index([("user_id", ASCENDING), ("end_date", ASCENDING)])
+    await db.trip_activities.create_index([("trip_id", ASCENDING), ("date", ASCENDING)])
+    await db.trip_activities.create_index([("user_id", ASCENDING), ("date", ASCENDING)])
+    
+    print("Date migration completed!")
+
+if __name__ == "__main__":
+    asyncio.run(migrate_dates())
@@ -0,0 +1,65 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from fastapi import HTTPException
+import os
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from pathlib import Path
+
+import media
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+media_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="media")
+
+# Collection, blob field, field holding the owning user id
+INLINE_BLOB_FIELDS = [
+    ("trips", "cover_photo", "user_id"),
+    ("users", "profile_photo", "id"),
+]
+
+async def migrate_collection(collection_name, field, owner_field):
+    collection = db[collection_name]
+    query = {field: {"$regex": "^data:"}}
+    migrated = 0
+    failed = 0
+    
+    # Only pull the keys we need; the blob itself comes from a second, per-document read
+    async for doc in collection.find(query, {"_id": 0, "id": 1}):
+        current = await collection.find_one({"id": doc["id"]}, {"_id": 0, field: 1, owner_field: 1})
+        if not current or not media.is_data_url(current.get(field)):
+            continue
+        try:
+            url = await media.externalize(media_bucket, current[field], current[owner_field], field)
+        except HTTPException as e:
+            print(f"Skipping {collection_name}/{doc['id']}: {e.detail}")
+            failed += 1
+            continue
+        
+        # Guard on the old value so a concurrent user edit is never overwritten. Stamped and
+        # versioned like any other write, so delta sync and If-Match clients see the new URL
+        result = await collection.update_one(
+            {"id": doc["id"], field: current[field]},
+            {"$set": {field: url, "updated_at": datetime.now(timezone.utc).isoformat()}, "$inc": {"version": 1}}
+        )
+        if not result.modified_count:
+            # The edit won; nothing will ever point at the blob just uploaded
+            await media.discard(media_bucket, url)
+        migrated += result.modified_count
+    
+    print(f"{collection_name}.{field}: migrated {migrated}, failed {failed}")
+
+async def migrate_media():
+    print("Extracting inline media blobs...")
+    
+    for collection_name, field, owner_field in INLINE_BLOB_FIELDS:
+        await migrate_collection(collection_name, field, owner_field)
+    
+    print("Media migration completed!")
+
+if __name__ == "__main__":
+    asyncio.run(migrate_media())
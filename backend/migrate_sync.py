@@ -0,0 +1,45 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+from datetime import datetime, timezone
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+async def backfill_sync_fields():
+    print("Backfilling sync fields...")
+    
+    # Documents written before delta sync have no updated_at; treat them as changed now
+    now = datetime.now(timezone.utc).isoformat()
+    trips = 0
+    
+    async for trip in db.trips.find({}, {"_id": 0, "id": 1, "user_id": 1, "created_at": 1, "updated_at": 1}):
+        if not trip.get("updated_at"):
+            await db.trips.update_one({"id": trip["id"]}, {"$set": {"updated_at": trip.get("created_at", now)}})
+        
+        owner = {"user_id": trip["user_id"]}
+        await db.stops.update_many({"trip_id": trip["id"], "user_id": {"$exists": False}}, {"$set": owner})
+        await db.trip_costs.update_many({"trip_id": trip["id"], "user_id": {"$exists": False}}, {"$set": owner})
+        
+        stop_ids = await db.stops.distinct("id", {"trip_id": trip["id"]})
+        await db.trip_activities.update_many(
+            {"stop_id": {"$in": stop_ids}, "user_id": {"$exists": False}},
+            {"$set": {"user_id": trip["user_id"], "trip_id": trip["id"]}}
+        )
+        trips += 1
+    
+    for collection_name in ["stops", "trip_activities", "trip_costs"]:
+        result = await db[collection_name].update_many({"updated_at": {"$exists": False}}, {"$set": {"updated_at": now}})
+        print(f"{collection_name}: stamped {result.modified_count}")
+    
+    print(f"Backfilled {trips} trips")
+    print("Sync backfill completed!")
+
+if __name__ == "__main__":
+    asyncio.run(backfill_sync_fields())
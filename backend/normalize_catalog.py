@@ -0,0 +1,42 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+from catalog import normalize_activity
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+BATCH_SIZE = 1000
+
+async def normalize_catalog():
+    print("Normalizing activity durations...")
+    
+    batch = []
+    updated = 0
+    async for activity in db.activities.find({}, {"_id": 0, "id": 1, "duration": 1}):
+        normalized = normalize_activity(activity)
+        batch.append(UpdateOne(
+            {"id": activity["id"]},
+            {"$set": {"duration_min": normalized["duration_min"], "duration_max": normalized["duration_max"]}}
+        ))
+        if len(batch) >= BATCH_SIZE:
+            result = await db.activities.bulk_write(batch, ordered=False)
+            updated += result.modified_count
+            batch = []
+    if batch:
+        result = await db.activities.bulk_write(batch, ordered=False)
+        updated += result.modified_count
+    
+    print(f"Updated {updated} activities")
+    print("Catalog normalization completed!")
+
+if __name__ == "__main__":
+    asyncio.run(normalize_catalog())
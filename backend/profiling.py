@@ -0,0 +1,235 @@
+import asyncio
+import gc
+import json
+import os
+import pickle
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+# Frames kept per allocation while tracemalloc traces; deeper costs more memory per block
+TRACEMALLOC_FRAMES = 25
+MAX_MEMORY_SNAPSHOTS = 5
+MAX_STACK_DEPTH = 128
+
+# Samples whose innermost frame sits in one of these files are a thread waiting, not running
+IDLE_FILES = ("selectors.py", "threading.py", "queue.py", os.path.join("concurrent", "futures", "thread.py"))
+
+Stack = Tuple[str, ...]
+
+
+def _frame_label(code, cache: Dict[object, str]) -> str:
+    label = cache.get(code)
+    if label is None:
+        label = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+        cache[code] = label
+    return label
+
+
+def _short_path(filename: str) -> str:
+    # Relative to the longest sys.path entry that contains it, so stacks read like module paths
+    best = ""
+    for entry in sys.path:
+        if entry and filename.startswith(entry) and len(entry) > len(best):
+            best = entry
+    return os.path.relpath(filename, best) if best else filename
+
+
+def _stack(frame, cache: Dict[object, str]) -> List[str]:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code, cache))
+        frame = frame.f_back
+    return labels[::-1]
+
+
+def format_stack(frame) -> List[str]:
+    return _stack(frame, {})
+
+
+def sample_stacks(seconds: float, interval: float, include_idle: bool = False) -> Counter:
+    """Sample every thread's Python stack every interval for the given time.
+
+    Meant to run on its own thread. Each key is (thread name, outermost frame, ...,
+    innermost frame); the count is how many samples caught that exact stack.
+    """
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    me = threading.get_ident()
+    cache: Dict[object, str] = {}
+    samples: Counter = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            if not include_idle and frame.f_code.co_filename.endswith(IDLE_FILES):
+                continue
+            if ident not in names:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            samples[(names.get(ident, str(ident)), *_stack(frame, cache))] += 1
+        time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+    return samples
+
+
+def collapsed(samples: Counter) -> str:
+    """Folded stacks, one "frame;frame;frame count" line each, as flamegraph.pl and speedscope read."""
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in samples.most_common())
+
+
+def speedscope(samples: Counter, interval: float, name: str) -> str:
+    """A speedscope sampled profile per thread, weighted in seconds."""
+    frames: Dict[str, int] = {}
+    threads: Dict[str, Tuple[List[List[int]], List[float]]] = {}
+    for (thread, *stack), count in samples.items():
+        stacks, weights = threads.setdefault(thread, ([], []))
+        stacks.append([frames.setdefault(label, len(frames)) for label in stack])
+        weights.append(count * interval)
+    document = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "globaltrotters",
+        "shared": {"frames": [{"name": label} for label in frames]},
+        "profiles": [
+            {"type": "sampled", "name": thread, "unit": "seconds", "startValue": 0, "endValue": sum(weights), "samples": stacks, "weights": weights}
+            for thread, (stacks, weights) in threads.items()
+        ],
+    }
+    return json.dumps(document)
+
+
+class LoopMonitor:
+    """Measures event loop lag and records what the loop was running when it stalled.
+
+    A task on the loop sleeps for interval and records how late it woke up. A
+    watchdog thread checks that the task keeps beating; once the loop has gone
+    threshold past a beat without one, it captures the loop thread's stack, which
+    points at the call holding the loop (bcrypt, a large json.dumps, sync I/O).
+    """
+
+    def __init__(self, interval: float = 0.05, threshold: float = 0.1, history: int = 50):
+        self.interval = interval
+        self.threshold = threshold
+        # A minute of lag samples at the default interval
+        self.lag: deque = deque(maxlen=int(60 / interval))
+        self.blocks: deque = deque(maxlen=history)
+        self.beat = time.perf_counter()
+        self.loop_thread: Optional[int] = None
+
+    async def run(self):
+        self.loop_thread = threading.get_ident()
+        self.beat = time.perf_counter()
+        stopped = threading.Event()
+        watchdog = threading.Thread(target=self._watch, args=(stopped,), name="loop-watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                started = time.perf_counter()
+                await asyncio.sleep(self.interval)
+                self.beat = time.perf_counter()
+                self.lag.append(max(0.0, self.beat - started - self.interval))
+        finally:
+            stopped.set()
+
+    def _watch(self, stopped: threading.Event):
+        block = None
+        while not stopped.wait(self.interval / 2):
+            beat = self.beat
+            stalled = time.perf_counter() - beat - self.interval
+            if stalled < self.threshold:
+                block = None
+                continue
+            if block is None or block["beat"] != beat:
+                frame = sys._current_frames().get(self.loop_thread)
+                started_at = datetime.now(timezone.utc) - timedelta(seconds=stalled)
+                block = {"beat": beat, "started_at": started_at.isoformat(), "duration_ms": 0.0, "stack": format_stack(frame)}
+                self.blocks.append(block)
+            block["duration_ms"] = round(stalled * 1000, 1)
+
+    def stats(self) -> dict:
+        lag = sorted(self.lag)
+
+        def percentile(q: float) -> float:
+            return round(lag[min(len(lag) - 1, int(q * len(lag)))] * 1000, 2) if lag else 0.0
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "samples": len(lag),
+            "lag_p50_ms": percentile(0.5),
+            "lag_p99_ms": percentile(0.99),
+            "lag_max_ms": round(lag[-1] * 1000, 2) if lag else 0.0,
+            "blocked": [{key: value for key, value in block.items() if key != "beat"} for block in reversed(self.blocks)],
+        }
+
+
+# tracemalloc's own bookkeeping and the import system would otherwise top every listing
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+class MemorySnapshots:
+    """tracemalloc snapshots of this worker, the newest MAX_MEMORY_SNAPSHOTS kept by id."""
+
+    def __init__(self):
+        self.snapshots: "OrderedDict[str, Tuple[str, tracemalloc.Snapshot]]" = OrderedDict()
+
+    def take(self) -> Tuple[str, str, tracemalloc.Snapshot]:
+        if not tracemalloc.is_tracing():
+            # Only allocations made from here on are traced; this first snapshot is the baseline
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        snapshot_id = secrets.token_urlsafe(8)
+        taken_at = datetime.now(timezone.utc).isoformat()
+        self.snapshots[snapshot_id] = (taken_at, snapshot)
+        while len(self.snapshots) > MAX_MEMORY_SNAPSHOTS:
+            self.snapshots.popitem(last=False)
+        return snapshot_id, taken_at, snapshot
+
+    def get(self, snapshot_id: str) -> Optional[Tuple[str, tracemalloc.Snapshot]]:
+        return self.snapshots.get(snapshot_id)
+
+    def stop(self):
+        self.snapshots.clear()
+        tracemalloc.stop()
+
+    @staticmethod
+    def dump(snapshot: tracemalloc.Snapshot) -> bytes:
+        # Same bytes Snapshot.dump writes, so tracemalloc.Snapshot.load reads the download
+        return pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+
+
+def allocation_rows(statistics: Iterable, limit: int) -> List[dict]:
+    rows = []
+    for stat in statistics:
+        frame = stat.traceback[0]
+        row = {"file": _short_path(frame.filename), "line": frame.lineno, "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+        if isinstance(stat, tracemalloc.StatisticDiff):
+            row["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+            row["count_diff"] = stat.count_diff
+        if len(stat.traceback) > 1:
+            row["traceback"] = [f"{_short_path(frame.filename)}:{frame.lineno}" for frame in stat.traceback]
+        rows.append(row)
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def live_model_counts() -> Counter:
+    """Live instances of every Pydantic model class, by module-qualified class name."""
+    counts: Counter = Counter()
+    for obj in gc.get_objects():
+        if isinstance(obj, BaseModel):
+            model = type(obj)
+            counts[f"{model.__module__}.{model.__qualname__}"] += 1
+    return counts
@@ -0,0 +1,44 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+from summaries import rebuild_summaries
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+BATCH_SIZE = 500
+
+async def reconcile_summaries():
+    print("Rebuilding user and trip summaries...")
+    
+    await db.user_summaries.create_index("user_id", unique=True)
+    await db.trip_summaries.create_index("trip_id", unique=True)
+    await db.trip_summaries.create_index("user_id")
+    
+    batch = []
+    users = 0
+    trips = 0
+    async for user in db.users.find({}, {"_id": 0, "id": 1}).sort("id", ASCENDING):
+        batch.append(user["id"])
+        if len(batch) >= BATCH_SIZE:
+            trips += await rebuild_summaries(db, batch)
+            users += len(batch)
+            print(f"Rebuilt {users} users, {trips} trips")
+            batch = []
+    if batch:
+        trips += await rebuild_summaries(db, batch)
+        users += len(batch)
+    
+    print(f"Rebuilt {users} users, {trips} trips")
+    print("Summary reconciliation completed!")
+
+if __name__ == "__main__":
+    asyncio.run(reconcile_summaries())
@@ -0,0 +1,431 @@
+import copy
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, fields as dataclass_fields
+from itertools import count
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+
+Sort = Union[str, Sequence[Tuple[str, int]], None]
+
+# Fields each in-memory collection keeps a hash index on; all are scalar ids or keys
+MEMORY_INDEXES = {
+    "users": ("id", "email"),
+    "trips": ("id", "user_id", "share_token"),
+    "stops": ("id", "trip_id", "user_id"),
+    "trip_activities": ("id", "stop_id", "trip_id", "user_id"),
+    "trip_costs": ("id", "trip_id", "user_id"),
+    "cities": ("id", "country"),
+    "activities": ("id", "city_id", "category"),
+    "user_summaries": ("user_id",),
+    "trip_summaries": ("trip_id", "user_id"),
+    "tombstones": ("id", "user_id"),
+    "jobs": ("id", "type", "user_id"),
+}
+
+
+class Repository(ABC):
+    """Storage for one collection of documents.
+
+    Queries use a small subset of the MongoDB filter language that both backends
+    understand: equality on a field, the operators $in, $nin, $ne, $gt, $gte, $lt,
+    $lte, $exists and $regex (with "i" in $options), and a top-level $or.
+    Projections follow the MongoDB shape; "_id" is never returned. Documents come
+    back as copies, so callers may mutate them freely.
+    """
+
+    @abstractmethod
+    async def get(self, query: dict, fields: Optional[dict] = None) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def find(self, query: dict, fields: Optional[dict] = None, sort: Sort = None, skip: int = 0, limit: Optional[int] = None) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def iterate(self, query: dict, fields: Optional[dict] = None, sort: Sort = None) -> AsyncIterator[dict]:
+        ...
+
+    @abstractmethod
+    async def count(self, query: dict, limit: int = 0) -> int:
+        ...
+
+    @abstractmethod
+    async def distinct(self, field: str, query: dict) -> List[Any]:
+        ...
+
+    @abstractmethod
+    async def insert(self, doc: dict):
+        ...
+
+    @abstractmethod
+    async def insert_many(self, docs: List[dict]):
+        ...
+
+    @abstractmethod
+    async def update(self, query: dict, changes: Optional[dict] = None, inc: Optional[dict] = None, fields: Optional[dict] = None, upsert: bool = False, sort: Sort = None) -> Optional[dict]:
+        """Apply $set changes and $inc increments to the first match (in sort order) and return it as updated."""
+
+    @abstractmethod
+    async def update_each(self, updates: List[Tuple[dict, dict]]):
+        """Apply many independent (query, changes) updates, in no particular order."""
+
+    @abstractmethod
+    async def delete(self, query: dict) -> Optional[dict]:
+        """Delete the first match and return it, or None when nothing matched."""
+
+    @abstractmethod
+    async def delete_many(self, query: dict) -> int:
+        ...
+
+
+def _projection(fields: Optional[dict]) -> dict:
+    return {"_id": 0, **(fields or {})}
+
+
+def _sort_spec(sort: Sort) -> List[Tuple[str, int]]:
+    if sort is None:
+        return []
+    if isinstance(sort, str):
+        return [(sort, ASCENDING)]
+    return list(sort)
+
+
+def _update_document(changes: Optional[dict], inc: Optional[dict]) -> dict:
+    update = {}
+    if changes:
+        update["$set"] = changes
+    if inc:
+        update["$inc"] = inc
+    return update
+
+
+class MongoRepository(Repository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    def _cursor(self, query: dict, fields: Optional[dict], sort: Sort):
+        cursor = self.collection.find(query, _projection(fields))
+        spec = _sort_spec(sort)
+        if spec:
+            cursor = cursor.sort(spec)
+        return cursor
+
+    async def get(self, query, fields=None):
+        return await self.collection.find_one(query, _projection(fields))
+
+    async def find(self, query, fields=None, sort=None, skip=0, limit=None):
+        cursor = self._cursor(query, fields, sort)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(limit)
+
+    async def iterate(self, query, fields=None, sort=None):
+        async for doc in self._cursor(query, fields, sort):
+            yield doc
+
+    async def count(self, query, limit=0):
+        return await self.collection.count_documents(query, limit=limit) if limit else await self.collection.count_documents(query)
+
+    async def distinct(self, field, query):
+        return await self.collection.distinct(field, query)
+
+    async def insert(self, doc):
+        # Motor adds _id to the dict it is given; callers keep using their doc afterwards
+        await self.collection.insert_one(dict(doc))
+
+    async def insert_many(self, docs):
+        if docs:
+            await self.collection.insert_many([dict(doc) for doc in docs])
+
+    async def update(self, query, changes=None, inc=None, fields=None, upsert=False, sort=None):
+        update = _update_document(changes, inc)
+        if not update:
+            return await self.get(query, fields)
+        return await self.collection.find_one_and_update(
+            query, update, projection=_projection(fields), sort=_sort_spec(sort) or None, upsert=upsert, return_document=ReturnDocument.AFTER
+        )
+
+    async def update_each(self, updates):
+        if updates:
+            await self.collection.bulk_write([UpdateOne(query, {"$set": changes}) for query, changes in updates], ordered=False)
+
+    async def delete(self, query):
+        return await self.collection.find_one_and_delete(query, projection={"_id": 0})
+
+    async def delete_many(self, query):
+        result = await self.collection.delete_many(query)
+        return result.deleted_count
+
+
+# In-memory backend
+
+_OPERATORS = {"$in", "$nin", "$ne", "$gt", "$gte", "$lt", "$lte", "$exists", "$regex", "$options"}
+
+
+def _lookup(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _has(doc: dict, path: str) -> bool:
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return False
+        value = value[part]
+    return True
+
+
+def _compare(value, bound, test) -> bool:
+    # Like MongoDB, ranges never match missing values or values of another type
+    if value is None or bound is None:
+        return False
+    try:
+        return test(value, bound)
+    except TypeError:
+        return False
+
+
+def _matches_condition(doc: dict, field: str, condition) -> bool:
+    value = _lookup(doc, field)
+    if not (isinstance(condition, dict) and condition and set(condition) <= _OPERATORS):
+        return value == condition
+    for op, operand in condition.items():
+        if op == "$in" and value not in operand:
+            return False
+        if op == "$nin" and value in operand:
+            return False
+        if op == "$ne" and value == operand:
+            return False
+        if op == "$gt" and not _compare(value, operand, lambda a, b: a > b):
+            return False
+        if op == "$gte" and not _compare(value, operand, lambda a, b: a >= b):
+            return False
+        if op == "$lt" and not _compare(value, operand, lambda a, b: a < b):
+            return False
+        if op == "$lte" and not _compare(value, operand, lambda a, b: a <= b):
+            return False
+        if op == "$exists" and _has(doc, field) != bool(operand):
+            return False
+        if op == "$regex":
+            flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+            if not isinstance(value, str) or not re.search(operand, value, flags):
+                return False
+    return True
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, clause) for clause in condition):
+                return False
+        elif not _matches_condition(doc, field, condition):
+            return False
+    return True
+
+
+def _clone(value):
+    return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+
+def project(doc: dict, fields: Optional[dict]) -> dict:
+    wanted = {field: flag for field, flag in (fields or {}).items() if field != "_id"}
+    if any(wanted.values()):
+        return {key: _clone(doc[key]) for key in wanted if key in doc}
+    return {key: _clone(value) for key, value in doc.items() if key not in wanted}
+
+
+class _SortKey:
+    # Orders None before every value, then by value, as MongoDB does for missing fields
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        if self.value is None:
+            return other.value is not None
+        if other.value is None:
+            return False
+        return self.value < other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _set_path(doc: dict, path: str, value):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[leaf] = value
+
+
+def _apply(doc: dict, changes: Optional[dict], inc: Optional[dict]):
+    for path, value in (changes or {}).items():
+        _set_path(doc, path, copy.deepcopy(value))
+    for path, amount in (inc or {}).items():
+        _set_path(doc, path, (_lookup(doc, path) or 0) + amount)
+
+
+class MemoryRepository(Repository):
+    """Documents in a dict keyed by insertion number, with a hash index per declared field.
+
+    A query that pins an indexed field (by equality or $in) only examines the documents
+    the smallest such index lists; anything else is a scan in insertion order.
+    """
+
+    def __init__(self, indexed_fields: Iterable[str] = ()):
+        self.docs: Dict[int, dict] = {}
+        self.indexes: Dict[str, Dict[Any, Dict[int, None]]] = {field: {} for field in indexed_fields}
+        self._keys = count()
+
+    def _index(self, key: int, doc: dict):
+        for field, index in self.indexes.items():
+            value = doc.get(field)
+            if value is not None:
+                index.setdefault(value, {})[key] = None
+
+    def _unindex(self, key: int, doc: dict):
+        for field, index in self.indexes.items():
+            entries = index.get(doc.get(field))
+            if entries is not None:
+                entries.pop(key, None)
+                if not entries:
+                    del index[doc.get(field)]
+
+    def _candidates(self, query: dict) -> Iterable[int]:
+        best = None
+        for field, condition in query.items():
+            index = self.indexes.get(field)
+            if index is None:
+                continue
+            if isinstance(condition, dict) and set(condition) == {"$in"}:
+                keys = set()
+                for value in condition["$in"]:
+                    keys.update(index.get(value, ()))
+            elif isinstance(condition, dict):
+                continue
+            else:
+                keys = index.get(condition, {}).keys()
+            if best is None or len(keys) < len(best):
+                best = keys
+        if best is None:
+            return list(self.docs)
+        return sorted(best)
+
+    def _matching(self, query: dict) -> Iterable[Tuple[int, dict]]:
+        for key in self._candidates(query):
+            doc = self.docs.get(key)
+            if doc is not None and matches(doc, query):
+                yield key, doc
+
+    def _sorted(self, query: dict, sort: Sort) -> List[Tuple[int, dict]]:
+        pairs = list(self._matching(query))
+        # Stable sorts applied from the last key to the first give a compound ordering
+        for field, direction in reversed(_sort_spec(sort)):
+            pairs.sort(key=lambda pair: _SortKey(_lookup(pair[1], field)), reverse=direction < 0)
+        return pairs
+
+    async def get(self, query, fields=None):
+        for _, doc in self._matching(query):
+            return project(doc, fields)
+        return None
+
+    async def find(self, query, fields=None, sort=None, skip=0, limit=None):
+        pairs = self._sorted(query, sort)
+        end = skip + limit if limit else None
+        return [project(doc, fields) for _, doc in pairs[skip:end]]
+
+    async def iterate(self, query, fields=None, sort=None):
+        for _, doc in self._sorted(query, sort):
+            yield project(doc, fields)
+
+    async def count(self, query, limit=0):
+        total = 0
+        for _ in self._matching(query):
+            total += 1
+            if limit and total >= limit:
+                break
+        return total
+
+    async def distinct(self, field, query):
+        values = {}
+        for _, doc in self._matching(query):
+            value = _lookup(doc, field)
+            if value is not None:
+                values[value] = None
+        return list(values)
+
+    async def insert(self, doc):
+        key = next(self._keys)
+        stored = copy.deepcopy({k: v for k, v in doc.items() if k != "_id"})
+        self.docs[key] = stored
+        self._index(key, stored)
+
+    async def insert_many(self, docs):
+        for doc in docs:
+            await self.insert(doc)
+
+    async def update(self, query, changes=None, inc=None, fields=None, upsert=False, sort=None):
+        for key, doc in self._sorted(query, sort) if sort else self._matching(query):
+            self._unindex(key, doc)
+            _apply(doc, changes, inc)
+            self._index(key, doc)
+            return project(doc, fields)
+        if not upsert:
+            return None
+        doc = {field: condition for field, condition in query.items() if not isinstance(condition, dict)}
+        _apply(doc, changes, inc)
+        await self.insert(doc)
+        return project(doc, fields)
+
+    async def update_each(self, updates):
+        for query, changes in updates:
+            await self.update(query, changes)
+
+    async def delete(self, query):
+        for key, doc in self._matching(query):
+            self._unindex(key, doc)
+            del self.docs[key]
+            return project(doc, None)
+        return None
+
+    async def delete_many(self, query):
+        keys = [key for key, _ in self._matching(query)]
+        for key in keys:
+            self._unindex(key, self.docs.pop(key))
+        return len(keys)
+
+
+@dataclass
+class Repositories:
+    users: Repository
+    trips: Repository
+    stops: Repository
+    trip_activities: Repository
+    trip_costs: Repository
+    cities: Repository
+    activities: Repository
+    user_summaries: Repository
+    trip_summaries: Repository
+    tombstones: Repository
+    jobs: Repository
+
+    def __getitem__(self, name: str) -> Repository:
+        return getattr(self, name)
+
+
+def mongo_repositories(db) -> Repositories:
+    return Repositories(**{field.name: MongoRepository(db[field.name]) for field in dataclass_fields(Repositories)})
+
+
+def memory_repositories() -> Repositories:
+    return Repositories(**{field.name: MemoryRepository(MEMORY_INDEXES[field.name]) for field in dataclass_fields(Repositories)})
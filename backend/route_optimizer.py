@@ -0,0 +1,78 @@
+from typing import List
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_TWO_OPT_ROUNDS = 1000
+
+
+def haversine_matrix(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    """Pairwise great-circle distances in km for points given in degrees."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def path_length(dist: np.ndarray, route: np.ndarray) -> float:
+    return float(dist[route[:-1], route[1:]].sum())
+
+
+def _nearest_neighbour(dist: np.ndarray, start: int, end: int) -> np.ndarray:
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    visited[[start, end]] = True
+    route = [start]
+    current = start
+    for _ in range(n - 2):
+        candidates = np.where(visited, np.inf, dist[current])
+        current = int(np.argmin(candidates))
+        visited[current] = True
+        route.append(current)
+    route.append(end)
+    return np.array(route, dtype=np.int64)
+
+
+def _two_opt(dist: np.ndarray, route: np.ndarray) -> np.ndarray:
+    """Best-improvement 2-opt on a path whose first and last nodes stay put."""
+    m = len(route)
+    if m < 4:
+        return route
+    # Edge k joins route[k] and route[k + 1]; only pairs with j >= i + 2 can be swapped
+    valid = np.triu(np.ones((m - 1, m - 1), dtype=bool), k=2)
+    for _ in range(MAX_TWO_OPT_ROUNDS):
+        a, b = route[:-1], route[1:]
+        edge = dist[a, b]
+        delta = dist[a[:, None], a[None, :]] + dist[b[:, None], b[None, :]] - edge[:, None] - edge[None, :]
+        delta[~valid] = 0.0
+        best = int(np.argmin(delta))
+        i, j = divmod(best, m - 1)
+        if delta[i, j] > -1e-9:
+            break
+        route[i + 1:j + 1] = route[i + 1:j + 1][::-1].copy()
+    return route
+
+
+def optimize_order(lat: np.ndarray, lng: np.ndarray, keep_start: bool = True, keep_end: bool = False) -> List[int]:
+    """Return a visiting order (indices into lat/lng) that shortens the open path.
+
+    Index 0 stays first when keep_start is set and the last index stays last when
+    keep_end is set. A free endpoint is modelled as a virtual node at zero distance
+    from everything, so the solver always works on a path with both ends fixed.
+    """
+    n = len(lat)
+    if n < 3:
+        return list(range(n))
+
+    dist = haversine_matrix(lat, lng)
+    size = n + (not keep_start) + (not keep_end)
+    full = np.zeros((size, size))
+    offset = 0 if keep_start else 1
+    full[offset:offset + n, offset:offset + n] = dist
+
+    start = 0
+    end = size - 1
+    route = _two_opt(full, _nearest_neighbour(full, start, end))
+    return [int(node) - offset for node in route if offset <= node < offset + n]
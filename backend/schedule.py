@@ -0,0 +1,74 @@
+import re
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Iterable, List, Optional, Tuple
+
+MINUTES_PER_DAY = 24 * 60
+
+_CLOCK_RE = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)")
+
+
+def parse_clock(value: Optional[str]) -> Optional[int]:
+    """Minutes after midnight for "HH:MM" (seconds are ignored), or None."""
+    if not value:
+        return None
+    match = _CLOCK_RE.match(value.strip())
+    if not match:
+        return None
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+def format_clock(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class DayIntervals:
+    """Static interval index over one day's timed activities.
+
+    Intervals are half-open [start, end) in minutes and may overlap each other (old
+    data was never validated). They are sorted by start with a running maximum of
+    end times, so an overlap probe is a binary search plus a walk over the actual
+    conflicts. The merged busy blocks are kept too, so free-time lookups are a
+    binary search as well.
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[int, int, str]]):
+        ordered = sorted(intervals)
+        self.starts = [start for start, _, _ in ordered]
+        self.ends = [end for _, end, _ in ordered]
+        self.ids = [doc_id for _, _, doc_id in ordered]
+        self.max_end = list(accumulate(self.ends, max))
+
+        merged: List[List[int]] = []
+        for start, end in zip(self.starts, self.ends):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.busy_starts = [start for start, _ in merged]
+        self.busy_ends = [end for _, end in merged]
+
+    def overlapping(self, start: int, end: int) -> List[str]:
+        conflicts = []
+        # Only intervals that start before `end` can overlap; walk back while any of them can still reach `start`
+        i = bisect_left(self.starts, end) - 1
+        while i >= 0 and self.max_end[i] > start:
+            if self.ends[i] > start:
+                conflicts.append(self.ids[i])
+            i -= 1
+        return conflicts
+
+    def free_slots(self, window_start: int, window_end: int, min_minutes: int = 1) -> List[Tuple[int, int]]:
+        slots = []
+        # First busy block that could still be running at window_start
+        i = max(bisect_right(self.busy_starts, window_start) - 1, 0)
+        cursor = window_start
+        while i < len(self.busy_starts) and self.busy_starts[i] < window_end:
+            if self.busy_ends[i] > cursor:
+                if self.busy_starts[i] - cursor >= min_minutes:
+                    slots.append((cursor, self.busy_starts[i]))
+                cursor = max(cursor, self.busy_ends[i])
+            i += 1
+        if window_end - cursor >= min_minutes:
+            slots.append((cursor, window_end))
+        return slots
@@ -0,0 +1,220 @@
+import re
+import unicodedata
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+POPULARITY_WEIGHT = 0.5
+MIN_SCAN_DEPTH = 256
+# Past this share of the postings, pruning costs more than scoring everything
+MAX_PRUNED_SCAN_SHARE = 0.125
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {"a", "an", "and", "at", "by", "for", "from", "in", "of", "on", "or", "the", "to", "with"}
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    # Fold accents so "Güell" and "guell" meet in the same posting list
+    folded = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+    return [token for token in _TOKEN_RE.findall(folded) if token not in _STOPWORDS]
+
+
+class SearchIndex:
+    """In-memory BM25F-style inverted index over a catalog collection.
+
+    Postings are stored in CSR form: the documents containing term t are
+    ``doc_ids[offsets[t]:offsets[t + 1]]``. Field weights are folded into term
+    frequency, so a hit in ``name`` counts for more than one in ``description``.
+    Each posting stores its final impact (BM25 term score times the document's
+    popularity boost). Every posting list is kept twice: sorted by impact, so the
+    best hits sit at the front, and sorted by document, so a candidate's exact
+    score can be looked up with a binary search. Multi-term queries use the
+    threshold algorithm over the impact-ordered prefixes and stop as soon as no
+    unseen document can beat the current top k.
+    """
+
+    def __init__(self, ids, vocab, offsets, doc_ids, impacts, by_doc_ids, by_doc_impacts, filters):
+        self.ids = ids
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.impacts = impacts
+        self.by_doc_ids = by_doc_ids
+        self.by_doc_impacts = by_doc_impacts
+        self.filters = filters
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, docs: Iterable[dict], fields: Dict[str, float], filter_fields: Iterable[str] = ()) -> "SearchIndex":
+        filter_fields = list(filter_fields)
+        ids = []
+        vocab: Dict[str, int] = {}
+        post_terms, post_docs, post_tfs = array("i"), array("i"), array("f")
+        doc_lengths, popularity = array("f"), array("f")
+        filter_values: Dict[str, List[Optional[str]]] = {name: [] for name in filter_fields}
+
+        for position, doc in enumerate(docs):
+            counts: Dict[str, float] = {}
+            for field, weight in fields.items():
+                for token in tokenize(doc.get(field)):
+                    counts[token] = counts.get(token, 0.0) + weight
+            for token, tf in counts.items():
+                post_terms.append(vocab.setdefault(token, len(vocab)))
+                post_docs.append(position)
+                post_tfs.append(tf)
+            ids.append(doc["id"])
+            doc_lengths.append(sum(counts.values()) or 1.0)
+            popularity.append(float(doc.get("popularity") or 0))
+            for name in filter_fields:
+                filter_values[name].append(doc.get(name))
+
+        terms = np.frombuffer(post_terms, dtype=np.int32)
+        docs_arr = np.frombuffer(post_docs, dtype=np.int32)
+        tf = np.frombuffer(post_tfs, dtype=np.float32)
+        lengths = np.frombuffer(doc_lengths, dtype=np.float32)
+        popularity_arr = np.frombuffer(popularity, dtype=np.float32)
+
+        df = np.bincount(terms, minlength=len(vocab))
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+
+        top = popularity_arr.max() if len(popularity_arr) else 0.0
+        boost = 1.0 + POPULARITY_WEIGHT * (np.log1p(popularity_arr) / np.log1p(top) if top > 0 else np.zeros_like(popularity_arr))
+        idf = np.log1p((len(ids) - df + 0.5) / (df + 0.5))
+        avg_length = lengths.mean() if len(lengths) else 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs_arr] / avg_length)
+        impacts = (idf[terms] * tf * (BM25_K1 + 1) / (tf + norm) * boost[docs_arr]).astype(np.float32)
+
+        # Group by term, highest impact first within each posting list; the second
+        # copy is grouped by term and ordered by document for exact lookups
+        order = np.lexsort((docs_arr, -impacts, terms))
+        by_doc = np.lexsort((docs_arr, terms))
+
+        filters = {}
+        for name, values in filter_values.items():
+            codes: Dict[Optional[str], int] = {}
+            filters[name] = (codes, np.array([codes.setdefault(value, len(codes)) for value in values], dtype=np.int32))
+
+        return cls(
+            ids=np.array(ids, dtype=object),
+            vocab=vocab,
+            offsets=offsets,
+            doc_ids=docs_arr[order],
+            impacts=impacts[order],
+            by_doc_ids=docs_arr[by_doc],
+            by_doc_impacts=impacts[by_doc],
+            filters=filters,
+        )
+
+    def _exact_scores(self, candidates: np.ndarray, term_ids: List[int]) -> np.ndarray:
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            segment = self.by_doc_ids[start:end]
+            positions = np.minimum(np.searchsorted(segment, candidates), len(segment) - 1)
+            hit = segment[positions] == candidates
+            scores += np.where(hit, self.by_doc_impacts[start:end][positions], 0.0)
+        return scores
+
+    def _filter_mask(self, docs: np.ndarray, filters: Dict[str, str]) -> Optional[np.ndarray]:
+        keep = np.ones(len(docs), dtype=bool)
+        for name, value in filters.items():
+            codes, column = self.filters[name]
+            if value not in codes:
+                return None
+            keep &= column[docs] == codes[value]
+        return keep
+
+    def _estimate_union(self, term_ids: List[int]) -> float:
+        # Assumes terms occur independently; only used when the scan stopped early
+        n = len(self.ids)
+        miss = 1.0
+        for term_id in term_ids:
+            miss *= 1.0 - (self.offsets[term_id + 1] - self.offsets[term_id]) / n
+        return n * (1.0 - miss)
+
+    def _dense_candidates(self, term_ids: List[int], filters: Dict[str, str]):
+        # Each posting list holds a document at most once, so plain fancy-index adds are safe
+        accumulator = np.zeros(len(self.ids), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            accumulator[self.doc_ids[start:end]] += self.impacts[start:end]
+        docs = np.flatnonzero(accumulator)
+        keep = self._filter_mask(docs, filters)
+        if keep is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), 0
+        docs = docs[keep]
+        return docs, accumulator[docs], len(docs)
+
+    def _multi_term_candidates(self, term_ids: List[int], filters: Dict[str, str], k: int):
+        postings = sum(self.offsets[term_id + 1] - self.offsets[term_id] for term_id in term_ids)
+        depth = max(MIN_SCAN_DEPTH, 4 * k)
+        while True:
+            if depth * len(term_ids) > MAX_PRUNED_SCAN_SHARE * postings:
+                return self._dense_candidates(term_ids, filters)
+
+            seen = []
+            unseen_bound = 0.0
+            exhausted = True
+            for term_id in term_ids:
+                start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                stop = min(start + depth, end)
+                seen.append(self.doc_ids[start:stop])
+                if stop < end:
+                    # Lists are impact-ordered, so the next posting bounds everything after it
+                    unseen_bound += float(self.impacts[stop])
+                    exhausted = False
+
+            candidates = np.unique(np.concatenate(seen))
+            scanned = len(candidates)
+            keep = self._filter_mask(candidates, filters)
+            if keep is None:
+                return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32), 0
+            candidates = candidates[keep]
+            scores = self._exact_scores(candidates, term_ids)
+
+            if exhausted:
+                return candidates, scores, len(candidates)
+            if len(candidates) >= k:
+                kth = float(np.partition(scores, len(scores) - k)[len(scores) - k])
+                if kth >= unseen_bound:
+                    selectivity = len(candidates) / scanned if scanned else 0.0
+                    return candidates, scores, int(round(self._estimate_union(term_ids) * selectivity))
+            depth *= 4
+
+    def search(self, query: str, filters: Optional[Dict[str, str]] = None, offset: int = 0, limit: int = 20) -> Tuple[int, List[Tuple[str, float]]]:
+        """Return (total hits, [(id, score), ...]) for one page of results.
+
+        The total is exact for single-term queries and for multi-term queries whose
+        posting lists were read to the end; otherwise it is an estimate.
+        """
+        term_ids = list(dict.fromkeys(self.vocab[token] for token in tokenize(query) if token in self.vocab))
+        if not term_ids:
+            return 0, []
+        filters = filters or {}
+        wanted = offset + limit
+
+        if len(term_ids) == 1:
+            start, end = self.offsets[term_ids[0]], self.offsets[term_ids[0] + 1]
+            docs, scores = self.doc_ids[start:end], self.impacts[start:end]
+            keep = self._filter_mask(docs, filters) if filters else None
+            if filters and keep is None:
+                return 0, []
+            if keep is not None:
+                docs, scores = docs[keep], scores[keep]
+            # Already in impact order
+            return len(docs), [(self.ids[doc], float(score)) for doc, score in zip(docs[offset:wanted], scores[offset:wanted])]
+
+        docs, scores, total = self._multi_term_candidates(term_ids, filters, wanted)
+        if offset >= len(docs):
+            return total, []
+        top = np.argpartition(-scores, wanted - 1)[:wanted] if wanted < len(docs) else np.arange(len(docs))
+        ranked = top[np.lexsort((docs[top], -scores[top]))][offset:wanted]
+        return total, [(self.ids[docs[i]], float(scores[i])) for i in ranked]
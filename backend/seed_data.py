@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 from pathlib import Path
 import secrets
 
+from catalog import normalize_activity
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -21,7 +23,9 @@ cities_data = [
         "cost_index": 85,
         "popularity": 95,
         "description": "The City of Light, known for its art, culture, and cuisine",
-        "image_url": "https://images.unsplash.com/photo-1502602898657-3e91760cbb34?w=800"
+        "image_url": "https://images.unsplash.com/photo-1502602898657-3e91760cbb34?w=800",
+        "lat": 48.8566,
+        "lng": 2.3522
     },
     {
         "id": secrets.token_urlsafe(16),
@@ -31,7 +35,9 @@ cities_data = [
         "cost_index": 80,
         "popularity": 90,
         "description": "A vibrant metropolis blending tradition and modernity",
-        "image_url": "https://images.unsplash.com/photo-1540959733332-eab4deabeeaf?w=800"
+        "image_url": "https://images.unsplash.com/photo-1540959733332-eab4deabeeaf?w=800",
+        "lat": 35.6762,
+        "lng": 139.6503
     },
     {
         "id": secrets.token_urlsafe(16),
@@ -41,7 +47,9 @@ cities_data = [
         "cost_index": 90,
         "popularity": 92,
         "description": "The city that never sleeps, center of culture and finance",
-        "image_url": "https://images.unsplash.com/photo-1496442226666-8d4d0e62e6e9?w=800"
+        "image_url": "https://images.unsplash.com/photo-1496442226666-8d4d0e62e6e9?w=800",
+        "lat": 40.7128,
+        "lng": -74.006
     },
     {
         "id": secrets.token_urlsafe(16),
@@ -51,7 +59,9 @@ cities_data = [
         "cost_index": 70,
         "popularity": 88,
         "description": "Mediterranean paradise with stunning architecture",
-        "image_url": "https://images.unsplash.com/photo-1583422409516-2895a77efded?w=800"
+        "image_url": "https://images.unsplash.com/photo-1583422409516-2895a77efded?w=800",
+        "lat": 41.3874,
+        "lng": 2.1686
     },
     {
         "id": secrets.token_urlsafe(16),
@@ -61,7 +71,9 @@ cities_data = [
         "cost_index": 40,
         "popularity": 85,
         "description": "Tropical paradise with beautiful beaches and temples",
-        "image_url": "https://images.unsplash.com/photo-1537996194471-e657df975ab4?w=800"
+        "image_url": "https://images.unsplash.com/photo-1537996194471-e657df975ab4?w=800",
+        "lat": -8.4095,
+        "lng": 115.1889
     },
     {
         "id": secrets.token_urlsafe(16),
@@ -71,7 +83,9 @@ cities_data = [
         "cost_index": 95,
         "popularity": 93,
         "description": "Historic capital with world-class museums and culture",
-        "image_url": "https://images.unsplash.com/photo-1513635269975-59663e0ac1ad?w=800"
+        "image_url": "https://images.unsplash.com/photo-1513635269975-59663e0ac1ad?w=800",
+        "lat": 51.5074,
+        "lng": -0.1278
     },
     {
         "id": secrets.token_urlsafe(16),
@@ -81,7 +95,9 @@ cities_data = [
         "cost_index": 85,
         "popularity": 87,
         "description": "Futuristic city with luxury shopping and architecture",
-        "image_url": "https://images.unsplash.com/photo-1512453979798-5ea266f8880c?w=800"
+        "image_url": "https://images.unsplash.com/photo-1512453979798-5ea266f8880c?w=800",
+        "lat": 25.2048,
+        "lng": 55.2708
     },
     {
         "id": secrets.token_urlsafe(16),
@@ -91,7 +107,9 @@ cities_data = [
         "cost_index": 88,
         "popularity": 86,
         "description": "Harbor city with iconic landmarks and beaches",
-        "image_url": "https://images.unsplash.com/photo-1506973035872-a4ec16b8e8d9?w=800"
+        "image_url": "https://images.unsplash.com/photo-1506973035872-a4ec16b8e8d9?w=800",
+        "lat": -33.8688,
+        "lng": 151.2093
     },
     {
         "id": secrets.token_urlsafe(16),
@@ -101,7 +119,9 @@ cities_data = [
         "cost_index": 75,
         "popularity": 91,
         "description": "Ancient city with remarkable history and cuisine",
-        "image_url": "https://images.unsplash.com/photo-1552832230-c0197dd311b5?w=800"
+        "image_url": "https://images.unsplash.com/photo-1552832230-c0197dd311b5?w=800",
+        "lat": 41.9028,
+        "lng": 12.4964
     },
     {
         "id": secrets.token_urlsafe(16),
@@ -111,82 +131,91 @@ cities_data = [
         "cost_index": 35,
         "popularity": 84,
         "description": "Bustling city with vibrant street life and temples",
-        "image_url": "https://images.unsplash.com/photo-1508009603885-50cf7c579365?w=800"
+        "image_url": "https://images.unsplash.com/photo-1508009603885-50cf7c579365?w=800",
+        "lat": 13.7563,
+        "lng": 100.5018
     }
 ]
 
+def geo_point(lat, lng):
+    # GeoJSON wants [longitude, latitude]
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+for city in cities_data:
+    city["location"] = geo_point(city["lat"], city["lng"])
+
 async def seed_activities(cities):
     activities_data = []
     categories = ["Sightseeing", "Adventure", "Food & Dining", "Culture", "Shopping", "Entertainment", "Nature"]
     
     activity_templates = {
         "Paris": [
-            ("Eiffel Tower Visit", "Sightseeing", 25, "2-3 hours", "Iconic landmark with breathtaking views"),
-            ("Louvre Museum Tour", "Culture", 17, "3-4 hours", "World's largest art museum"),
-            ("Seine River Cruise", "Sightseeing", 15, "1 hour", "Romantic boat ride through Paris"),
-            ("Montmartre Walking Tour", "Culture", 30, "2-3 hours", "Explore historic artist quarter"),
+            ("Eiffel Tower Visit", "Sightseeing", 25, "2-3 hours", "Iconic landmark with breathtaking views", 48.8584, 2.2945),
+            ("Louvre Museum Tour", "Culture", 17, "3-4 hours", "World's largest art museum", 48.8606, 2.3376),
+            ("Seine River Cruise", "Sightseeing", 15, "1 hour", "Romantic boat ride through Paris", 48.861, 2.312),
+            ("Montmartre Walking Tour", "Culture", 30, "2-3 hours", "Explore historic artist quarter", 48.8867, 2.3431),
         ],
         "Tokyo": [
-            ("Tokyo Skytree", "Sightseeing", 20, "2 hours", "Tallest structure in Japan"),
-            ("Sushi Making Class", "Food & Dining", 80, "3 hours", "Learn authentic sushi preparation"),
-            ("Sensoji Temple Visit", "Culture", 0, "1-2 hours", "Ancient Buddhist temple"),
-            ("Shibuya Crossing Tour", "Sightseeing", 15, "2 hours", "Experience the world's busiest intersection"),
+            ("Tokyo Skytree", "Sightseeing", 20, "2 hours", "Tallest structure in Japan", 35.7101, 139.8107),
+            ("Sushi Making Class", "Food & Dining", 80, "3 hours", "Learn authentic sushi preparation", 35.6655, 139.7707),
+            ("Sensoji Temple Visit", "Culture", 0, "1-2 hours", "Ancient Buddhist temple", 35.7148, 139.7967),
+            ("Shibuya Crossing Tour", "Sightseeing", 15, "2 hours", "Experience the world's busiest intersection", 35.6595, 139.7005),
         ],
         "New York": [
-            ("Statue of Liberty", "Sightseeing", 25, "3-4 hours", "Iconic American symbol"),
-            ("Central Park Tour", "Nature", 0, "2-3 hours", "Urban oasis in Manhattan"),
-            ("Broadway Show", "Entertainment", 150, "2-3 hours", "World-class theater experience"),
-            ("Empire State Building", "Sightseeing", 42, "2 hours", "Legendary skyscraper with panoramic views"),
+            ("Statue of Liberty", "Sightseeing", 25, "3-4 hours", "Iconic American symbol", 40.6892, -74.0445),
+            ("Central Park Tour", "Nature", 0, "2-3 hours", "Urban oasis in Manhattan", 40.7829, -73.9654),
+            ("Broadway Show", "Entertainment", 150, "2-3 hours", "World-class theater experience", 40.759, -73.9845),
+            ("Empire State Building", "Sightseeing", 42, "2 hours", "Legendary skyscraper with panoramic views", 40.7484, -73.9857),
         ],
         "Barcelona": [
-            ("Sagrada Familia Tour", "Culture", 26, "2 hours", "Gaudi's masterpiece basilica"),
-            ("Park Güell Visit", "Sightseeing", 10, "2 hours", "Colorful park with mosaic art"),
-            ("Tapas Food Tour", "Food & Dining", 60, "3 hours", "Authentic Spanish cuisine experience"),
-            ("Gothic Quarter Walk", "Culture", 20, "2 hours", "Medieval streets and architecture"),
+            ("Sagrada Familia Tour", "Culture", 26, "2 hours", "Gaudi's masterpiece basilica", 41.4036, 2.1744),
+            ("Park Güell Visit", "Sightseeing", 10, "2 hours", "Colorful park with mosaic art", 41.4145, 2.1527),
+            ("Tapas Food Tour", "Food & Dining", 60, "3 hours", "Authentic Spanish cuisine experience", 41.385, 2.182),
+            ("Gothic Quarter Walk", "Culture", 20, "2 hours", "Medieval streets and architecture", 41.3833, 2.1777),
         ],
         "Bali": [
-            ("Ubud Rice Terraces", "Nature", 5, "2-3 hours", "Stunning emerald landscapes"),
-            ("Tanah Lot Temple", "Culture", 3, "1-2 hours", "Sea temple at sunset"),
-            ("Surfing Lesson", "Adventure", 35, "2 hours", "Learn to surf in paradise"),
-            ("Balinese Cooking Class", "Food & Dining", 40, "4 hours", "Traditional Indonesian cuisine"),
+            ("Ubud Rice Terraces", "Nature", 5, "2-3 hours", "Stunning emerald landscapes", -8.4312, 115.2793),
+            ("Tanah Lot Temple", "Culture", 3, "1-2 hours", "Sea temple at sunset", -8.6212, 115.0868),
+            ("Surfing Lesson", "Adventure", 35, "2 hours", "Learn to surf in paradise", -8.7184, 115.1686),
+            ("Balinese Cooking Class", "Food & Dining", 40, "4 hours", "Traditional Indonesian cuisine", -8.5069, 115.2625),
         ],
         "London": [
-            ("Tower of London", "Culture", 32, "3 hours", "Historic castle and crown jewels"),
-            ("British Museum", "Culture", 0, "2-3 hours", "World cultures and history"),
-            ("Thames River Cruise", "Sightseeing", 18, "1 hour", "See landmarks from the water"),
-            ("Afternoon Tea Experience", "Food & Dining", 45, "2 hours", "Traditional British tea service"),
+            ("Tower of London", "Culture", 32, "3 hours", "Historic castle and crown jewels", 51.5081, -0.0759),
+            ("British Museum", "Culture", 0, "2-3 hours", "World cultures and history", 51.5194, -0.127),
+            ("Thames River Cruise", "Sightseeing", 18, "1 hour", "See landmarks from the water", 51.5015, -0.1235),
+            ("Afternoon Tea Experience", "Food & Dining", 45, "2 hours", "Traditional British tea service", 51.5073, -0.1416),
         ],
         "Dubai": [
-            ("Burj Khalifa Observation", "Sightseeing", 40, "2 hours", "World's tallest building"),
-            ("Desert Safari", "Adventure", 70, "6 hours", "Dune bashing and BBQ dinner"),
-            ("Dubai Mall Shopping", "Shopping", 0, "3-4 hours", "Luxury shopping paradise"),
-            ("Gold Souk Visit", "Shopping", 0, "1-2 hours", "Traditional gold market"),
+            ("Burj Khalifa Observation", "Sightseeing", 40, "2 hours", "World's tallest building", 25.1972, 55.2744),
+            ("Desert Safari", "Adventure", 70, "6 hours", "Dune bashing and BBQ dinner", 24.988, 55.754),
+            ("Dubai Mall Shopping", "Shopping", 0, "3-4 hours", "Luxury shopping paradise", 25.1985, 55.2796),
+            ("Gold Souk Visit", "Shopping", 0, "1-2 hours", "Traditional gold market", 25.2697, 55.2972),
         ],
         "Sydney": [
-            ("Opera House Tour", "Culture", 25, "1 hour", "Iconic architectural marvel"),
-            ("Harbour Bridge Climb", "Adventure", 250, "3 hours", "Climb the famous bridge"),
-            ("Bondi Beach", "Nature", 0, "3-4 hours", "Famous surf beach"),
-            ("Taronga Zoo", "Entertainment", 50, "4 hours", "Wildlife with harbour views"),
+            ("Opera House Tour", "Culture", 25, "1 hour", "Iconic architectural marvel", -33.8568, 151.2153),
+            ("Harbour Bridge Climb", "Adventure", 250, "3 hours", "Climb the famous bridge", -33.8523, 151.2108),
+            ("Bondi Beach", "Nature", 0, "3-4 hours", "Famous surf beach", -33.8915, 151.2767),
+            ("Taronga Zoo", "Entertainment", 50, "4 hours", "Wildlife with harbour views", -33.8436, 151.2411),
         ],
         "Rome": [
-            ("Colosseum Tour", "Culture", 16, "2 hours", "Ancient Roman amphitheater"),
-            ("Vatican Museums", "Culture", 17, "3 hours", "Sistine Chapel and art treasures"),
-            ("Trevi Fountain Visit", "Sightseeing", 0, "30 min", "Baroque masterpiece"),
-            ("Food Tour in Trastevere", "Food & Dining", 55, "3 hours", "Authentic Roman cuisine"),
+            ("Colosseum Tour", "Culture", 16, "2 hours", "Ancient Roman amphitheater", 41.8902, 12.4922),
+            ("Vatican Museums", "Culture", 17, "3 hours", "Sistine Chapel and art treasures", 41.9065, 12.4536),
+            ("Trevi Fountain Visit", "Sightseeing", 0, "30 min", "Baroque masterpiece", 41.9009, 12.4833),
+            ("Food Tour in Trastevere", "Food & Dining", 55, "3 hours", "Authentic Roman cuisine", 41.8897, 12.47),
         ],
         "Bangkok": [
-            ("Grand Palace", "Culture", 15, "2-3 hours", "Ornate royal complex"),
-            ("Floating Market Tour", "Sightseeing", 25, "3 hours", "Traditional market on water"),
-            ("Thai Massage", "Entertainment", 20, "1-2 hours", "Authentic relaxation"),
-            ("Street Food Tour", "Food & Dining", 30, "3 hours", "Explore Bangkok's food scene"),
+            ("Grand Palace", "Culture", 15, "2-3 hours", "Ornate royal complex", 13.75, 100.4913),
+            ("Floating Market Tour", "Sightseeing", 25, "3 hours", "Traditional market on water", 13.5186, 99.956),
+            ("Thai Massage", "Entertainment", 20, "1-2 hours", "Authentic relaxation", 13.7465, 100.4927),
+            ("Street Food Tour", "Food & Dining", 30, "3 hours", "Explore Bangkok's food scene", 13.7398, 100.5105),
         ]
     }
     
     for city in cities:
         city_name = city['name']
         if city_name in activity_templates:
-            for activity_name, category, cost, duration, description in activity_templates[city_name]:
-                activities_data.append({
+            for activity_name, category, cost, duration, description, lat, lng in activity_templates[city_name]:
+                activities_data.append(normalize_activity({
                     "id": secrets.token_urlsafe(16),
                     "name": activity_name,
                     "city_id": city['id'],
@@ -194,8 +223,11 @@ async def seed_activities(cities):
                     "cost": float(cost),
                     "duration": duration,
                     "description": description,
-                    "image_url": city['image_url']
-                })
+                    "image_url": city['image_url'],
+                    "lat": lat,
+                    "lng": lng,
+                    "location": geo_point(lat, lng)
+                }))
     
     return activities_data
 
@@ -213,6 +245,12 @@ async def seed_database():
         await db.activities.insert_many(activities)
         print(f"Inserted {len(activities)} activities")
     
+    await db.cities.create_index([("location", "2dsphere")])
+    await db.activities.create_index([("location", "2dsphere"), ("category", 1), ("cost", 1)])
+    await db.activities.create_index([("city_id", 1), ("category", 1), ("cost", 1)])
+    await db.activities.create_index([("city_id", 1), ("duration_min", 1)])
+    print("Created catalog indexes")
+    
     print("Database seeding completed!")
 
 if __name__ == "__main__":
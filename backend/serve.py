@@ -0,0 +1,50 @@
+import importlib.util
+import os
+from typing import Optional
+
+import typer
+import uvicorn
+
+cli = typer.Typer(add_completion=False)
+
+def default_workers() -> int:
+    # Respect CPU affinity and container cpusets where the platform exposes them
+    if hasattr(os, "sched_getaffinity"):
+        return max(len(os.sched_getaffinity(0)), 1)
+    return max(os.cpu_count() or 1, 1)
+
+def pick_loop() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+def pick_http() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+@cli.command()
+def serve(
+    host: str = typer.Option("0.0.0.0", envvar="HOST"),
+    port: int = typer.Option(8001, envvar="PORT"),
+    workers: Optional[int] = typer.Option(None, envvar="WEB_CONCURRENCY", help="Defaults to one worker per available core"),
+    graceful_timeout: int = typer.Option(30, envvar="GRACEFUL_TIMEOUT", help="Seconds to let in-flight requests finish on shutdown"),
+    reload: bool = typer.Option(False, help="Single worker with auto-reload, for development"),
+):
+    worker_count = 1 if reload else (workers or default_workers())
+    if worker_count > 1 and os.environ.get("TRIP_EVENTS_BACKEND") == "local":
+        # Each worker would only hear its own trip events; sockets on the others miss them
+        raise typer.BadParameter("TRIP_EVENTS_BACKEND=local only works with a single worker; use mongo or --workers 1", param_hint="--workers")
+    typer.echo(f"Starting {worker_count} worker(s) on {host}:{port} (loop={pick_loop()}, http={pick_http()})")
+    uvicorn.run(
+        # The module-level app, so every worker builds it exactly once on import
+        "server:app",
+        host=host,
+        port=port,
+        workers=worker_count,
+        loop=pick_loop(),
+        http=pick_http(),
+        lifespan="on",
+        proxy_headers=True,
+        reload=reload,
+        timeout_graceful_shutdown=graceful_timeout,
+    )
+
+if __name__ == "__main__":
+    cli()
@@ -1,33 +1,159 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, File, Header, Query, Request, UploadFile, WebSocket, WebSocketDisconnect, WebSocketException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.concurrency import run_in_threadpool
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import ASCENDING, DESCENDING
+from gridfs.errors import NoFile
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr, ConfigDict
-from typing import List, Optional
-from datetime import datetime, timezone, timedelta
+from pydantic import BaseModel, BeforeValidator, Field, EmailStr, ConfigDict, create_model
+from typing import Annotated, Dict, List, Optional, Type
+from functools import lru_cache
+from itertools import compress
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone, timedelta
+import asyncio
 import bcrypt
+import numpy as np
 import jwt
 import secrets
+import tempfile
+import base64
+import json
+import media
+import route_optimizer
+import activity_planner
+import catalog
+import cost_estimator
+import currencies
+import schedule
+import stop_order
+import summaries
+import feeds
+import export
+import importer
+import repositories
+import jobs
+import trip_events
+import profiling
+from search_index import SearchIndex
 
 ROOT_DIR = Path(__file__).parent
+# Loaded before any setting below is read from the environment
 load_dotenv(ROOT_DIR / '.env')
 
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# STORAGE_BACKEND=memory serves the core API from in-process repositories, without MongoDB,
+# for unit tests and benchmarks of handler overhead. Geo, feed, import and media endpoints
+# still need MongoDB and answer 503 in memory mode.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+
+# Opened by the app lifespan; handlers look these up at call time
+client: Optional[AsyncIOMotorClient] = None
+db = None
+repos: Optional[repositories.Repositories] = None
+job_worker: Optional[jobs.JobWorker] = None
+trip_event_bus: Optional[trip_events.TripEventBus] = None
+media_bucket: Optional[AsyncIOMotorGridFSBucket] = None
+import_bucket: Optional[AsyncIOMotorGridFSBucket] = None
+search_indexes: dict = {}
+city_cost_stats: Optional[cost_estimator.CityCostStats] = None
+loop_monitor: Optional[profiling.LoopMonitor] = None
+memory_snapshots = profiling.MemorySnapshots()
+cpu_profile_lock = asyncio.Lock()
 
-app = FastAPI()
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
-JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
+DEFAULT_JWT_SECRET = 'your-secret-key-change-in-production'
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 720
 
+# Delta sync: cursors older than the tombstone retention force a full resync
+SYNC_COLLECTIONS = ["trips", "stops", "trip_activities", "trip_costs"]
+SYNC_PAGE_SIZE = 1000
+SYNC_CURSOR_LAG = timedelta(seconds=5)
+TOMBSTONE_RETENTION = timedelta(days=90)
+
+# Nearby search: k-nearest results are capped, radius is optional
+NEARBY_DEFAULT_LIMIT = 20
+NEARBY_MAX_LIMIT = 100
+
+# Public sort names for /activities, mapped to indexed fields
+ACTIVITY_SORT_KEYS = {"cost": "cost", "duration": "duration_min", "name": "name"}
+
+# Full-text search: field weights fold into term frequency; indexes rebuild on a timer
+CITY_SEARCH_FIELDS = {"name": 3.0, "country": 2.0, "region": 1.5, "description": 1.0}
+ACTIVITY_SEARCH_FIELDS = {"name": 3.0, "category": 2.0, "city_name": 1.5, "country": 1.5, "region": 1.0, "description": 1.0}
+SEARCH_MAX_LIMIT = 100
+SEARCH_REFRESH_SECONDS = int(os.environ.get('SEARCH_REFRESH_SECONDS', '600'))
+
+# City cost comparison reads per-city statistics rebuilt with the search indexes
+COMPARE_MAX_CITIES = 1000
+
+# Discovery feeds are materialized by a background refresh
+FEED_REFRESH_SECONDS = int(os.environ.get('FEED_REFRESH_SECONDS', '300'))
+FEED_MAX_LIMIT = 100
+
+# Exports resolve catalog names for this many trip activities at a time
+EXPORT_LOOKUP_BATCH = 500
+
+# Imports are kept in GridFS until they finish, so a failed import can be resumed from its checkpoint
+IMPORT_MAX_BYTES = int(os.environ.get('IMPORT_MAX_BYTES', str(200 * 1024 * 1024)))
+IMPORT_CHUNK_BYTES = 256 * 1024
+IMPORT_MAX_ATTEMPTS = 3
+
+# Deferred work runs from the durable jobs collection; JOB_WORKER_ENABLED=0 leaves it to other app instances
+JOB_WORKER_ENABLED = os.environ.get('JOB_WORKER_ENABLED', '1') != '0'
+JOB_CONCURRENCY = {"delete_trip": 4, "import_itinerary": 2, "rebalance_stops": 2}
+# Finished jobs stay pollable this long, then a TTL index on finished_at removes them
+JOB_RETENTION = timedelta(days=int(os.environ.get('JOB_RETENTION_DAYS', '7')))
+
+# Stop order keys are sparse floats; a trip whose keys get crowded is spread out again
+# by a job that waits out the burst of edits that crowded it
+STOP_REBALANCE_DELAY = timedelta(seconds=30)
+# A trip's cleanup job is queued held back by this much and released once the trip is
+# deleted; if the process dies in between, the job still runs when the delay is up
+TRIP_DELETE_JOB_DELAY = timedelta(minutes=1)
+TRIP_STOPS_MAX = 1000
+
+# Profiling routes are per worker and open only to the accounts listed in ADMIN_EMAILS.
+# The loop monitor always runs; stalls longer than the threshold are recorded with a stack
+LOOP_MONITOR_ENABLED = os.environ.get('LOOP_MONITOR_ENABLED', '1') != '0'
+LOOP_BLOCK_THRESHOLD = float(os.environ.get('LOOP_BLOCK_THRESHOLD_MS', '100')) / 1000
+CPU_PROFILE_MAX_SECONDS = 60
+CPU_PROFILE_FORMATS = {"collapsed": ("text/plain", "folded"), "speedscope": ("application/json", "speedscope.json")}
+MEMORY_GROUPINGS = ["lineno", "filename", "traceback"]
+
+# Trip change events reach sockets on other workers only through the mongo backend;
+# local keeps them within this process, which is all a single worker needs.
+# Memory storage always uses local, having no database to broadcast through
+TRIP_EVENTS_BACKEND = os.environ.get('TRIP_EVENTS_BACKEND', 'mongo')
+
+# Trip lists and the calendar page through index range scans
+TRIP_LIST_MAX_LIMIT = 100
+CALENDAR_MAX_DAYS = 366
+
+# Trip, stop and activity dates are stored as BSON dates at midnight UTC and exchanged as YYYY-MM-DD
+def date_string(value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    return value
+
+StoredDate = Annotated[str, BeforeValidator(date_string)]
+
+# Audit stamps are isoformat strings, except where a TTL index needs a BSON date
+def timestamp_string(value):
+    if isinstance(value, datetime):
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+    return value
+
+StoredTimestamp = Annotated[str, BeforeValidator(timestamp_string)]
+
 # Pydantic Models
 class UserSignup(BaseModel):
     name: str
@@ -44,7 +170,10 @@ class UserResponse(BaseModel):
     name: str
     email: str
     profile_photo: Optional[str] = None
+    currency: str = currencies.BASE_CURRENCY
     created_at: str
+    updated_at: Optional[str] = None
+    version: int = 0
 
 class AuthResponse(BaseModel):
     token: str
@@ -71,51 +200,101 @@ class TripResponse(BaseModel):
     user_id: str
     name: str
     description: Optional[str] = None
-    start_date: str
-    end_date: str
+    start_date: StoredDate
+    end_date: StoredDate
     cover_photo: Optional[str] = None
     is_public: bool
     share_token: str
     created_at: str
+    updated_at: Optional[str] = None
+    version: int = 0
+
+class CloneTripRequest(BaseModel):
+    name: Optional[str] = None
+    start_date: Optional[str] = None
 
 class StopCreate(BaseModel):
     city_id: str
     start_date: str
     end_date: str
-    order: int
+    # Any key between the neighbours' keys; omitted appends the stop after the last one
+    order: Optional[float] = None
 
 class StopResponse(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str
     trip_id: str
     city_id: str
-    start_date: str
-    end_date: str
-    order: int
+    start_date: StoredDate
+    end_date: StoredDate
+    order: float
     city_name: Optional[str] = None
     city_country: Optional[str] = None
+    updated_at: Optional[str] = None
+
+class StopOrderUpdate(BaseModel):
+    stop_ids: List[str] = Field(..., max_length=TRIP_STOPS_MAX)
+
+class StopOrderEntry(BaseModel):
+    id: str
+    order: float
+
+class StopOrderResponse(BaseModel):
+    stops: List[StopOrderEntry]
+    moved: int
+
+class OptimizeRouteRequest(BaseModel):
+    keep_start: bool = True
+    keep_end: bool = False
+
+class OptimizeRouteResponse(BaseModel):
+    stops: List[StopResponse]
+    previous_distance_km: float
+    total_distance_km: float
 
 class TripActivityCreate(BaseModel):
     activity_id: str
     date: str
     time: Optional[str] = None
+    duration_minutes: Optional[int] = Field(None, ge=1, le=schedule.MINUTES_PER_DAY)
     cost: float
+    currency: Optional[str] = None
     notes: Optional[str] = None
 
 class TripActivityResponse(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str
     stop_id: str
+    trip_id: Optional[str] = None
     activity_id: str
-    date: str
+    date: StoredDate
     time: Optional[str] = None
+    duration_minutes: Optional[int] = None
     cost: float
+    currency: str = currencies.BASE_CURRENCY
+    display_cost: Optional[float] = None
+    display_currency: Optional[str] = None
     notes: Optional[str] = None
     activity_name: Optional[str] = None
+    updated_at: Optional[str] = None
+    conflicts: Optional[List[str]] = None
+
+class FreeSlotResponse(BaseModel):
+    start: str
+    end: str
+    minutes: int
+
+class AutoPlanRequest(BaseModel):
+    daily_budget: float = Field(..., ge=0)
+    currency: Optional[str] = None
+    categories: List[str] = []
+    max_minutes_per_day: int = Field(480, ge=30, le=960)
+    day_start: str = Field("09:00", pattern=r"^([01]\d|2[0-3]):[0-5]\d$")
 
 class TripCostCreate(BaseModel):
     category: str
     amount: float
+    currency: Optional[str] = None
     description: Optional[str] = None
 
 class TripCostResponse(BaseModel):
@@ -124,7 +303,11 @@ class TripCostResponse(BaseModel):
     trip_id: str
     category: str
     amount: float
+    currency: str = currencies.BASE_CURRENCY
+    display_amount: Optional[float] = None
+    display_currency: Optional[str] = None
     description: Optional[str] = None
+    updated_at: Optional[str] = None
 
 class CityResponse(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -136,6 +319,8 @@ class CityResponse(BaseModel):
     popularity: int
     description: Optional[str] = None
     image_url: Optional[str] = None
+    lat: Optional[float] = None
+    lng: Optional[float] = None
 
 class ActivityResponse(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -144,13 +329,823 @@ class ActivityResponse(BaseModel):
     city_id: str
     category: str
     cost: float
+    currency: str = currencies.BASE_CURRENCY
+    display_cost: Optional[float] = None
+    display_currency: Optional[str] = None
     duration: Optional[str] = None
+    duration_min: Optional[int] = None
+    duration_max: Optional[int] = None
     description: Optional[str] = None
     image_url: Optional[str] = None
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+
+class CityCompareRequest(BaseModel):
+    city_ids: List[str] = Field(..., min_length=1, max_length=COMPARE_MAX_CITIES)
+    days: int = Field(..., ge=1, le=365)
+    style: str = Field("moderate", pattern="^(budget|moderate|luxury)$")
+    currency: Optional[str] = None
+
+class CityCostEstimate(BaseModel):
+    city_id: str
+    name: Optional[str] = None
+    country: Optional[str] = None
+    cost_index: float
+    activity_count: int
+    daily_living: float
+    daily_activities: float
+    daily_total: float
+    total: float
+
+class CityCompareResponse(BaseModel):
+    days: int
+    style: str
+    currency: str
+    rates_version: str
+    results: List[CityCostEstimate]
+
+class CitySearchHit(CityResponse):
+    score: float
+
+class ActivitySearchHit(ActivityResponse):
+    score: float
+
+class CitySearchResponse(BaseModel):
+    total: int
+    offset: int
+    limit: int
+    results: List[CitySearchHit]
+
+class ActivitySearchResponse(BaseModel):
+    total: int
+    offset: int
+    limit: int
+    results: List[ActivitySearchHit]
+
+class NearbyCityResponse(CityResponse):
+    distance_m: float
+
+class NearbyActivityResponse(ActivityResponse):
+    distance_m: float
 
 class UserProfileUpdate(BaseModel):
     name: Optional[str] = None
     profile_photo: Optional[str] = None
+    currency: Optional[str] = None
+
+class TombstoneResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    collection: str
+    updated_at: str
+
+class SyncResponse(BaseModel):
+    cursor: str
+    has_more: bool
+    reset: bool
+    trips: List[TripResponse]
+    stops: List[StopResponse]
+    trip_activities: List[TripActivityResponse]
+    trip_costs: List[TripCostResponse]
+    deleted: List[TombstoneResponse]
+
+class CityRankingResponse(BaseModel):
+    city_id: str
+    name: str
+    country: str
+    region: Optional[str] = None
+    image_url: Optional[str] = None
+    trip_count: int
+    score: float
+
+class PublicTripResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    name: str
+    description: Optional[str] = None
+    cover_photo: Optional[str] = None
+    share_token: str
+    start_date: StoredDate
+    end_date: StoredDate
+    stop_count: int
+    city_names: List[str] = []
+    published_at: Optional[str] = None
+
+class SummaryResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    stops: int = 0
+    activities: int = 0
+    costs: int = 0
+    total_spend: float = 0.0
+    spend_by_category: Dict[str, float] = {}
+    currency: str = currencies.BASE_CURRENCY
+    rates_version: Optional[str] = None
+    updated_at: Optional[str] = None
+
+class UserSummaryResponse(SummaryResponse):
+    trips: int = 0
+
+class TripSummaryResponse(SummaryResponse):
+    trip_id: str
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportResponse(BaseModel):
+    id: str
+    filename: str
+    format: str
+    status: str
+    rows_done: int = 0
+    counts: Dict[str, int] = {}
+    error_count: int = 0
+    errors: List[ImportRowError] = []
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+    finished_at: Optional[str] = None
+
+class JobResponse(BaseModel):
+    id: str
+    type: str
+    status: str
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = None
+    result: Optional[dict] = None
+    created_at: str
+    updated_at: str
+    finished_at: Optional[StoredTimestamp] = None
+
+class AllocationStat(BaseModel):
+    file: str
+    line: int
+    size_kb: float
+    count: int
+    size_diff_kb: Optional[float] = None
+    count_diff: Optional[int] = None
+    traceback: Optional[List[str]] = None
+
+class MemorySnapshotResponse(BaseModel):
+    id: str
+    pid: int
+    taken_at: str
+    traced_kb: float
+    top: List[AllocationStat]
+
+class MemoryDiffResponse(BaseModel):
+    id: str
+    against: str
+    pid: int
+    top: List[AllocationStat]
+
+class LoopBlock(BaseModel):
+    started_at: str
+    duration_ms: float
+    stack: List[str]
+
+class LoopStatsResponse(BaseModel):
+    pid: int
+    interval_ms: float
+    threshold_ms: float
+    samples: int
+    lag_p50_ms: float
+    lag_p99_ms: float
+    lag_max_ms: float
+    blocked: List[LoopBlock]
+
+class ModelCount(BaseModel):
+    model: str
+    count: int
+
+class ModelCountsResponse(BaseModel):
+    pid: int
+    total: int
+    models: List[ModelCount]
+
+class CurrencyRatesResponse(BaseModel):
+    version: str
+    base: str
+    rates: Dict[str, float]
+
+class MediaResponse(BaseModel):
+    id: str
+    url: str
+    thumbnail_url: Optional[str] = None
+    content_type: str
+    length: int
+
+# Sparse fieldset helpers
+# Response fields filled in at read time, mapped to the stored keys they are computed from
+DERIVED_FIELDS = {
+    "city_name": ("city_id",),
+    "city_country": ("city_id",),
+    "activity_name": ("activity_id",),
+    "display_cost": ("cost", "currency"),
+    "display_amount": ("amount", "currency"),
+    "display_currency": ("currency",)
+}
+
+def parse_fields(fields: Optional[str], model: Type[BaseModel]) -> Optional[frozenset]:
+    if fields is None:
+        return None
+    selected = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = selected - model.model_fields.keys()
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return frozenset(selected | {"id"})
+
+def fields_projection(selected: Optional[frozenset]) -> dict:
+    projection = {"_id": 0}
+    if selected is not None:
+        for field in selected:
+            for key in DERIVED_FIELDS.get(field, (field,)):
+                projection[key] = 1
+    return projection
+
+def wants_any(selected: Optional[frozenset], *names: str) -> bool:
+    return selected is None or any(name in selected for name in names)
+
+@lru_cache(maxsize=256)
+def sparse_model(model: Type[BaseModel], selected: frozenset) -> Type[BaseModel]:
+    # Keep validators such as StoredDate's, which live in the field metadata rather than the annotation
+    definitions = {name: (Annotated[(info.annotation, *info.metadata)] if info.metadata else info.annotation, None) for name, info in model.model_fields.items() if name in selected}
+    return create_model(f"Sparse{model.__name__}", __config__=ConfigDict(extra="ignore"), **definitions)
+
+def sparse_response(model: Type[BaseModel], data, selected: Optional[frozenset]):
+    if selected is None:
+        if isinstance(data, list):
+            return [model(**doc) for doc in data]
+        return model(**data)
+    sparse = sparse_model(model, selected)
+    if isinstance(data, list):
+        return JSONResponse([sparse(**doc).model_dump() for doc in data])
+    return JSONResponse(sparse(**data).model_dump())
+
+# Optimistic concurrency helpers
+# Documents written before versioning have no version field and report version 0
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip().removeprefix("W/").strip('"')
+    try:
+        return int(tag)
+    except ValueError:
+        raise HTTPException(status_code=412, detail="Precondition failed")
+
+def version_filter(expected_version: Optional[int]) -> dict:
+    if expected_version is None:
+        return {}
+    if expected_version == 0:
+        return {"version": {"$in": [0, None]}}
+    return {"version": expected_version}
+
+async def versioned_update(repository: repositories.Repository, query: dict, changes: dict, expected_version: Optional[int], fields: Optional[dict], not_found: str) -> dict:
+    match = {**query, **version_filter(expected_version)}
+    if changes:
+        doc = await repository.update(match, {**changes, "updated_at": datetime.now(timezone.utc).isoformat()}, {"version": 1}, fields)
+    else:
+        doc = await repository.get(match, fields)
+    
+    if not doc:
+        if expected_version is not None and await repository.count(query, limit=1):
+            raise HTTPException(status_code=412, detail="Resource was modified by another request")
+        raise HTTPException(status_code=404, detail=not_found)
+    return doc
+
+async def versioned_media_update(repository: repositories.Repository, query: dict, changes: dict, expected_version: Optional[int], fields: Optional[dict], not_found: str, stored_urls: List[str]) -> dict:
+    # Uploads are stored before the version check; if it fails nothing references them
+    try:
+        return await versioned_update(repository, query, changes, expected_version, fields, not_found)
+    except HTTPException:
+        for url in stored_urls:
+            await media.discard(media_bucket, url)
+        raise
+
+def set_etag(response: Response, doc: dict):
+    response.headers["ETag"] = f'"{doc.get("version", 0)}"'
+
+# Delta sync helpers
+async def record_tombstones(collection_name: str, ids: List[str], user_id: str):
+    if not ids:
+        return
+    now = datetime.now(timezone.utc)
+    await repos.tombstones.insert_many([
+        {
+            "id": doc_id,
+            "collection": collection_name,
+            "user_id": user_id,
+            "updated_at": now.isoformat(),
+            "expires_at": now + TOMBSTONE_RETENTION
+        }
+        for doc_id in ids
+    ])
+
+def encode_sync_cursor(positions: dict) -> str:
+    payload = json.dumps({name: list(position) for name, position in positions.items()}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_sync_cursor(cursor: str) -> dict:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return {name: (str(ts), str(last_id)) for name, (ts, last_id) in payload.items() if name in SYNC_COLLECTIONS + ["tombstones"]}
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+
+def range_filter(low, high) -> dict:
+    bounds = {}
+    if low is not None:
+        bounds["$gte"] = low
+    if high is not None:
+        bounds["$lte"] = high
+    return bounds
+
+# Trip event helpers
+# Sockets receive {"collection", "op", "id", "data"}: creates carry the new document,
+# updates only the fields they changed, deletes no data
+def trip_event(collection_name: str, op: str, doc_id: str, data: Optional[dict] = None) -> dict:
+    return {"collection": collection_name, "op": op, "id": doc_id, "data": data}
+
+def created_event(collection_name: str, model: BaseModel) -> dict:
+    return trip_event(collection_name, "created", model.id, model.model_dump(mode="json", exclude_none=True))
+
+def updated_event(collection_name: str, model: BaseModel, changes: dict) -> dict:
+    return trip_event(collection_name, "updated", model.id, model.model_dump(mode="json", include=set(changes) | {"version", "updated_at"}))
+
+async def publish_trip_events(trip_id: str, events: List[dict]):
+    if trip_event_bus:
+        await trip_event_bus.publish(trip_id, events)
+
+async def wait_for_disconnect(websocket: WebSocket):
+    # Clients only ever listen; anything they send is ignored
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+async def stream_trip_events(websocket: WebSocket, queue: asyncio.Queue, shared: bool):
+    disconnected = asyncio.create_task(wait_for_disconnect(websocket))
+    try:
+        while True:
+            next_event = asyncio.create_task(queue.get())
+            await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                return
+            event = next_event.result()
+            await websocket.send_json(event)
+            if event.get("collection") == "trips":
+                if event["op"] == "deleted" or (shared and event["data"].get("is_public") is False):
+                    await websocket.close()
+                    return
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnected.cancel()
+
+# Currency helpers
+# Line items keep the amount and currency they were entered in, plus the base currency value
+# they were worth when written; reads convert to the display currency at current rates
+def parse_currency(code: str) -> str:
+    code = code.strip().upper()
+    if code not in currencies.rate_table():
+        raise HTTPException(status_code=422, detail=f"Unsupported currency: {code}")
+    return code
+
+def convert_for_display(docs: List[dict], amount_field: str, display_field: str, target: str):
+    if not docs:
+        return
+    rates = currencies.rate_table()
+    # A currency dropped from the rates since the row was written cannot be converted;
+    # such rows show their stored amount, in the currency it was entered in
+    for doc in docs:
+        doc[display_field] = doc[amount_field] or 0
+        doc["display_currency"] = doc.get("currency")
+    docs = list(compress(docs, rates.convertible([doc.get("currency") for doc in docs])))
+    converted = rates.convert([doc[amount_field] or 0 for doc in docs], [doc.get("currency") for doc in docs], target)
+    for doc, value in zip(docs, converted.tolist()):
+        doc[display_field] = value
+        doc["display_currency"] = target
+
+def convert_summary(summary: dict, target: str) -> dict:
+    # Summaries are kept in the base currency; the total and every category convert in one multiply
+    rates = currencies.rate_table()
+    categories = list(summary.get("spend_by_category", {}).items())
+    base_values = [summary.get("total_spend", 0.0)] + [amount for _, amount in categories]
+    total, *converted = rates.convert(base_values, [rates.base] * len(base_values), target).tolist()
+    return {
+        **summary,
+        "total_spend": total,
+        "spend_by_category": {category: value for (category, _), value in zip(categories, converted)},
+        "currency": target,
+        "rates_version": rates.version
+    }
+
+# Summary helpers
+# Dashboard counters are kept current with $inc; reconcile_summaries.py rebuilds them from scratch
+async def bump_summaries(user_id: str, trip_id: Optional[str], spend: Optional[dict] = None, **counts: int):
+    inc = summaries.summary_inc(spend, **counts)
+    if not inc:
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    trip_inc = {k: v for k, v in inc.items() if k != "trips"}
+    writes = [repos.user_summaries.update({"user_id": user_id}, {"updated_at": now}, inc, upsert=True)]
+    if trip_id and trip_inc:
+        writes.append(repos.trip_summaries.update({"trip_id": trip_id}, {"user_id": user_id, "updated_at": now}, trip_inc, upsert=True))
+    await asyncio.gather(*writes)
+
+# Export helpers
+async def name_export_activities(batch: List[dict], stop_cities: dict) -> List[tuple]:
+    activity_ids = list({ta['activity_id'] for ta in batch})
+    activities = await repos.activities.find({"id": {"$in": activity_ids}}, {"id": 1, "name": 1, "category": 1})
+    by_id = {activity['id']: activity for activity in activities}
+    records = []
+    for ta in batch:
+        activity = by_id.get(ta['activity_id'], {})
+        city = stop_cities.get(ta['stop_id'], {})
+        records.append(("activity", {**ta, "activity_name": activity.get('name'), "category": activity.get('category'), "city_name": city.get('name'), "city_country": city.get('country')}))
+    return records
+
+async def export_records(trip_query: dict):
+    # Streams trip, stop, activity and cost records in order; memory is bounded by one lookup batch
+    cities = {}
+    async for trip in repos.trips.iterate(trip_query, {"cover_photo": 0}, sort=[("start_date", ASCENDING), ("id", ASCENDING)]):
+        yield "trip", trip
+        
+        stop_cities = {}
+        async for stop in repos.stops.iterate({"trip_id": trip['id']}, sort="order"):
+            if stop['city_id'] not in cities:
+                cities[stop['city_id']] = await repos.cities.get({"id": stop['city_id']}, {"name": 1, "country": 1}) or {}
+            city = stop_cities[stop['id']] = cities[stop['city_id']]
+            yield "stop", {**stop, "city_name": city.get('name'), "city_country": city.get('country')}
+        
+        batch = []
+        async for ta in repos.trip_activities.iterate({"trip_id": trip['id']}, sort=[("date", ASCENDING), ("time", ASCENDING)]):
+            batch.append(ta)
+            if len(batch) >= EXPORT_LOOKUP_BATCH:
+                for record in await name_export_activities(batch, stop_cities):
+                    yield record
+                batch = []
+        if batch:
+            for record in await name_export_activities(batch, stop_cities):
+                yield record
+        
+        async for cost in repos.trip_costs.iterate({"trip_id": trip['id']}):
+            yield "cost", cost
+
+def export_response(trip_query: dict, export_format: str, filename: str) -> StreamingResponse:
+    media_type, extension, render = export.EXPORT_FORMATS[export_format]
+    return StreamingResponse(
+        render(export_records(trip_query)),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'}
+    )
+
+# Import helpers
+async def store_import_upload(upload: UploadFile, import_id: str, user_id: str) -> int:
+    grid_in = import_bucket.open_upload_stream_with_id(import_id, upload.filename or import_id, metadata={"owner_id": user_id})
+    length = 0
+    try:
+        while chunk := await upload.read(IMPORT_CHUNK_BYTES):
+            length += len(chunk)
+            if length > IMPORT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="File too large")
+            await grid_in.write(chunk)
+    except BaseException:
+        await grid_in.abort()
+        raise
+    await grid_in.close()
+    return length
+
+# Job helpers
+async def enqueue_job(job_type: str, payload: dict, user_id: str, **options) -> dict:
+    job = await jobs.enqueue(repos.jobs, job_type, payload, user_id, **options)
+    if job_worker:
+        job_worker.notify()
+    return job
+
+async def start_job_now(job: dict):
+    await jobs.run_now(repos.jobs, job["id"])
+    if job_worker:
+        job_worker.notify()
+
+async def delete_trip_children(job: dict) -> dict:
+    trip_id = job["payload"]["trip_id"]
+    # Only reachable when the delete that released this job never landed; retry later
+    if await repos.trips.get({"id": trip_id}, {"id": 1}):
+        raise RuntimeError(f"Trip {trip_id} has not been deleted yet")
+    stop_ids = await repos.stops.distinct("id", {"trip_id": trip_id})
+    trip_activity_ids = await repos.trip_activities.distinct("id", {"stop_id": {"$in": stop_ids}})
+    cost_ids = await repos.trip_costs.distinct("id", {"trip_id": trip_id})
+    
+    # Tombstones go first, so a retry after a crash still finds the documents it has to record
+    await record_tombstones("stops", stop_ids, job["user_id"])
+    await record_tombstones("trip_activities", trip_activity_ids, job["user_id"])
+    await record_tombstones("trip_costs", cost_ids, job["user_id"])
+    
+    await repos.trip_activities.delete_many({"stop_id": {"$in": stop_ids}})
+    await repos.stops.delete_many({"trip_id": trip_id})
+    await repos.trip_costs.delete_many({"trip_id": trip_id})
+    return {"stops": len(stop_ids), "trip_activities": len(trip_activity_ids), "trip_costs": len(cost_ids)}
+
+async def import_itinerary(job: dict) -> dict:
+    import_id = job["payload"]["import_id"]
+    import_doc = await db.imports.find_one({"id": import_id}, {"_id": 0, "errors": 0})
+    if import_doc["status"] == "completed":
+        return {"rows_done": import_doc["rows_done"]}
+    try:
+        with tempfile.NamedTemporaryFile(suffix=f".{import_doc['format']}") as local:
+            await import_bucket.download_to_stream(import_id, local)
+            local.flush()
+            # Each attempt resumes after the rows the previous one checkpointed
+            import_doc = await importer.run_import(db, import_doc, local.name)
+    except Exception as exc:
+        await db.imports.update_one(
+            {"id": import_id},
+            {"$set": {"status": "failed", "error": str(exc), "updated_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        raise
+    await import_bucket.delete(import_id)
+    return {"rows_done": import_doc["rows_done"], "error_count": import_doc["error_count"]}
+
+async def rebalance_stops(job: dict) -> dict:
+    trip_id = job["payload"]["trip_id"]
+    stops = await repos.stops.find({"trip_id": trip_id}, {"id": 1, "order": 1}, sort=[("order", ASCENDING), ("id", ASCENDING)])
+    now = datetime.now(timezone.utc).isoformat()
+    # Guarded by the old key, so a stop moved since the read keeps the place it was moved to
+    updates = [
+        ({"id": stop['id'], "order": stop['order']}, {"order": key, "updated_at": now})
+        for stop, key in zip(stops, stop_order.spread(len(stops))) if stop['order'] != key
+    ]
+    await repos.stops.update_each(updates)
+    await publish_trip_events(trip_id, [trip_event("stops", "updated", query["id"], changes) for query, changes in updates])
+    return {"stops": len(updates)}
+
+async def schedule_stop_rebalance(trip_id: str, user_id: str):
+    # Every edit into a crowded gap asks again; the one pending job covers them all
+    pending = await repos.jobs.count({"type": "rebalance_stops", "payload.trip_id": trip_id, "status": {"$in": jobs.ACTIVE_STATUSES}}, limit=1)
+    if not pending:
+        await enqueue_job("rebalance_stops", {"trip_id": trip_id}, user_id, delay=STOP_REBALANCE_DELAY)
+
+JOB_HANDLERS = {"delete_trip": delete_trip_children, "import_itinerary": import_itinerary, "rebalance_stops": rebalance_stops}
+
+# Search helpers
+# Everything derived from the whole catalog is rebuilt together, from one read of it
+async def build_catalog_indexes():
+    global city_cost_stats
+    cities = await repos.cities.find({}, {"id": 1, "name": 1, "country": 1, "region": 1, "description": 1, "popularity": 1, "cost_index": 1})
+    activities = await repos.activities.find({}, {"id": 1, "name": 1, "city_id": 1, "category": 1, "description": 1, "popularity": 1, "cost": 1, "currency": 1})
+    
+    rates = currencies.rate_table()
+    activity_costs = rates.convert([activity.get('cost') or 0 for activity in activities], [activity.get('currency') for activity in activities], rates.base)
+    cost_stats = await run_in_threadpool(cost_estimator.CityCostStats.build, cities, [activity['city_id'] for activity in activities], activity_costs)
+    
+    # Activities are found by where they are too, and rank by their city's popularity unless they carry their own
+    cities_by_id = {city['id']: city for city in cities}
+    for activity in activities:
+        city = cities_by_id.get(activity['city_id'], {})
+        activity['city_name'] = city.get('name')
+        activity['country'] = city.get('country')
+        activity['region'] = city.get('region')
+        if activity.get('popularity') is None:
+            activity['popularity'] = city.get('popularity')
+    
+    city_index = await run_in_threadpool(SearchIndex.build, cities, CITY_SEARCH_FIELDS, ["country", "region"])
+    activity_index = await run_in_threadpool(SearchIndex.build, activities, ACTIVITY_SEARCH_FIELDS, ["city_id", "category"])
+    search_indexes.update({"cities": city_index, "activities": activity_index})
+    city_cost_stats = cost_stats
+    logger.info(f"Catalog indexes built: {len(city_index)} cities, {len(activity_index)} activities")
+
+async def refresh_catalog_indexes():
+    while True:
+        await asyncio.sleep(SEARCH_REFRESH_SECONDS)
+        try:
+            await build_catalog_indexes()
+        except Exception:
+            logger.exception("Catalog index refresh failed; keeping the previous indexes")
+
+async def refresh_feeds_periodically():
+    while True:
+        try:
+            window = await feeds.refresh_feeds(db)
+            if window:
+                logger.info(f"Discovery feeds refreshed through {window['to']}")
+        except Exception:
+            logger.exception("Discovery feed refresh failed; the next run retries the same window")
+        await asyncio.sleep(FEED_REFRESH_SECONDS)
+
+async def run_search(collection_name: str, q: str, filters: dict, offset: int, limit: int):
+    index = search_indexes.get(collection_name)
+    if index is None:
+        raise HTTPException(status_code=503, detail="Search index is not ready")
+    
+    total, hits = index.search(q, {k: v for k, v in filters.items() if v is not None}, offset, limit)
+    ids = [doc_id for doc_id, _ in hits]
+    docs = await repos[collection_name].find({"id": {"$in": ids}}, {"location": 0})
+    docs_by_id = {doc['id']: doc for doc in docs}
+    # Keep index order; skip anything deleted since the last rebuild
+    return total, [{**docs_by_id[doc_id], "score": score} for doc_id, score in hits if doc_id in docs_by_id]
+
+# Geo helpers
+def geo_near_pipeline(lat: float, lng: float, radius_km: Optional[float], limit: int, query: dict) -> list:
+    geo_near = {
+        "near": {"type": "Point", "coordinates": [lng, lat]},
+        "distanceField": "distance_m",
+        "spherical": True,
+        "key": "location",
+        "query": query
+    }
+    if radius_km is not None:
+        geo_near["maxDistance"] = radius_km * 1000
+    return [
+        {"$geoNear": geo_near},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "location": 0}}
+    ]
+
+# Date helpers
+def parse_day(value: str) -> date:
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Dates must be YYYY-MM-DD")
+
+def to_bson_date(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+def stored_day(value) -> date:
+    # Strings are documents that migrate_dates.py has not converted yet
+    if isinstance(value, datetime):
+        return value.date()
+    return date.fromisoformat(value[:10])
+
+def shift_stored_date(value, shift: timedelta) -> datetime:
+    return to_bson_date(stored_day(value) + shift)
+
+# Auto-planner helpers
+def parse_stop_dates(stop: dict):
+    try:
+        return stored_day(stop['start_date']), stored_day(stop['end_date'])
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Stop {stop['id']} has unparseable dates")
+
+def activity_minutes(activity: dict) -> int:
+    # Pack with the upper bound so a day never overruns
+    if activity.get('duration_max') is not None:
+        return activity['duration_max']
+    parsed = catalog.parse_duration(activity.get('duration'))
+    return parsed[1] if parsed else catalog.DEFAULT_DURATION_MINUTES
+
+def booked_minutes(ta: dict, minutes_by_activity: Dict[str, int]) -> int:
+    # Bookings made before durations were stored fall back to the catalog entry
+    return ta.get('duration_minutes') or minutes_by_activity.get(ta['activity_id'], catalog.DEFAULT_DURATION_MINUTES)
+
+def booking_interval(ta: dict, minutes_by_activity: Dict[str, int]) -> Optional[tuple]:
+    start = schedule.parse_clock(ta.get('time'))
+    if start is None:
+        return None
+    return (start, min(start + booked_minutes(ta, minutes_by_activity), schedule.MINUTES_PER_DAY), ta['id'])
+
+# day_schedules maps (trip_id, date) to the timed intervals of that whole trip day, as
+# load_day_schedule sees them; planned items join it, so later stops steer clear of them too
+def plan_stop(stop: dict, city_activities: List[dict], booked: List[dict], day_schedules: dict, minutes_by_activity: Dict[str, int], options: AutoPlanRequest, daily_budget: float, user_id: str) -> List[dict]:
+    start, end = parse_stop_dates(stop)
+    days = (end - start).days + 1
+    if days <= 0:
+        return []
+    
+    booked_ids = {ta['activity_id'] for ta in booked}
+    candidates = [activity for activity in city_activities if activity['id'] not in booked_ids]
+    # Planned in the base currency, whatever each catalog price is quoted in; a price in a
+    # currency the rates no longer cover cannot be budgeted, so that activity sits this plan out
+    rates = currencies.rate_table()
+    candidates = list(compress(candidates, rates.convertible([activity.get('currency') for activity in candidates])))
+    if not candidates:
+        return []
+    
+    budget_used = np.zeros(days)
+    minutes_used = np.zeros(days, dtype=np.int64)
+    for ta in booked:
+        try:
+            day = (stored_day(ta['date']) - start).days
+        except ValueError:
+            continue
+        if 0 <= day < days:
+            budget_used[day] += ta.get('base_cost', ta.get('cost')) or 0
+            minutes_used[day] += booked_minutes(ta, minutes_by_activity)
+    
+    costs = rates.convert([activity['cost'] for activity in candidates], [activity.get('currency') for activity in candidates], rates.base)
+    minutes = np.array([minutes_by_activity[activity['id']] for activity in candidates], dtype=np.int64)
+    scores = activity_planner.score_activities([activity['category'] for activity in candidates], costs, options.categories)
+    day_start = schedule.parse_clock(options.day_start)
+    trip_activity_ids = {}
+    
+    def place(index: int, day: int) -> Optional[int]:
+        # Earliest gap from day_start that holds the whole activity; a day with none before midnight is skipped
+        intervals = day_schedules.setdefault((stop['trip_id'], start + timedelta(days=day)), [])
+        free = schedule.DayIntervals(intervals).free_slots(day_start, schedule.MINUTES_PER_DAY, int(minutes[index]))
+        if not free:
+            return None
+        clock = free[0][0]
+        trip_activity_ids[index] = secrets.token_urlsafe(16)
+        intervals.append((clock, clock + int(minutes[index]), trip_activity_ids[index]))
+        return clock
+    
+    plan = activity_planner.plan_days(costs, minutes, scores, days, daily_budget, options.max_minutes_per_day, budget_used, minutes_used, place)
+    
+    now = datetime.now(timezone.utc).isoformat()
+    docs = []
+    for slot in plan:
+        activity = candidates[slot.index]
+        docs.append({
+            "id": trip_activity_ids[slot.index],
+            "stop_id": stop['id'],
+            "trip_id": stop['trip_id'],
+            "user_id": user_id,
+            "activity_id": activity['id'],
+            "date": to_bson_date(start + timedelta(days=slot.day)),
+            "time": schedule.format_clock(slot.start_minute),
+            "duration_minutes": int(minutes[slot.index]),
+            "cost": activity['cost'],
+            "currency": activity.get('currency') or currencies.BASE_CURRENCY,
+            "base_cost": float(costs[slot.index]),
+            "notes": "Auto-planned",
+            "updated_at": now,
+            "activity_name": activity['name']
+        })
+    return docs
+
+async def auto_plan_stops(stops: List[dict], options: AutoPlanRequest, budget_currency: str, user_id: str) -> List[TripActivityResponse]:
+    # One catalog read and one booking read for every stop, then a single insert
+    daily_budget = currencies.rate_table().to_base(options.daily_budget, budget_currency)
+    city_ids = list({stop['city_id'] for stop in stops})
+    activities = await repos.activities.find({"city_id": {"$in": city_ids}}, {"id": 1, "name": 1, "city_id": 1, "category": 1, "cost": 1, "currency": 1, "duration": 1, "duration_max": 1})
+    # Every booking of the trips, not just these stops: the conflict check is per trip day
+    booked = await repos.trip_activities.find(
+        {"trip_id": {"$in": list({stop['trip_id'] for stop in stops})}},
+        {"id": 1, "trip_id": 1, "stop_id": 1, "activity_id": 1, "date": 1, "time": 1, "duration_minutes": 1, "cost": 1, "base_cost": 1}
+    )
+    
+    minutes_by_activity = {activity['id']: activity_minutes(activity) for activity in activities}
+    missing = list({ta['activity_id'] for ta in booked if not ta.get('duration_minutes') and ta['activity_id'] not in minutes_by_activity})
+    if missing:
+        for activity in await repos.activities.find({"id": {"$in": missing}}, {"id": 1, "duration": 1, "duration_max": 1}):
+            minutes_by_activity[activity['id']] = activity_minutes(activity)
+    
+    activities_by_city = {}
+    for activity in activities:
+        activities_by_city.setdefault(activity['city_id'], []).append(activity)
+    booked_by_stop = {}
+    day_schedules = {}
+    for ta in booked:
+        booked_by_stop.setdefault(ta['stop_id'], []).append(ta)
+        interval = booking_interval(ta, minutes_by_activity)
+        if interval:
+            try:
+                day_schedules.setdefault((ta['trip_id'], stored_day(ta['date'])), []).append(interval)
+            except ValueError:
+                continue
+    
+    docs = []
+    for stop in stops:
+        docs.extend(plan_stop(
+            stop, activities_by_city.get(stop['city_id'], []), booked_by_stop.get(stop['id'], []),
+            day_schedules, minutes_by_activity, options, daily_budget, user_id
+        ))
+    if docs:
+        await repos.trip_activities.insert_many([{k: v for k, v in doc.items() if k != "activity_name"} for doc in docs])
+        planned_by_trip = {}
+        for doc in docs:
+            planned_by_trip.setdefault(doc['trip_id'], []).append(doc['base_cost'])
+        for trip_id, costs in planned_by_trip.items():
+            await bump_summaries(user_id, trip_id, {summaries.ACTIVITY_SPEND_CATEGORY: sum(costs)}, activities=len(costs))
+    planned = [TripActivityResponse(**doc) for doc in docs]
+    events_by_trip = {}
+    for trip_activity in planned:
+        events_by_trip.setdefault(trip_activity.trip_id, []).append(created_event("trip_activities", trip_activity))
+    for trip_id, events in events_by_trip.items():
+        await publish_trip_events(trip_id, events)
+    return planned
+
+# Schedule helpers
+def parse_time_of_day(value: str) -> int:
+    minutes = schedule.parse_clock(value)
+    if minutes is None:
+        raise HTTPException(status_code=422, detail="Times must be HH:MM")
+    return minutes
+
+async def load_day_schedule(trip_id: str, day: date) -> schedule.DayIntervals:
+    # Rows migrate_dates.py has not converted yet still hold the day as a string
+    query = {"trip_id": trip_id, "date": {"$in": [to_bson_date(day), day.isoformat()]}, "time": {"$ne": None}}
+    booked = await repos.trip_activities.find(query, {"id": 1, "activity_id": 1, "time": 1, "duration_minutes": 1})
+    
+    missing = list({ta['activity_id'] for ta in booked if not ta.get('duration_minutes')})
+    catalog_minutes = {}
+    if missing:
+        activities = await repos.activities.find({"id": {"$in": missing}}, {"id": 1, "duration": 1, "duration_max": 1})
+        catalog_minutes = {activity['id']: activity_minutes(activity) for activity in activities}
+    
+    intervals = [booking_interval(ta, catalog_minutes) for ta in booked]
+    return schedule.DayIntervals([interval for interval in intervals if interval])
 
 # Auth helpers
 def create_jwt_token(user_id: str) -> str:
@@ -158,29 +1153,64 @@ def create_jwt_token(user_id: str) -> str:
         'user_id': user_id,
         'exp': datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
     }
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return jwt.encode(payload, os.environ.get('JWT_SECRET', DEFAULT_JWT_SECRET), algorithm=JWT_ALGORITHM)
 
 def verify_jwt_token(token: str) -> str:
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = jwt.decode(token, os.environ.get('JWT_SECRET', DEFAULT_JWT_SECRET), algorithms=[JWT_ALGORITHM])
         return payload['user_id']
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+async def get_current_user_doc(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     token = credentials.credentials
     user_id = verify_jwt_token(token)
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user = await repos.users.get({"id": user_id}, {"id": 1, "email": 1, "currency": 1})
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
-    return user_id
+    return user
+
+async def get_admin_user(user: dict = Depends(get_current_user_doc)) -> str:
+    admins = {email.strip().lower() for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()}
+    if user.get("email", "").lower() not in admins:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user["id"]
+
+async def get_current_user(user: dict = Depends(get_current_user_doc)) -> str:
+    return user["id"]
+
+async def get_profile_currency(user: dict = Depends(get_current_user_doc)) -> str:
+    return user.get("currency") or currencies.BASE_CURRENCY
+
+def require_mongo():
+    if STORAGE_BACKEND == "memory":
+        raise HTTPException(status_code=503, detail="Not available with in-memory storage")
+
+async def externalize_media(value: Optional[str], user_id: str, kind: str) -> Optional[str]:
+    # Inline images move to the media store, which memory storage does not have
+    if media.is_data_url(value):
+        require_mongo()
+    return await media.externalize(media_bucket, value, user_id, kind)
+
+async def get_display_currency(currency: Optional[str] = None, profile_currency: str = Depends(get_profile_currency)) -> str:
+    # ?currency= overrides the profile's display currency for one response
+    return parse_currency(currency) if currency else profile_currency
+
+# Media helpers
+async def can_read_media(media_id: str, metadata: dict, token: Optional[str], share_token: Optional[str]) -> bool:
+    if token and metadata.get("owner_id") == verify_jwt_token(token):
+        return True
+    if share_token:
+        query = {"share_token": share_token, "is_public": True, "cover_photo": media.media_url(media_id)}
+        return await repos.trips.count(query, limit=1) > 0
+    return False
 
 # Auth routes
 @api_router.post("/auth/signup", response_model=AuthResponse)
 async def signup(user_data: UserSignup):
-    existing_user = await db.users.find_one({"email": user_data.email}, {"_id": 0})
+    existing_user = await repos.users.get({"email": user_data.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -193,10 +1223,13 @@ async def signup(user_data: UserSignup):
         "email": user_data.email,
         "password": hashed_password.decode('utf-8'),
         "profile_photo": None,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "version": 1
     }
+    user_doc["updated_at"] = user_doc["created_at"]
     
-    await db.users.insert_one(user_doc)
+    await repos.users.insert(user_doc)
+    await repos.user_summaries.insert({"user_id": user_id, "trips": 0, **summaries.empty_summary(), "updated_at": user_doc["created_at"]})
     token = create_jwt_token(user_id)
     
     user_response = UserResponse(
@@ -204,14 +1237,15 @@ async def signup(user_data: UserSignup):
         name=user_data.name,
         email=user_data.email,
         profile_photo=None,
-        created_at=user_doc["created_at"]
+        created_at=user_doc["created_at"],
+        version=user_doc["version"]
     )
     
     return AuthResponse(token=token, user=user_response)
 
 @api_router.post("/auth/login", response_model=AuthResponse)
 async def login(credentials: UserLogin):
-    user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
+    user = await repos.users.get({"email": credentials.email})
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
@@ -224,11 +1258,12 @@ async def login(credentials: UserLogin):
     return AuthResponse(token=token, user=user_response)
 
 @api_router.get("/auth/me", response_model=UserResponse)
-async def get_me(user_id: str = Depends(get_current_user)):
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+async def get_me(fields: Optional[str] = None, user_id: str = Depends(get_current_user)):
+    selected = parse_fields(fields, UserResponse)
+    user = await repos.users.get({"id": user_id}, fields_projection(selected) if selected else {"password": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return UserResponse(**user)
+    return sparse_response(UserResponse, user, selected)
 
 # Trip routes
 @api_router.post("/trips", response_model=TripResponse)
@@ -241,253 +1276,734 @@ async def create_trip(trip_data: TripCreate, user_id: str = Depends(get_current_
         "user_id": user_id,
         "name": trip_data.name,
         "description": trip_data.description,
-        "start_date": trip_data.start_date,
-        "end_date": trip_data.end_date,
-        "cover_photo": trip_data.cover_photo,
+        "start_date": to_bson_date(parse_day(trip_data.start_date)),
+        "end_date": to_bson_date(parse_day(trip_data.end_date)),
+        "cover_photo": await externalize_media(trip_data.cover_photo, user_id, "cover_photo"),
         "is_public": False,
+        "published_at": None,
         "share_token": share_token,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "version": 1
     }
+    trip_doc["updated_at"] = trip_doc["created_at"]
     
-    await db.trips.insert_one(trip_doc)
+    await repos.trips.insert(trip_doc)
+    await repos.trip_summaries.insert({"trip_id": trip_id, "user_id": user_id, **summaries.empty_summary(), "updated_at": trip_doc["created_at"]})
+    await bump_summaries(user_id, trip_id, trips=1)
     return TripResponse(**trip_doc)
 
 @api_router.get("/trips", response_model=List[TripResponse])
-async def get_trips(user_id: str = Depends(get_current_user)):
-    trips = await db.trips.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    return [TripResponse(**trip) for trip in trips]
+async def get_trips(fields: Optional[str] = None, user_id: str = Depends(get_current_user)):
+    selected = parse_fields(fields, TripResponse)
+    trips = await repos.trips.find({"user_id": user_id}, fields_projection(selected), sort="start_date", limit=1000)
+    return sparse_response(TripResponse, trips, selected)
+
+@api_router.get("/trips/public", response_model=List[PublicTripResponse], dependencies=[Depends(require_mongo)])
+async def get_public_trips(limit: int = Query(20, ge=1, le=FEED_MAX_LIMIT), offset: int = Query(0, ge=0)):
+    trips = await db.public_trip_feed.find({}).sort([("published_at", DESCENDING), ("_id", DESCENDING)]).skip(offset).limit(limit).to_list(limit)
+    return [PublicTripResponse(id=trip.pop('_id'), **trip) for trip in trips]
+
+@api_router.get("/trips/export")
+async def export_trips(export_format: str = Query("ndjson", alias="format", pattern="^(csv|ics|ndjson)$"), user_id: str = Depends(get_current_user)):
+    return export_response({"user_id": user_id}, export_format, "trips")
+
+@api_router.get("/trips/upcoming", response_model=List[TripResponse])
+async def get_upcoming_trips(
+    limit: int = Query(20, ge=1, le=TRIP_LIST_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    # Trips that have not ended yet, soonest first; ongoing trips come before future ones
+    selected = parse_fields(fields, TripResponse)
+    today = to_bson_date(datetime.now(timezone.utc).date())
+    trips = await repos.trips.find(
+        {"user_id": user_id, "end_date": {"$gte": today}}, fields_projection(selected),
+        sort=[("end_date", ASCENDING), ("id", ASCENDING)], skip=offset, limit=limit
+    )
+    return sparse_response(TripResponse, trips, selected)
+
+@api_router.get("/trips/past", response_model=List[TripResponse])
+async def get_past_trips(
+    limit: int = Query(20, ge=1, le=TRIP_LIST_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    selected = parse_fields(fields, TripResponse)
+    today = to_bson_date(datetime.now(timezone.utc).date())
+    trips = await repos.trips.find(
+        {"user_id": user_id, "end_date": {"$lt": today}}, fields_projection(selected),
+        sort=[("end_date", DESCENDING), ("id", DESCENDING)], skip=offset, limit=limit
+    )
+    return sparse_response(TripResponse, trips, selected)
 
 @api_router.get("/trips/{trip_id}", response_model=TripResponse)
-async def get_trip(trip_id: str, user_id: str = Depends(get_current_user)):
-    trip = await db.trips.find_one({"id": trip_id, "user_id": user_id}, {"_id": 0})
+async def get_trip(trip_id: str, fields: Optional[str] = None, user_id: str = Depends(get_current_user)):
+    selected = parse_fields(fields, TripResponse)
+    trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, fields_projection(selected))
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
-    return TripResponse(**trip)
+    return sparse_response(TripResponse, trip, selected)
 
-@api_router.put("/trips/{trip_id}", response_model=TripResponse)
-async def update_trip(trip_id: str, trip_data: TripUpdate, user_id: str = Depends(get_current_user)):
-    trip = await db.trips.find_one({"id": trip_id, "user_id": user_id}, {"_id": 0})
+@api_router.get("/trips/{trip_id}/export")
+async def export_trip(trip_id: str, export_format: str = Query("ndjson", alias="format", pattern="^(csv|ics|ndjson)$"), user_id: str = Depends(get_current_user)):
+    # Checked up front so a missing trip is a 404 rather than an empty download
+    trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, {"id": 1})
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
-    
+    return export_response({"id": trip_id, "user_id": user_id}, export_format, f"trip-{trip_id}")
+
+@api_router.put("/trips/{trip_id}", response_model=TripResponse)
+async def update_trip(trip_id: str, trip_data: TripUpdate, response: Response, if_match: Optional[str] = Header(None), user_id: str = Depends(get_current_user)):
+    expected_version = parse_if_match(if_match)
     update_data = {k: v for k, v in trip_data.model_dump().items() if v is not None}
-    if update_data:
-        await db.trips.update_one({"id": trip_id}, {"$set": update_data})
-        trip.update(update_data)
+    for field in ("start_date", "end_date"):
+        if field in update_data:
+            update_data[field] = to_bson_date(parse_day(update_data[field]))
+    stored_urls = []
+    if media.is_data_url(update_data.get("cover_photo")):
+        update_data["cover_photo"] = await externalize_media(update_data["cover_photo"], user_id, "cover_photo")
+        stored_urls.append(update_data["cover_photo"])
+    # The public feed orders by publish time, so only a trip going public is stamped;
+    # unpublishing clears the stamp and a later republish starts it afresh
+    if update_data.get("is_public") is False:
+        update_data["published_at"] = None
+    elif update_data.get("is_public") and not await repos.trips.count({"id": trip_id, "user_id": user_id, "is_public": True}, limit=1):
+        update_data["published_at"] = datetime.now(timezone.utc).isoformat()
     
-    return TripResponse(**trip)
+    trip = await versioned_media_update(repos.trips, {"id": trip_id, "user_id": user_id}, update_data, expected_version, None, "Trip not found", stored_urls)
+    set_etag(response, trip)
+    trip_response = TripResponse(**trip)
+    await publish_trip_events(trip_id, [updated_event("trips", trip_response, update_data)])
+    return trip_response
 
-@api_router.delete("/trips/{trip_id}")
+@api_router.delete("/trips/{trip_id}", status_code=202)
 async def delete_trip(trip_id: str, user_id: str = Depends(get_current_user)):
-    result = await db.trips.delete_one({"id": trip_id, "user_id": user_id})
-    if result.deleted_count == 0:
+    trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, {"id": 1})
+    if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
-    await db.stops.delete_many({"trip_id": trip_id})
-    stops = await db.stops.find({"trip_id": trip_id}, {"_id": 0}).to_list(1000)
-    for stop in stops:
-        await db.trip_activities.delete_many({"stop_id": stop['id']})
-    await db.trip_costs.delete_many({"trip_id": trip_id})
+    # Queued before the trip goes, so a crash in between cannot leave its stops, activities
+    # and costs behind with nothing left to clean them up; it is held until the delete lands
+    job = await enqueue_job("delete_trip", {"trip_id": trip_id}, user_id, delay=TRIP_DELETE_JOB_DELAY)
+    deleted = await repos.trips.delete({"id": trip_id, "user_id": user_id})
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    await start_job_now(job)
+    
+    # The trip's own summary holds exactly what it contributed to the user's
+    trip_summary = await repos.trip_summaries.delete({"trip_id": trip_id})
+    if trip_summary:
+        counts = {name: -trip_summary.get(name, 0) for name in summaries.SUMMARY_COUNTERS}
+        spend = {category: -amount for category, amount in trip_summary.get("spend_by_category", {}).items()}
+        await bump_summaries(user_id, None, spend, trips=-1, **counts)
+    else:
+        await bump_summaries(user_id, None, trips=-1)
+    
+    await record_tombstones("trips", [trip_id], user_id)
+    await publish_trip_events(trip_id, [trip_event("trips", "deleted", trip_id)])
     
-    return {"message": "Trip deleted successfully"}
+    # The trip is gone for every reader now; its stops, activities and costs are cleared by the job
+    return {"message": "Trip deleted successfully", "job_id": job["id"]}
 
 @api_router.get("/trips/shared/{share_token}", response_model=TripResponse)
-async def get_shared_trip(share_token: str):
-    trip = await db.trips.find_one({"share_token": share_token, "is_public": True}, {"_id": 0})
+async def get_shared_trip(share_token: str, fields: Optional[str] = None):
+    selected = parse_fields(fields, TripResponse)
+    trip = await repos.trips.get({"share_token": share_token, "is_public": True}, fields_projection(selected))
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found or not public")
+    return sparse_response(TripResponse, trip, selected)
+
+@api_router.websocket("/trips/{trip_id}/events")
+async def trip_events_socket(websocket: WebSocket, trip_id: str, token: Optional[str] = None, share_token: Optional[str] = None):
+    # Browsers cannot set headers on a socket, so owners pass their JWT and viewers the share token
+    if token:
+        try:
+            query = {"id": trip_id, "user_id": verify_jwt_token(token)}
+        except HTTPException:
+            raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid token")
+    elif share_token:
+        query = {"id": trip_id, "share_token": share_token, "is_public": True}
+    else:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Missing token or share_token")
+    trip = await repos.trips.get(query, {"version": 1})
     if not trip:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Trip not found")
+    
+    # Subscribed before the first frame, so nothing written after it is missed
+    queue = trip_event_bus.subscribe(trip_id)
+    try:
+        await websocket.accept()
+        await websocket.send_json(trip_event("trips", "subscribed", trip_id, {"version": trip.get("version", 0)}))
+        await stream_trip_events(websocket, queue, shared=not token)
+    finally:
+        trip_event_bus.unsubscribe(trip_id, queue)
+
+@api_router.post("/trips/shared/{share_token}/clone", response_model=TripResponse)
+async def clone_shared_trip(share_token: str, options: Optional[CloneTripRequest] = None, user_id: str = Depends(get_current_user)):
+    options = options or CloneTripRequest()
+    source = await repos.trips.get({"share_token": share_token, "is_public": True})
+    if not source:
         raise HTTPException(status_code=404, detail="Trip not found or not public")
-    return TripResponse(**trip)
+    
+    # Three bulk reads, however large the trip
+    stops = await repos.stops.find({"trip_id": source['id']})
+    stop_ids = {stop['id']: secrets.token_urlsafe(16) for stop in stops}
+    trip_activities = await repos.trip_activities.find({"stop_id": {"$in": list(stop_ids)}})
+    costs = await repos.trip_costs.find({"trip_id": source['id']})
+    
+    try:
+        source_start = stored_day(source['start_date'])
+        shift = parse_day(options.start_date) - source_start if options.start_date else timedelta(0)
+        trip_id = secrets.token_urlsafe(16)
+        now = datetime.now(timezone.utc).isoformat()
+        owner = {"trip_id": trip_id, "user_id": user_id, "updated_at": now}
+        new_stops = [
+            {**stop, **owner, "id": stop_ids[stop['id']], "start_date": shift_stored_date(stop['start_date'], shift), "end_date": shift_stored_date(stop['end_date'], shift)}
+            for stop in stops
+        ]
+        new_trip_activities = [
+            {**ta, **owner, "id": secrets.token_urlsafe(16), "stop_id": stop_ids[ta['stop_id']], "date": shift_stored_date(ta['date'], shift)}
+            for ta in trip_activities
+        ]
+        trip_doc = {
+            **source,
+            "id": trip_id,
+            "user_id": user_id,
+            "name": options.name or source['name'],
+            "start_date": shift_stored_date(source['start_date'], shift),
+            "end_date": shift_stored_date(source['end_date'], shift),
+            "is_public": False,
+            "published_at": None,
+            "share_token": secrets.token_urlsafe(32),
+            "created_at": now,
+            "updated_at": now,
+            "version": 1
+        }
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Shared trip has unparseable dates")
+    new_costs = [{**cost, **owner, "id": secrets.token_urlsafe(16)} for cost in costs]
+    # The source cover is the source owner's upload, which the private clone could not read
+    trip_doc["cover_photo"] = await media.copy(media_bucket, source.get('cover_photo'), user_id, "cover_photo")
+    
+    # Children go in first so a failure part way never leaves a visible, half-copied trip
+    await repos.stops.insert_many(new_stops)
+    await repos.trip_activities.insert_many(new_trip_activities)
+    await repos.trip_costs.insert_many(new_costs)
+    await repos.trips.insert(trip_doc)
+    
+    spend = {}
+    for cost in new_costs:
+        spend[cost['category']] = spend.get(cost['category'], 0) + cost.get('base_amount', cost['amount'])
+    spend[summaries.ACTIVITY_SPEND_CATEGORY] = sum(ta.get('base_cost', ta.get('cost')) or 0 for ta in new_trip_activities)
+    await repos.trip_summaries.insert({"trip_id": trip_id, "user_id": user_id, **summaries.empty_summary(), "updated_at": now})
+    await bump_summaries(user_id, trip_id, spend, trips=1, stops=len(new_stops), activities=len(new_trip_activities), costs=len(new_costs))
+    
+    return TripResponse(**trip_doc)
 
 # Stop routes
 @api_router.post("/trips/{trip_id}/stops", response_model=StopResponse)
 async def create_stop(trip_id: str, stop_data: StopCreate, user_id: str = Depends(get_current_user)):
-    trip = await db.trips.find_one({"id": trip_id, "user_id": user_id}, {"_id": 0})
+    trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, {"id": 1})
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
-    city = await db.cities.find_one({"id": stop_data.city_id}, {"_id": 0})
+    city = await repos.cities.get({"id": stop_data.city_id})
     if not city:
         raise HTTPException(status_code=404, detail="City not found")
     
+    order = stop_data.order
+    if order is None:
+        last = await repos.stops.find({"trip_id": trip_id}, {"order": 1}, sort=[("order", DESCENDING)], limit=1)
+        order = stop_order.after(last[0]['order'] if last else None)
+    
     stop_id = secrets.token_urlsafe(16)
     stop_doc = {
         "id": stop_id,
         "trip_id": trip_id,
+        "user_id": user_id,
         "city_id": stop_data.city_id,
-        "start_date": stop_data.start_date,
-        "end_date": stop_data.end_date,
-        "order": stop_data.order
+        "start_date": to_bson_date(parse_day(stop_data.start_date)),
+        "end_date": to_bson_date(parse_day(stop_data.end_date)),
+        "order": order,
+        "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.stops.insert_one(stop_doc)
+    await repos.stops.insert(stop_doc)
+    await bump_summaries(user_id, trip_id, stops=1)
+    crowded = {"trip_id": trip_id, "order": {"$gt": order - stop_order.REBALANCE_GAP, "$lt": order + stop_order.REBALANCE_GAP}}
+    if await repos.stops.count(crowded, limit=2) > 1:
+        await schedule_stop_rebalance(trip_id, user_id)
     
     response = StopResponse(**stop_doc)
     response.city_name = city['name']
     response.city_country = city['country']
+    await publish_trip_events(trip_id, [created_event("stops", response)])
     return response
 
 @api_router.get("/trips/{trip_id}/stops", response_model=List[StopResponse])
-async def get_stops(trip_id: str, user_id: str = Depends(get_current_user)):
-    trip = await db.trips.find_one({"id": trip_id, "user_id": user_id}, {"_id": 0})
+async def get_stops(trip_id: str, fields: Optional[str] = None, user_id: str = Depends(get_current_user)):
+    selected = parse_fields(fields, StopResponse)
+    trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, {"id": 1})
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
-    stops = await db.stops.find({"trip_id": trip_id}, {"_id": 0}).sort("order", 1).to_list(1000)
+    stops = await repos.stops.find({"trip_id": trip_id}, fields_projection(selected), sort="order", limit=TRIP_STOPS_MAX)
     
-    for stop in stops:
-        city = await db.cities.find_one({"id": stop['city_id']}, {"_id": 0})
-        if city:
-            stop['city_name'] = city['name']
-            stop['city_country'] = city['country']
+    if wants_any(selected, "city_name", "city_country"):
+        for stop in stops:
+            city = await repos.cities.get({"id": stop['city_id']}, {"name": 1, "country": 1})
+            if city:
+                stop['city_name'] = city['name']
+                stop['city_country'] = city['country']
     
-    return [StopResponse(**stop) for stop in stops]
+    return sparse_response(StopResponse, stops, selected)
+
+@api_router.post("/trips/{trip_id}/optimize-route", response_model=OptimizeRouteResponse)
+async def optimize_route(trip_id: str, options: OptimizeRouteRequest, user_id: str = Depends(get_current_user)):
+    trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, {"id": 1})
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    
+    stops = await repos.stops.find({"trip_id": trip_id}, sort="order")
+    city_ids = list({stop['city_id'] for stop in stops})
+    cities = await repos.cities.find({"id": {"$in": city_ids}}, {"id": 1, "name": 1, "country": 1, "lat": 1, "lng": 1})
+    cities_by_id = {city['id']: city for city in cities}
+    
+    missing = [stop['id'] for stop in stops if cities_by_id.get(stop['city_id'], {}).get('lat') is None]
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Stops without city coordinates: {', '.join(missing)}")
+    
+    lat = np.array([cities_by_id[stop['city_id']]['lat'] for stop in stops], dtype=np.float64)
+    lng = np.array([cities_by_id[stop['city_id']]['lng'] for stop in stops], dtype=np.float64)
+    new_order = route_optimizer.optimize_order(lat, lng, options.keep_start, options.keep_end)
+    dist = route_optimizer.haversine_matrix(lat, lng)
+    previous_km = route_optimizer.path_length(dist, np.arange(len(stops))) if stops else 0.0
+    total_km = route_optimizer.path_length(dist, np.array(new_order)) if stops else 0.0
+    
+    now = datetime.now(timezone.utc).isoformat()
+    keys = stop_order.reorder([stops[index]['order'] for index in new_order])
+    ordered = []
+    updates = []
+    for index, key in zip(new_order, keys):
+        stop = stops[index]
+        if stop['order'] != key:
+            updates.append(({"id": stop['id']}, {"order": key, "updated_at": now}))
+            stop['order'] = key
+            stop['updated_at'] = now
+        city = cities_by_id[stop['city_id']]
+        stop['city_name'] = city['name']
+        stop['city_country'] = city['country']
+        ordered.append(StopResponse(**stop))
+    await repos.stops.update_each(updates)
+    moved = {query["id"] for query, _ in updates}
+    await publish_trip_events(trip_id, [updated_event("stops", stop, {"order"}) for stop in ordered if stop.id in moved])
+    if stop_order.needs_rebalance(keys):
+        await schedule_stop_rebalance(trip_id, user_id)
+    
+    return OptimizeRouteResponse(stops=ordered, previous_distance_km=previous_km, total_distance_km=total_km)
+
+@api_router.patch("/trips/{trip_id}/stops/order", response_model=StopOrderResponse)
+async def reorder_stops(trip_id: str, update: StopOrderUpdate, user_id: str = Depends(get_current_user)):
+    trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, {"id": 1})
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    
+    stops = await repos.stops.find({"trip_id": trip_id}, {"id": 1, "order": 1})
+    current = {stop['id']: stop['order'] for stop in stops}
+    if len(update.stop_ids) != len(current) or set(update.stop_ids) != current.keys():
+        raise HTTPException(status_code=409, detail="stop_ids must list every stop of the trip exactly once")
+    
+    # Only stops that actually changed place get a new key, all written in one bulk write
+    keys = stop_order.reorder([current[stop_id] for stop_id in update.stop_ids])
+    now = datetime.now(timezone.utc).isoformat()
+    updates = [
+        ({"id": stop_id}, {"order": key, "updated_at": now})
+        for stop_id, key in zip(update.stop_ids, keys) if current[stop_id] != key
+    ]
+    await repos.stops.update_each(updates)
+    await publish_trip_events(trip_id, [trip_event("stops", "updated", query["id"], changes) for query, changes in updates])
+    if stop_order.needs_rebalance(keys):
+        await schedule_stop_rebalance(trip_id, user_id)
+    
+    return StopOrderResponse(stops=[StopOrderEntry(id=stop_id, order=key) for stop_id, key in zip(update.stop_ids, keys)], moved=len(updates))
 
 @api_router.delete("/stops/{stop_id}")
 async def delete_stop(stop_id: str, user_id: str = Depends(get_current_user)):
-    stop = await db.stops.find_one({"id": stop_id}, {"_id": 0})
+    stop = await repos.stops.get({"id": stop_id}, {"trip_id": 1})
     if not stop:
         raise HTTPException(status_code=404, detail="Stop not found")
     
-    trip = await db.trips.find_one({"id": stop['trip_id'], "user_id": user_id}, {"_id": 0})
+    trip = await repos.trips.get({"id": stop['trip_id'], "user_id": user_id}, {"id": 1})
     if not trip:
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    await db.stops.delete_one({"id": stop_id})
-    await db.trip_activities.delete_many({"stop_id": stop_id})
+    trip_activities = await repos.trip_activities.find({"stop_id": stop_id}, {"id": 1, "cost": 1, "base_cost": 1})
+    trip_activity_ids = [ta['id'] for ta in trip_activities]
+    deleted = await repos.stops.delete({"id": stop_id})
+    await repos.trip_activities.delete_many({"stop_id": stop_id})
+    if deleted:
+        spend = {summaries.ACTIVITY_SPEND_CATEGORY: -sum(ta.get('base_cost', ta.get('cost')) or 0 for ta in trip_activities)}
+        await bump_summaries(user_id, stop['trip_id'], spend, stops=-1, activities=-len(trip_activities))
+    
+    await record_tombstones("stops", [stop_id], user_id)
+    await record_tombstones("trip_activities", trip_activity_ids, user_id)
+    await publish_trip_events(
+        stop['trip_id'],
+        [trip_event("trip_activities", "deleted", ta_id) for ta_id in trip_activity_ids] + [trip_event("stops", "deleted", stop_id)]
+    )
     
     return {"message": "Stop deleted successfully"}
 
 # Trip Activity routes
 @api_router.post("/stops/{stop_id}/activities", response_model=TripActivityResponse)
-async def add_activity_to_stop(stop_id: str, activity_data: TripActivityCreate, user_id: str = Depends(get_current_user)):
-    stop = await db.stops.find_one({"id": stop_id}, {"_id": 0})
+async def add_activity_to_stop(
+    stop_id: str,
+    activity_data: TripActivityCreate,
+    allow_conflicts: bool = False,
+    profile_currency: str = Depends(get_profile_currency),
+    user_id: str = Depends(get_current_user)
+):
+    stop = await repos.stops.get({"id": stop_id}, {"id": 1, "trip_id": 1, "start_date": 1, "end_date": 1})
     if not stop:
         raise HTTPException(status_code=404, detail="Stop not found")
     
-    trip = await db.trips.find_one({"id": stop['trip_id'], "user_id": user_id}, {"_id": 0})
+    trip = await repos.trips.get({"id": stop['trip_id'], "user_id": user_id}, {"id": 1})
     if not trip:
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    activity = await db.activities.find_one({"id": activity_data.activity_id}, {"_id": 0})
+    activity = await repos.activities.get({"id": activity_data.activity_id})
     if not activity:
         raise HTTPException(status_code=404, detail="Activity not found")
     
+    day = parse_day(activity_data.date)
+    stop_start, stop_end = parse_stop_dates(stop)
+    if not stop_start <= day <= stop_end:
+        raise HTTPException(status_code=422, detail=f"Activity date must fall within the stop ({stop_start.isoformat()} to {stop_end.isoformat()})")
+    
+    duration_minutes = activity_data.duration_minutes or activity_minutes(activity)
+    conflicts = []
+    if activity_data.time:
+        start = parse_time_of_day(activity_data.time)
+        day_schedule = await load_day_schedule(stop['trip_id'], day)
+        conflicts = day_schedule.overlapping(start, min(start + duration_minutes, schedule.MINUTES_PER_DAY))
+        if conflicts and not allow_conflicts:
+            raise HTTPException(status_code=409, detail=f"Overlaps with scheduled activities: {', '.join(conflicts)}")
+    
+    cost_currency = parse_currency(activity_data.currency) if activity_data.currency else profile_currency
     trip_activity_id = secrets.token_urlsafe(16)
     trip_activity_doc = {
         "id": trip_activity_id,
         "stop_id": stop_id,
+        "trip_id": stop['trip_id'],
+        "user_id": user_id,
         "activity_id": activity_data.activity_id,
-        "date": activity_data.date,
+        "date": to_bson_date(day),
         "time": activity_data.time,
+        "duration_minutes": duration_minutes,
         "cost": activity_data.cost,
-        "notes": activity_data.notes
+        "currency": cost_currency,
+        "base_cost": currencies.rate_table().to_base(activity_data.cost, cost_currency),
+        "notes": activity_data.notes,
+        "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.trip_activities.insert_one(trip_activity_doc)
+    await repos.trip_activities.insert(trip_activity_doc)
+    await bump_summaries(user_id, stop['trip_id'], {summaries.ACTIVITY_SPEND_CATEGORY: trip_activity_doc['base_cost']}, activities=1)
     
     response = TripActivityResponse(**trip_activity_doc)
     response.activity_name = activity['name']
+    response.conflicts = conflicts or None
+    await publish_trip_events(stop['trip_id'], [created_event("trip_activities", response)])
     return response
 
-@api_router.get("/stops/{stop_id}/activities", response_model=List[TripActivityResponse])
-async def get_stop_activities(stop_id: str, user_id: str = Depends(get_current_user)):
-    stop = await db.stops.find_one({"id": stop_id}, {"_id": 0})
+@api_router.post("/stops/{stop_id}/auto-plan", response_model=List[TripActivityResponse])
+async def auto_plan_stop(stop_id: str, options: AutoPlanRequest, profile_currency: str = Depends(get_profile_currency), user_id: str = Depends(get_current_user)):
+    stop = await repos.stops.get({"id": stop_id})
     if not stop:
         raise HTTPException(status_code=404, detail="Stop not found")
     
-    trip = await db.trips.find_one({"id": stop['trip_id'], "user_id": user_id}, {"_id": 0})
+    trip = await repos.trips.get({"id": stop['trip_id'], "user_id": user_id}, {"id": 1})
     if not trip:
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    trip_activities = await db.trip_activities.find({"stop_id": stop_id}, {"_id": 0}).to_list(1000)
+    return await auto_plan_stops([stop], options, parse_currency(options.currency) if options.currency else profile_currency, user_id)
+
+@api_router.post("/trips/{trip_id}/auto-plan", response_model=List[TripActivityResponse])
+async def auto_plan_trip(trip_id: str, options: AutoPlanRequest, profile_currency: str = Depends(get_profile_currency), user_id: str = Depends(get_current_user)):
+    trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, {"id": 1})
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    
+    stops = await repos.stops.find({"trip_id": trip_id}, sort="order")
+    return await auto_plan_stops(stops, options, parse_currency(options.currency) if options.currency else profile_currency, user_id)
+
+@api_router.get("/trips/{trip_id}/free-slots", response_model=List[FreeSlotResponse])
+async def get_free_slots(
+    trip_id: str,
+    day: str = Query(..., alias="date"),
+    day_start: str = "08:00",
+    day_end: str = "22:00",
+    min_minutes: int = Query(30, ge=1, le=schedule.MINUTES_PER_DAY),
+    user_id: str = Depends(get_current_user)
+):
+    trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, {"id": 1})
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    
+    window_start = parse_time_of_day(day_start)
+    window_end = schedule.MINUTES_PER_DAY if day_end == "24:00" else parse_time_of_day(day_end)
+    if window_end <= window_start:
+        raise HTTPException(status_code=422, detail="day_end must be after day_start")
+    
+    day_schedule = await load_day_schedule(trip_id, parse_day(day))
+    return [
+        FreeSlotResponse(start=schedule.format_clock(start), end=schedule.format_clock(end), minutes=end - start)
+        for start, end in day_schedule.free_slots(window_start, window_end, min_minutes)
+    ]
+
+@api_router.get("/calendar", response_model=List[TripActivityResponse])
+async def get_calendar(start: str, end: str, trip_id: Optional[str] = None, display_currency: str = Depends(get_display_currency), user_id: str = Depends(get_current_user)):
+    first, last = parse_day(start), parse_day(end)
+    if last < first:
+        raise HTTPException(status_code=422, detail="end must not be before start")
+    if (last - first).days >= CALENDAR_MAX_DAYS:
+        raise HTTPException(status_code=422, detail=f"Calendar windows are limited to {CALENDAR_MAX_DAYS} days")
+    
+    # Served by (user_id, date), or (trip_id, date) when narrowed to one trip
+    query = {"user_id": user_id, "date": {"$gte": to_bson_date(first), "$lte": to_bson_date(last)}}
+    if trip_id:
+        trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, {"id": 1})
+        if not trip:
+            raise HTTPException(status_code=404, detail="Trip not found")
+        query = {"trip_id": trip_id, "date": query["date"]}
+    
+    trip_activities = await repos.trip_activities.find(query, sort=[("date", ASCENDING), ("time", ASCENDING), ("id", ASCENDING)])
     
+    activity_ids = list({ta['activity_id'] for ta in trip_activities})
+    names = {}
+    if activity_ids:
+        activities = await repos.activities.find({"id": {"$in": activity_ids}}, {"id": 1, "name": 1})
+        names = {activity['id']: activity['name'] for activity in activities}
     for ta in trip_activities:
-        activity = await db.activities.find_one({"id": ta['activity_id']}, {"_id": 0})
-        if activity:
-            ta['activity_name'] = activity['name']
+        ta['activity_name'] = names.get(ta['activity_id'])
+    convert_for_display(trip_activities, "cost", "display_cost", display_currency)
     
     return [TripActivityResponse(**ta) for ta in trip_activities]
 
+@api_router.get("/stops/{stop_id}/activities", response_model=List[TripActivityResponse])
+async def get_stop_activities(stop_id: str, fields: Optional[str] = None, display_currency: str = Depends(get_display_currency), user_id: str = Depends(get_current_user)):
+    selected = parse_fields(fields, TripActivityResponse)
+    stop = await repos.stops.get({"id": stop_id}, {"trip_id": 1})
+    if not stop:
+        raise HTTPException(status_code=404, detail="Stop not found")
+    
+    trip = await repos.trips.get({"id": stop['trip_id'], "user_id": user_id}, {"id": 1})
+    if not trip:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    trip_activities = await repos.trip_activities.find({"stop_id": stop_id}, fields_projection(selected), limit=1000)
+    if wants_any(selected, "display_cost", "display_currency"):
+        convert_for_display(trip_activities, "cost", "display_cost", display_currency)
+    
+    if wants_any(selected, "activity_name"):
+        for ta in trip_activities:
+            activity = await repos.activities.get({"id": ta['activity_id']}, {"name": 1})
+            if activity:
+                ta['activity_name'] = activity['name']
+    
+    return sparse_response(TripActivityResponse, trip_activities, selected)
+
 @api_router.delete("/trip-activities/{activity_id}")
 async def delete_trip_activity(activity_id: str, user_id: str = Depends(get_current_user)):
-    trip_activity = await db.trip_activities.find_one({"id": activity_id}, {"_id": 0})
+    trip_activity = await repos.trip_activities.get({"id": activity_id})
     if not trip_activity:
         raise HTTPException(status_code=404, detail="Activity not found")
     
-    stop = await db.stops.find_one({"id": trip_activity['stop_id']}, {"_id": 0})
+    stop = await repos.stops.get({"id": trip_activity['stop_id']}, {"trip_id": 1})
     if not stop:
         raise HTTPException(status_code=404, detail="Stop not found")
     
-    trip = await db.trips.find_one({"id": stop['trip_id'], "user_id": user_id}, {"_id": 0})
+    trip = await repos.trips.get({"id": stop['trip_id'], "user_id": user_id}, {"id": 1})
     if not trip:
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    await db.trip_activities.delete_one({"id": activity_id})
+    deleted = await repos.trip_activities.delete({"id": activity_id})
+    if deleted:
+        await bump_summaries(user_id, stop['trip_id'], {summaries.ACTIVITY_SPEND_CATEGORY: -trip_activity.get('base_cost', trip_activity['cost'])}, activities=-1)
+    await record_tombstones("trip_activities", [activity_id], user_id)
+    await publish_trip_events(stop['trip_id'], [trip_event("trip_activities", "deleted", activity_id)])
     return {"message": "Activity deleted successfully"}
 
 # Cost routes
 @api_router.post("/trips/{trip_id}/costs", response_model=TripCostResponse)
-async def add_trip_cost(trip_id: str, cost_data: TripCostCreate, user_id: str = Depends(get_current_user)):
-    trip = await db.trips.find_one({"id": trip_id, "user_id": user_id}, {"_id": 0})
+async def add_trip_cost(trip_id: str, cost_data: TripCostCreate, profile_currency: str = Depends(get_profile_currency), user_id: str = Depends(get_current_user)):
+    trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, {"id": 1})
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
+    cost_currency = parse_currency(cost_data.currency) if cost_data.currency else profile_currency
     cost_id = secrets.token_urlsafe(16)
     cost_doc = {
         "id": cost_id,
         "trip_id": trip_id,
+        "user_id": user_id,
         "category": cost_data.category,
         "amount": cost_data.amount,
-        "description": cost_data.description
+        "currency": cost_currency,
+        "base_amount": currencies.rate_table().to_base(cost_data.amount, cost_currency),
+        "description": cost_data.description,
+        "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.trip_costs.insert_one(cost_doc)
-    return TripCostResponse(**cost_doc)
+    await repos.trip_costs.insert(cost_doc)
+    await bump_summaries(user_id, trip_id, {cost_data.category: cost_doc['base_amount']}, costs=1)
+    response = TripCostResponse(**cost_doc)
+    await publish_trip_events(trip_id, [created_event("trip_costs", response)])
+    return response
 
 @api_router.get("/trips/{trip_id}/costs", response_model=List[TripCostResponse])
-async def get_trip_costs(trip_id: str, user_id: str = Depends(get_current_user)):
-    trip = await db.trips.find_one({"id": trip_id, "user_id": user_id}, {"_id": 0})
+async def get_trip_costs(trip_id: str, fields: Optional[str] = None, display_currency: str = Depends(get_display_currency), user_id: str = Depends(get_current_user)):
+    selected = parse_fields(fields, TripCostResponse)
+    trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, {"id": 1})
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
-    costs = await db.trip_costs.find({"trip_id": trip_id}, {"_id": 0}).to_list(1000)
-    return [TripCostResponse(**cost) for cost in costs]
+    costs = await repos.trip_costs.find({"trip_id": trip_id}, fields_projection(selected), limit=1000)
+    if wants_any(selected, "display_amount", "display_currency"):
+        convert_for_display(costs, "amount", "display_amount", display_currency)
+    return sparse_response(TripCostResponse, costs, selected)
 
 @api_router.delete("/costs/{cost_id}")
 async def delete_cost(cost_id: str, user_id: str = Depends(get_current_user)):
-    cost = await db.trip_costs.find_one({"id": cost_id}, {"_id": 0})
+    cost = await repos.trip_costs.get({"id": cost_id})
     if not cost:
         raise HTTPException(status_code=404, detail="Cost not found")
     
-    trip = await db.trips.find_one({"id": cost['trip_id'], "user_id": user_id}, {"_id": 0})
+    trip = await repos.trips.get({"id": cost['trip_id'], "user_id": user_id}, {"id": 1})
     if not trip:
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    await db.trip_costs.delete_one({"id": cost_id})
+    deleted = await repos.trip_costs.delete({"id": cost_id})
+    if deleted:
+        await bump_summaries(user_id, cost['trip_id'], {cost['category']: -cost.get('base_amount', cost['amount'])}, costs=-1)
+    await record_tombstones("trip_costs", [cost_id], user_id)
+    await publish_trip_events(cost['trip_id'], [trip_event("trip_costs", "deleted", cost_id)])
     return {"message": "Cost deleted successfully"}
 
 # City routes
+# Search routes
+@api_router.get("/search/cities", response_model=CitySearchResponse)
+async def search_cities(
+    q: str = Query(..., min_length=1),
+    country: Optional[str] = None,
+    region: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT)
+):
+    total, results = await run_search("cities", q, {"country": country, "region": region}, offset, limit)
+    return CitySearchResponse(total=total, offset=offset, limit=limit, results=[CitySearchHit(**doc) for doc in results])
+
+@api_router.get("/search/activities", response_model=ActivitySearchResponse)
+async def search_activities(
+    q: str = Query(..., min_length=1),
+    city_id: Optional[str] = None,
+    category: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT)
+):
+    total, results = await run_search("activities", q, {"city_id": city_id, "category": category}, offset, limit)
+    return ActivitySearchResponse(total=total, offset=offset, limit=limit, results=[ActivitySearchHit(**doc) for doc in results])
+
+@api_router.get("/cities/popular", response_model=List[CityRankingResponse], dependencies=[Depends(require_mongo)])
+async def get_popular_cities(limit: int = Query(20, ge=1, le=FEED_MAX_LIMIT), offset: int = Query(0, ge=0)):
+    rankings = await db.city_rankings.find({}).sort([("weight", DESCENDING), ("_id", ASCENDING)]).skip(offset).limit(limit).to_list(limit)
+    # Stored weights share a fixed epoch; scaling to today makes a trip starting now worth 1
+    decay = feeds.decay_factor(datetime.now(timezone.utc))
+    return [
+        CityRankingResponse(city_id=ranking['_id'], score=ranking['weight'] * decay, **{k: v for k, v in ranking.items() if k not in ("_id", "weight")})
+        for ranking in rankings
+    ]
+
+@api_router.post("/cities/compare", response_model=CityCompareResponse)
+async def compare_cities(request: CityCompareRequest):
+    if city_cost_stats is None:
+        raise HTTPException(status_code=503, detail="City cost statistics are not ready")
+    
+    positions, missing = city_cost_stats.positions(request.city_ids)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Cities not found: {', '.join(missing)}")
+    
+    rates = currencies.rate_table()
+    display_currency = parse_currency(request.currency) if request.currency else rates.base
+    estimates = city_cost_stats.estimate(positions, request.days, cost_estimator.TRAVEL_STYLES[request.style])
+    factor = rates.factors([rates.base], display_currency)[0]
+    # Cheapest first; columns go to lists once rather than element by element
+    order = np.argsort(estimates["total"], kind="stable")
+    positions = positions[order]
+    columns = {name: np.round(values[order] * factor, 2).tolist() for name, values in estimates.items()}
+    cost_index = city_cost_stats.cost_index[positions].tolist()
+    activity_counts = city_cost_stats.activity_counts[positions].tolist()
+    results = [
+        CityCostEstimate(
+            city_id=city_cost_stats.ids[pos],
+            name=city_cost_stats.names[pos],
+            country=city_cost_stats.countries[pos],
+            cost_index=cost_index[i],
+            activity_count=activity_counts[i],
+            **{name: values[i] for name, values in columns.items()}
+        )
+        for i, pos in enumerate(positions.tolist())
+    ]
+    return CityCompareResponse(days=request.days, style=request.style, currency=display_currency, rates_version=rates.version, results=results)
+
 @api_router.get("/cities", response_model=List[CityResponse])
-async def get_cities(search: Optional[str] = None, country: Optional[str] = None):
+async def get_cities(search: Optional[str] = None, country: Optional[str] = None, fields: Optional[str] = None):
+    selected = parse_fields(fields, CityResponse)
     query = {}
     if search:
         query["name"] = {"$regex": search, "$options": "i"}
     if country:
         query["country"] = country
     
-    cities = await db.cities.find(query, {"_id": 0}).limit(50).to_list(50)
-    return [CityResponse(**city) for city in cities]
+    cities = await repos.cities.find(query, fields_projection(selected), limit=50)
+    return sparse_response(CityResponse, cities, selected)
+
+@api_router.get("/cities/nearby", response_model=List[NearbyCityResponse], dependencies=[Depends(require_mongo)])
+async def get_nearby_cities(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0),
+    limit: int = Query(NEARBY_DEFAULT_LIMIT, ge=1, le=NEARBY_MAX_LIMIT)
+):
+    cities = await db.cities.aggregate(geo_near_pipeline(lat, lng, radius_km, limit, {})).to_list(limit)
+    return [NearbyCityResponse(**city) for city in cities]
 
 @api_router.get("/cities/{city_id}", response_model=CityResponse)
-async def get_city(city_id: str):
-    city = await db.cities.find_one({"id": city_id}, {"_id": 0})
+async def get_city(city_id: str, fields: Optional[str] = None):
+    selected = parse_fields(fields, CityResponse)
+    city = await repos.cities.get({"id": city_id}, fields_projection(selected))
     if not city:
         raise HTTPException(status_code=404, detail="City not found")
-    return CityResponse(**city)
+    return sparse_response(CityResponse, city, selected)
 
 # Activity routes
 @api_router.get("/activities", response_model=List[ActivityResponse])
-async def get_activities(city_id: Optional[str] = None, category: Optional[str] = None, search: Optional[str] = None):
+async def get_activities(
+    city_id: Optional[str] = None,
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    fields: Optional[str] = None,
+    min_cost: Optional[float] = Query(None, ge=0),
+    max_cost: Optional[float] = Query(None, ge=0),
+    min_duration: Optional[int] = Query(None, ge=0, description="Minutes"),
+    max_duration: Optional[int] = Query(None, ge=0, description="Minutes"),
+    sort: Optional[str] = Query(None, pattern="^-?(cost|duration|name)$"),
+    currency: Optional[str] = Query(None, description="Also show prices converted to this currency")
+):
+    selected = parse_fields(fields, ActivityResponse)
+    display_currency = parse_currency(currency) if currency else None
     query = {}
     if city_id:
         query["city_id"] = city_id
@@ -495,47 +2011,392 @@ async def get_activities(city_id: Optional[str] = None, category: Optional[str]
         query["category"] = category
     if search:
         query["name"] = {"$regex": search, "$options": "i"}
+    if min_cost is not None or max_cost is not None:
+        query["cost"] = range_filter(min_cost, max_cost)
+    # An activity fits a duration window when its shortest and longest estimates both fall inside it
+    if min_duration is not None:
+        query["duration_min"] = {"$gte": min_duration}
+    if max_duration is not None:
+        query["duration_max"] = {"$lte": max_duration}
+    
+    order = None
+    if sort:
+        direction = DESCENDING if sort.startswith("-") else ASCENDING
+        order = [(ACTIVITY_SORT_KEYS[sort.lstrip("-")], direction), ("id", ASCENDING)]
+    activities = await repos.activities.find(query, fields_projection(selected), sort=order, limit=50)
+    if display_currency and wants_any(selected, "display_cost", "display_currency"):
+        convert_for_display(activities, "cost", "display_cost", display_currency)
+    return sparse_response(ActivityResponse, activities, selected)
+
+@api_router.get("/activities/nearby", response_model=List[NearbyActivityResponse], dependencies=[Depends(require_mongo)])
+async def get_nearby_activities(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0),
+    limit: int = Query(NEARBY_DEFAULT_LIMIT, ge=1, le=NEARBY_MAX_LIMIT),
+    category: Optional[str] = None,
+    max_cost: Optional[float] = Query(None, ge=0)
+):
+    query = {}
+    if category:
+        query["category"] = category
+    if max_cost is not None:
+        query["cost"] = {"$lte": max_cost}
     
-    activities = await db.activities.find(query, {"_id": 0}).limit(50).to_list(50)
-    return [ActivityResponse(**activity) for activity in activities]
+    activities = await db.activities.aggregate(geo_near_pipeline(lat, lng, radius_km, limit, query)).to_list(limit)
+    return [NearbyActivityResponse(**activity) for activity in activities]
 
 @api_router.get("/activities/{activity_id}", response_model=ActivityResponse)
-async def get_activity(activity_id: str):
-    activity = await db.activities.find_one({"id": activity_id}, {"_id": 0})
+async def get_activity(activity_id: str, fields: Optional[str] = None):
+    selected = parse_fields(fields, ActivityResponse)
+    activity = await repos.activities.get({"id": activity_id}, fields_projection(selected))
     if not activity:
         raise HTTPException(status_code=404, detail="Activity not found")
-    return ActivityResponse(**activity)
+    return sparse_response(ActivityResponse, activity, selected)
+
+# Currency routes
+@api_router.get("/currencies", response_model=CurrencyRatesResponse)
+async def get_currency_rates():
+    rates = currencies.rate_table()
+    return CurrencyRatesResponse(version=rates.version, base=rates.base, rates=dict(zip(rates.codes, rates.rates.tolist())))
+
+# Summary routes
+@api_router.get("/users/summary", response_model=UserSummaryResponse)
+async def get_user_summary(display_currency: str = Depends(get_display_currency), user_id: str = Depends(get_current_user)):
+    summary = await repos.user_summaries.get({"user_id": user_id})
+    return UserSummaryResponse(**convert_summary(summary or {}, display_currency))
+
+@api_router.get("/trips/{trip_id}/summary", response_model=TripSummaryResponse)
+async def get_trip_summary(trip_id: str, display_currency: str = Depends(get_display_currency), user_id: str = Depends(get_current_user)):
+    summary = await repos.trip_summaries.get({"trip_id": trip_id, "user_id": user_id})
+    if summary:
+        return TripSummaryResponse(**convert_summary(summary, display_currency))
+    
+    # Trips created before summaries existed have none until the next reconciliation
+    trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, {"id": 1})
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    return TripSummaryResponse(**convert_summary({"trip_id": trip_id}, display_currency))
 
 # User profile routes
 @api_router.get("/users/profile", response_model=UserResponse)
-async def get_user_profile(user_id: str = Depends(get_current_user)):
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+async def get_user_profile(fields: Optional[str] = None, user_id: str = Depends(get_current_user)):
+    selected = parse_fields(fields, UserResponse)
+    user = await repos.users.get({"id": user_id}, fields_projection(selected) if selected else {"password": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return UserResponse(**user)
+    return sparse_response(UserResponse, user, selected)
 
 @api_router.put("/users/profile", response_model=UserResponse)
-async def update_user_profile(profile_data: UserProfileUpdate, user_id: str = Depends(get_current_user)):
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
+async def update_user_profile(profile_data: UserProfileUpdate, response: Response, if_match: Optional[str] = Header(None), user_id: str = Depends(get_current_user)):
+    expected_version = parse_if_match(if_match)
     update_data = {k: v for k, v in profile_data.model_dump().items() if v is not None}
-    if update_data:
-        await db.users.update_one({"id": user_id}, {"$set": update_data})
-        user.update(update_data)
+    if "currency" in update_data:
+        update_data["currency"] = parse_currency(update_data["currency"])
+    stored_urls = []
+    if media.is_data_url(update_data.get("profile_photo")):
+        update_data["profile_photo"] = await externalize_media(update_data["profile_photo"], user_id, "profile_photo")
+        stored_urls.append(update_data["profile_photo"])
     
+    user = await versioned_media_update(repos.users, {"id": user_id}, update_data, expected_version, {"password": 0}, "User not found", stored_urls)
+    set_etag(response, user)
     return UserResponse(**user)
 
-app.include_router(api_router)
+# Sync routes
+@api_router.get("/sync", response_model=SyncResponse)
+async def sync(since: Optional[str] = None, user_id: str = Depends(get_current_user)):
+    now = datetime.now(timezone.utc)
+    positions = decode_sync_cursor(since) if since else {}
+    
+    # Tombstones older than the retention window are gone, so start over
+    reset = False
+    oldest = min((ts for ts, _ in positions.values()), default=None)
+    if oldest is not None and oldest < (now - TOMBSTONE_RETENTION).isoformat():
+        positions, reset = {}, True
+    
+    trailing = (now - SYNC_CURSOR_LAG).isoformat()
+    has_more = False
+    changes = {}
+    next_positions = {}
+    for collection_name in SYNC_COLLECTIONS + ["tombstones"]:
+        query = {"user_id": user_id}
+        if collection_name in positions:
+            ts, last_id = positions[collection_name]
+            query["$or"] = [{"updated_at": {"$gt": ts}}, {"updated_at": ts, "id": {"$gt": last_id}}]
+        
+        projection = {"expires_at": 0} if collection_name == "tombstones" else None
+        docs = await repos[collection_name].find(query, projection, sort=[("updated_at", ASCENDING), ("id", ASCENDING)], limit=SYNC_PAGE_SIZE + 1)
+        if len(docs) > SYNC_PAGE_SIZE:
+            has_more = True
+            docs = docs[:SYNC_PAGE_SIZE]
+            next_positions[collection_name] = (docs[-1]["updated_at"], docs[-1]["id"])
+        else:
+            # Trail the clock so writes that commit out of timestamp order are resent, not skipped
+            next_positions[collection_name] = (trailing, "")
+        changes[collection_name] = docs
+    
+    return SyncResponse(
+        cursor=encode_sync_cursor(next_positions),
+        has_more=has_more,
+        reset=reset,
+        trips=[TripResponse(**doc) for doc in changes["trips"]],
+        stops=[StopResponse(**doc) for doc in changes["stops"]],
+        trip_activities=[TripActivityResponse(**doc) for doc in changes["trip_activities"]],
+        trip_costs=[TripCostResponse(**doc) for doc in changes["trip_costs"]],
+        deleted=[TombstoneResponse(**doc) for doc in changes["tombstones"]]
+    )
+
+# Import routes
+@api_router.post("/imports", response_model=ImportResponse, status_code=202, dependencies=[Depends(require_mongo)])
+async def create_import(file: UploadFile = File(...), user_id: str = Depends(get_current_user)):
+    file_format = importer.detect_format(file.filename)
+    if not file_format:
+        raise HTTPException(status_code=400, detail="Upload a .csv, .ndjson or .jsonl file")
+    
+    import_id = secrets.token_urlsafe(16)
+    await store_import_upload(file, import_id, user_id)
+    now = datetime.now(timezone.utc).isoformat()
+    import_doc = {
+        "id": import_id,
+        "user_id": user_id,
+        "filename": file.filename,
+        "format": file_format,
+        "status": "queued",
+        "rows_done": 0,
+        "counts": {},
+        "error_count": 0,
+        "errors": [],
+        "error": None,
+        "created_at": now,
+        "updated_at": now
+    }
+    await db.imports.insert_one(import_doc)
+    await enqueue_job("import_itinerary", {"import_id": import_id}, user_id, max_attempts=IMPORT_MAX_ATTEMPTS)
+    return ImportResponse(**import_doc)
+
+@api_router.get("/imports/{import_id}", response_model=ImportResponse, dependencies=[Depends(require_mongo)])
+async def get_import(import_id: str, user_id: str = Depends(get_current_user)):
+    import_doc = await db.imports.find_one({"id": import_id, "user_id": user_id}, {"_id": 0})
+    if not import_doc:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return ImportResponse(**import_doc)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+@api_router.post("/imports/{import_id}/resume", response_model=ImportResponse, status_code=202, dependencies=[Depends(require_mongo)])
+async def resume_import(import_id: str, user_id: str = Depends(get_current_user)):
+    import_doc = await db.imports.find_one({"id": import_id, "user_id": user_id}, {"_id": 0, "errors": 0})
+    if not import_doc:
+        raise HTTPException(status_code=404, detail="Import not found")
+    if import_doc["status"] == "completed":
+        raise HTTPException(status_code=409, detail="Import already completed")
+    active = await repos.jobs.get({"type": "import_itinerary", "payload.import_id": import_id, "status": {"$in": jobs.ACTIVE_STATUSES}}, {"id": 1})
+    if active:
+        raise HTTPException(status_code=409, detail="Import is already running")
+    
+    # Rows up to rows_done were written before the failure; the import picks up after them
+    await enqueue_job("import_itinerary", {"import_id": import_id}, user_id, max_attempts=IMPORT_MAX_ATTEMPTS)
+    return ImportResponse(**import_doc, errors=[])
+
+# Job routes
+@api_router.get("/jobs", response_model=List[JobResponse])
+async def get_jobs(status: Optional[str] = None, limit: int = Query(20, ge=1, le=100), user_id: str = Depends(get_current_user)):
+    query = {"user_id": user_id}
+    if status:
+        query["status"] = status
+    return await repos.jobs.find(query, sort=[("created_at", DESCENDING)], limit=limit)
+
+@api_router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, user_id: str = Depends(get_current_user)):
+    job = await repos.jobs.get({"id": job_id, "user_id": user_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Media routes
+@api_router.post("/media", response_model=MediaResponse, dependencies=[Depends(require_mongo)])
+async def upload_media(file: UploadFile = File(...), user_id: str = Depends(get_current_user)):
+    return MediaResponse(**await media.store_upload(media_bucket, file, user_id, "upload"))
+
+@api_router.post("/trips/{trip_id}/cover-photo", response_model=TripResponse, dependencies=[Depends(require_mongo)])
+async def upload_trip_cover_photo(trip_id: str, response: Response, file: UploadFile = File(...), if_match: Optional[str] = Header(None), user_id: str = Depends(get_current_user)):
+    expected_version = parse_if_match(if_match)
+    trip = await repos.trips.get({"id": trip_id, "user_id": user_id}, {"id": 1})
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    
+    stored = await media.store_upload(media_bucket, file, user_id, "cover_photo")
+    trip = await versioned_media_update(repos.trips, {"id": trip_id, "user_id": user_id}, {"cover_photo": stored["url"]}, expected_version, None, "Trip not found", [stored["url"]])
+    set_etag(response, trip)
+    trip_response = TripResponse(**trip)
+    await publish_trip_events(trip_id, [updated_event("trips", trip_response, {"cover_photo"})])
+    return trip_response
+
+@api_router.post("/users/profile/photo", response_model=UserResponse, dependencies=[Depends(require_mongo)])
+async def upload_profile_photo(response: Response, file: UploadFile = File(...), if_match: Optional[str] = Header(None), user_id: str = Depends(get_current_user)):
+    expected_version = parse_if_match(if_match)
+    stored = await media.store_upload(media_bucket, file, user_id, "profile_photo")
+    user = await versioned_media_update(repos.users, {"id": user_id}, {"profile_photo": stored["url"]}, expected_version, {"password": 0}, "User not found", [stored["url"]])
+    set_etag(response, user)
+    return UserResponse(**user)
+
+@api_router.get("/media/{media_id}", dependencies=[Depends(require_mongo)])
+async def get_media(
+    media_id: str,
+    variant: Optional[str] = None,
+    token: Optional[str] = None,
+    share_token: Optional[str] = None,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    # Image tags cannot set headers, so owners may pass their JWT as token and viewers of a
+    # public trip its share_token, which opens that trip's cover photo and nothing else
+    if credentials:
+        token = credentials.credentials
+    if not token and not share_token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    file_id = media.thumbnail_id(media_id) if variant == "thumb" else media_id
+    try:
+        grid_out = await media_bucket.open_download_stream(file_id)
+    except NoFile:
+        raise HTTPException(status_code=404, detail="Media not found")
+    if not await can_read_media(media_id, grid_out.metadata or {}, token, share_token):
+        raise HTTPException(status_code=404, detail="Media not found")
+    
+    # Media ids are never reused, so the content behind a URL is immutable; private keeps
+    # shared caches from handing it to requests that never passed the check above
+    etag = f'"{file_id}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    
+    length = grid_out.length
+    content_type = (grid_out.metadata or {}).get("content_type", "application/octet-stream")
+    byte_range = media.parse_range(range_header, length)
+    if byte_range is None:
+        start, end, status_code = 0, length - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1)
+    
+    return StreamingResponse(media.iter_grid_out(grid_out, start, end), status_code=status_code, media_type=content_type, headers=headers)
+
+# Profiling routes
+@api_router.get("/admin/profile/cpu")
+async def profile_cpu(
+    seconds: float = Query(10.0, gt=0, le=CPU_PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    format: str = "collapsed",
+    idle: bool = False,
+    user_id: str = Depends(get_admin_user)
+):
+    if format not in CPU_PROFILE_FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {', '.join(CPU_PROFILE_FORMATS)}")
+    if cpu_profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A CPU profile is already running on this worker")
+    
+    async with cpu_profile_lock:
+        # The sampler runs on its own thread and sees the event loop thread like any other
+        samples = await run_in_threadpool(profiling.sample_stacks, seconds, interval_ms / 1000, idle)
+    
+    name = f"cpu-{os.getpid()}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}"
+    media_type, extension = CPU_PROFILE_FORMATS[format]
+    if format == "collapsed":
+        content = profiling.collapsed(samples)
+    else:
+        content = profiling.speedscope(samples, interval_ms / 1000, name)
+    return Response(content, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'})
+
+@api_router.get("/admin/profile/loop", response_model=LoopStatsResponse)
+async def profile_loop(user_id: str = Depends(get_admin_user)):
+    if not loop_monitor:
+        raise HTTPException(status_code=503, detail="Event loop monitor is disabled")
+    return LoopStatsResponse(pid=os.getpid(), **loop_monitor.stats())
+
+@api_router.post("/admin/profile/memory/snapshots", response_model=MemorySnapshotResponse)
+async def take_memory_snapshot(limit: int = Query(20, ge=1, le=200), user_id: str = Depends(get_admin_user)):
+    snapshot_id, taken_at, snapshot = await run_in_threadpool(memory_snapshots.take)
+    statistics = await run_in_threadpool(snapshot.statistics, "lineno")
+    return MemorySnapshotResponse(
+        id=snapshot_id,
+        pid=os.getpid(),
+        taken_at=taken_at,
+        traced_kb=round(sum(stat.size for stat in statistics) / 1024, 1),
+        top=profiling.allocation_rows(statistics, limit)
+    )
+
+@api_router.get("/admin/profile/memory/snapshots/{snapshot_id}", response_model=MemorySnapshotResponse)
+async def get_memory_snapshot(snapshot_id: str, group_by: str = "lineno", limit: int = Query(20, ge=1, le=200), user_id: str = Depends(get_admin_user)):
+    if group_by not in MEMORY_GROUPINGS:
+        raise HTTPException(status_code=422, detail=f"group_by must be one of {', '.join(MEMORY_GROUPINGS)}")
+    stored = memory_snapshots.get(snapshot_id)
+    if not stored:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    
+    taken_at, snapshot = stored
+    statistics = await run_in_threadpool(snapshot.statistics, group_by)
+    return MemorySnapshotResponse(
+        id=snapshot_id,
+        pid=os.getpid(),
+        taken_at=taken_at,
+        traced_kb=round(sum(stat.size for stat in statistics) / 1024, 1),
+        top=profiling.allocation_rows(statistics, limit)
+    )
+
+@api_router.get("/admin/profile/memory/snapshots/{snapshot_id}/diff", response_model=MemoryDiffResponse)
+async def diff_memory_snapshots(snapshot_id: str, against: str, group_by: str = "lineno", limit: int = Query(20, ge=1, le=200), user_id: str = Depends(get_admin_user)):
+    if group_by not in MEMORY_GROUPINGS:
+        raise HTTPException(status_code=422, detail=f"group_by must be one of {', '.join(MEMORY_GROUPINGS)}")
+    stored = memory_snapshots.get(snapshot_id)
+    base = memory_snapshots.get(against)
+    if not stored or not base:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    
+    # Largest growth since the base snapshot first
+    statistics = await run_in_threadpool(stored[1].compare_to, base[1], group_by)
+    return MemoryDiffResponse(id=snapshot_id, against=against, pid=os.getpid(), top=profiling.allocation_rows(statistics, limit))
+
+@api_router.get("/admin/profile/memory/snapshots/{snapshot_id}/download")
+async def download_memory_snapshot(snapshot_id: str, user_id: str = Depends(get_admin_user)):
+    stored = memory_snapshots.get(snapshot_id)
+    if not stored:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    
+    content = await run_in_threadpool(memory_snapshots.dump, stored[1])
+    filename = f"memory-{os.getpid()}-{snapshot_id}.tracemalloc"
+    return Response(content, media_type="application/octet-stream", headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@api_router.delete("/admin/profile/memory")
+async def stop_memory_tracing(user_id: str = Depends(get_admin_user)):
+    # Tracing slows every allocation down; stop it once the investigation is over
+    memory_snapshots.stop()
+    return {"message": "Memory tracing stopped"}
+
+@api_router.get("/admin/profile/models", response_model=ModelCountsResponse)
+async def count_live_models(limit: int = Query(50, ge=1, le=500), user_id: str = Depends(get_admin_user)):
+    counts = await run_in_threadpool(profiling.live_model_counts)
+    return ModelCountsResponse(
+        pid=os.getpid(),
+        total=sum(counts.values()),
+        models=[ModelCount(model=model, count=count) for model, count in counts.most_common(limit)]
+    )
+
+# Health routes
+@api_router.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+@api_router.get("/health/ready")
+async def readiness(request: Request):
+    if not getattr(request.app.state, "ready", False):
+        raise HTTPException(status_code=503, detail="Not ready")
+    return {"status": "ready"}
 
 logging.basicConfig(
     level=logging.INFO,
@@ -543,6 +2404,101 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+async def create_indexes():
+    for collection_name in SYNC_COLLECTIONS + ["tombstones"]:
+        await db[collection_name].create_index([("user_id", ASCENDING), ("updated_at", ASCENDING), ("id", ASCENDING)])
+    await db.tombstones.create_index("expires_at", expireAfterSeconds=0)
+    await db.cities.create_index([("location", "2dsphere")])
+    await db.activities.create_index([("location", "2dsphere"), ("category", ASCENDING), ("cost", ASCENDING)])
+    await db.activities.create_index([("city_id", ASCENDING), ("category", ASCENDING), ("cost", ASCENDING)])
+    await db.activities.create_index([("city_id", ASCENDING), ("duration_min", ASCENDING)])
+    await db.trips.create_index([("user_id", ASCENDING), ("start_date", ASCENDING)])
+    await db.trips.create_index([("user_id", ASCENDING), ("end_date", ASCENDING)])
+    await db.trip_activities.create_index([("trip_id", ASCENDING), ("date", ASCENDING)])
+    await db.trip_activities.create_index([("user_id", ASCENDING), ("date", ASCENDING)])
+    await db.stops.create_index("updated_at")
+    await db.stops.create_index([("trip_id", ASCENDING), ("order", ASCENDING)])
+    await db.trips.create_index("updated_at")
+    await db.trip_activities.create_index("updated_at")
+    await db.trip_costs.create_index("updated_at")
+    await db.tombstones.create_index([("collection", ASCENDING), ("updated_at", ASCENDING)])
+    await db.city_visits.create_index("city_id")
+    await db.city_rankings.create_index([("weight", DESCENDING), ("_id", ASCENDING)])
+    await db.public_trip_feed.create_index([("published_at", DESCENDING), ("_id", DESCENDING)])
+    await db.user_summaries.create_index("user_id", unique=True)
+    await db.trip_summaries.create_index("trip_id", unique=True)
+    await db.trip_summaries.create_index("user_id")
+    await db.imports.create_index([("id", ASCENDING), ("user_id", ASCENDING)])
+    await db.jobs.create_index("id", unique=True)
+    await db.jobs.create_index([("type", ASCENDING), ("status", ASCENDING), ("run_at", ASCENDING)])
+    await db.jobs.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
+    await db.jobs.create_index("payload.import_id", sparse=True)
+    await db.jobs.create_index("payload.trip_id", sparse=True)
+    await db.jobs.create_index("finished_at", expireAfterSeconds=int(JOB_RETENTION.total_seconds()))
+
+async def warm_connection_pool(size: int):
+    # Each concurrent ping checks out its own connection, so the pool is open before traffic arrives
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(size)))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db, repos, media_bucket, import_bucket, job_worker, trip_event_bus, loop_monitor
+    app.state.ready = False
+    background_tasks = []
+    if STORAGE_BACKEND == "memory":
+        repos = repositories.memory_repositories()
+        trip_event_bus = trip_events.TripEventBus(trip_events.LocalBroadcast())
+    else:
+        min_pool_size = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+        client = AsyncIOMotorClient(
+            os.environ['MONGO_URL'],
+            maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+            minPoolSize=min_pool_size
+        )
+        db = client[os.environ['DB_NAME']]
+        repos = repositories.mongo_repositories(db)
+        trip_event_bus = trip_events.TripEventBus(trip_events.MongoBroadcast(db) if TRIP_EVENTS_BACKEND == "mongo" else trip_events.LocalBroadcast())
+        media_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="media")
+        import_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="imports")
+        
+        await warm_connection_pool(max(min_pool_size, 1))
+        await create_indexes()
+        background_tasks.append(asyncio.create_task(refresh_feeds_periodically()))
+    await build_catalog_indexes()
+    background_tasks.append(asyncio.create_task(refresh_catalog_indexes()))
+    background_tasks.append(asyncio.create_task(trip_event_bus.run()))
+    if JOB_WORKER_ENABLED:
+        job_worker = jobs.JobWorker(repos.jobs, JOB_HANDLERS, JOB_CONCURRENCY)
+        background_tasks.append(asyncio.create_task(job_worker.run()))
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor = profiling.LoopMonitor(threshold=LOOP_BLOCK_THRESHOLD)
+        background_tasks.append(asyncio.create_task(loop_monitor.run()))
+    app.state.ready = True
+    logger.info(f"Application ready ({STORAGE_BACKEND} storage)")
+    
+    yield
+    
+    # Fail readiness first so load balancers stop routing here while in-flight requests drain
+    app.state.ready = False
+    # The job worker hands its running jobs back to the queue; imports keep their checkpoint
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    job_worker = None
+    loop_monitor = None
+    if client:
+        client.close()
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(api_router)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    return app
+
+app = create_app()
@@ -0,0 +1,77 @@
+from bisect import bisect_left
+from typing import List, Optional, Sequence
+
+# New stops are spaced this far apart, leaving room for many inserts between any two
+ORDER_GAP = 1024.0
+# Neighbours closer than this get the trip's keys spread out again by a background job
+REBALANCE_GAP = 1e-3
+
+
+def spread(count: int) -> List[float]:
+    return [ORDER_GAP * (i + 1) for i in range(count)]
+
+
+def after(last: Optional[float]) -> float:
+    return ORDER_GAP if last is None else float(last) + ORDER_GAP
+
+
+def _increasing_run(keys: Sequence[float]) -> List[int]:
+    """Positions of a longest strictly increasing subsequence of keys (patience sorting)."""
+    tails: List[float] = []
+    tail_positions: List[int] = []
+    previous = [-1] * len(keys)
+    for position, key in enumerate(keys):
+        slot = bisect_left(tails, key)
+        if slot == len(tails):
+            tails.append(key)
+            tail_positions.append(position)
+        else:
+            tails[slot] = key
+            tail_positions[slot] = position
+        previous[position] = tail_positions[slot - 1] if slot else -1
+    run = []
+    position = tail_positions[-1] if tail_positions else -1
+    while position >= 0:
+        run.append(position)
+        position = previous[position]
+    return run[::-1]
+
+
+def reorder(keys: Sequence[float]) -> List[float]:
+    """New keys for stops whose current keys are given in their new order.
+
+    The stops along a longest increasing run of the current keys are already in
+    order relative to each other and keep their keys; only the rest are given new
+    keys, evenly spaced into the gap between their kept neighbours. Dragging one
+    stop therefore rewrites one key. Should a gap be too narrow to split, every
+    key is spread afresh instead.
+    """
+    keys = [float(key) for key in keys]
+    kept = _increasing_run(keys)
+    result = list(keys)
+    anchors = [-1] + kept + [len(keys)]
+    for low_position, high_position in zip(anchors, anchors[1:]):
+        moved = high_position - low_position - 1
+        if not moved:
+            continue
+        low = keys[low_position] if low_position >= 0 else None
+        high = keys[high_position] if high_position < len(keys) else None
+        if low is None and high is None:
+            return spread(len(keys))
+        if low is None:
+            new_keys = [high - ORDER_GAP * (moved - i) for i in range(moved)]
+        elif high is None:
+            new_keys = [low + ORDER_GAP * (i + 1) for i in range(moved)]
+        else:
+            step = (high - low) / (moved + 1)
+            new_keys = [low + step * (i + 1) for i in range(moved)]
+            # Float midpoints eventually collide with their neighbours; renumber before they do
+            if step <= 0 or any(not low < key < high for key in new_keys):
+                return spread(len(keys))
+        result[low_position + 1:high_position] = new_keys
+    return result
+
+
+def needs_rebalance(keys: Sequence[float]) -> bool:
+    """Whether sorted keys have neighbours closer than REBALANCE_GAP."""
+    return any(high - low < REBALANCE_GAP for low, high in zip(keys, keys[1:]))
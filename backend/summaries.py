@@ -0,0 +1,96 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pymongo import ReplaceOne
+
+SUMMARY_COUNTERS = ("stops", "activities", "costs")
+# Trip activity prices count towards spend under their own category
+ACTIVITY_SPEND_CATEGORY = "Activities"
+
+
+def category_key(category: Optional[str]) -> str:
+    # Categories become field names under spend_by_category, where "." and a leading "$" are not allowed
+    key = (category or "").strip().replace(".", "_").lstrip("$")
+    return key or "Other"
+
+
+def summary_inc(spend: Optional[Dict[str, float]] = None, **counts: int) -> dict:
+    """Build the $inc document that applies a change to a user or trip summary."""
+    inc = {name: value for name, value in counts.items() if value}
+    for category, amount in (spend or {}).items():
+        if not amount:
+            continue
+        field = f"spend_by_category.{category_key(category)}"
+        inc[field] = inc.get(field, 0) + amount
+        inc["total_spend"] = inc.get("total_spend", 0) + amount
+    return inc
+
+
+def empty_summary() -> dict:
+    return {**{name: 0 for name in SUMMARY_COUNTERS}, "total_spend": 0.0, "spend_by_category": {}}
+
+
+def _add_spend(summary: dict, category: str, amount: float):
+    key = category_key(category)
+    summary["spend_by_category"][key] = summary["spend_by_category"].get(key, 0.0) + amount
+    summary["total_spend"] += amount
+
+
+async def rebuild_summaries(db, user_ids: List[str]) -> int:
+    """Recompute the user and trip summaries of a batch of users from the source collections.
+
+    Each child collection is grouped by trip in a single aggregation, so a batch costs
+    a fixed number of queries however many trips it holds. Children whose trip no
+    longer exists are ignored. Spend is summed in the base currency, from the base value
+    each item stored when it was written; items older than that count their raw amount.
+    Returns the number of trip summaries written.
+    """
+    if not user_ids:
+        return 0
+    match = {"user_id": {"$in": user_ids}}
+    trips = await db.trips.find(match, {"_id": 0, "id": 1, "user_id": 1}).to_list(None)
+    trip_summaries = {trip["id"]: {"trip_id": trip["id"], "user_id": trip["user_id"], **empty_summary()} for trip in trips}
+
+    async for row in db.stops.aggregate([{"$match": match}, {"$group": {"_id": "$trip_id", "count": {"$sum": 1}}}]):
+        if row["_id"] in trip_summaries:
+            trip_summaries[row["_id"]]["stops"] = row["count"]
+
+    async for row in db.trip_activities.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$trip_id", "count": {"$sum": 1}, "spend": {"$sum": {"$ifNull": ["$base_cost", "$cost"]}}}}
+    ]):
+        if row["_id"] in trip_summaries:
+            trip_summaries[row["_id"]]["activities"] = row["count"]
+            _add_spend(trip_summaries[row["_id"]], ACTIVITY_SPEND_CATEGORY, row["spend"])
+
+    async for row in db.trip_costs.aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"trip_id": "$trip_id", "category": "$category"}, "count": {"$sum": 1}, "spend": {"$sum": {"$ifNull": ["$base_amount", "$amount"]}}}}
+    ]):
+        summary = trip_summaries.get(row["_id"]["trip_id"])
+        if summary:
+            summary["costs"] += row["count"]
+            _add_spend(summary, row["_id"].get("category"), row["spend"])
+
+    now = datetime.now(timezone.utc).isoformat()
+    user_summaries = {user_id: {"user_id": user_id, "trips": 0, **empty_summary()} for user_id in user_ids}
+    for summary in trip_summaries.values():
+        totals = user_summaries[summary["user_id"]]
+        totals["trips"] += 1
+        for name in SUMMARY_COUNTERS:
+            totals[name] += summary[name]
+        for category, amount in summary["spend_by_category"].items():
+            _add_spend(totals, category, amount)
+        summary["updated_at"] = now
+
+    if trip_summaries:
+        await db.trip_summaries.bulk_write(
+            [ReplaceOne({"trip_id": trip_id}, summary, upsert=True) for trip_id, summary in trip_summaries.items()],
+            ordered=False
+        )
+    await db.trip_summaries.delete_many({**match, "trip_id": {"$nin": list(trip_summaries)}})
+    await db.user_summaries.bulk_write(
+        [ReplaceOne({"user_id": user_id}, {**summary, "updated_at": now}, upsert=True) for user_id, summary in user_summaries.items()],
+        ordered=False
+    )
+    return len(trip_summaries)
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Set
+
+from pymongo import CursorType
+
+logger = logging.getLogger(__name__)
+
+# Events a socket may fall behind by before it is told to resync instead
+MAX_PENDING_EVENTS = 256
+EVENT_LOG_BYTES = 16 * 1024 * 1024
+TAIL_RETRY_SECONDS = 1.0
+
+
+class Broadcast(ABC):
+    """Carries published messages to every app worker, including the publishing one.
+
+    Each message is {"trip_id": ..., "events": [...]}; listen() yields them in the
+    order the backend delivers them, for as long as the worker runs.
+    """
+
+    async def setup(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, message: dict):
+        ...
+
+    @abstractmethod
+    def listen(self) -> AsyncIterator[dict]:
+        ...
+
+
+class LocalBroadcast(Broadcast):
+    """Single-process stand-in: messages loop straight back to this worker."""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def publish(self, message):
+        self.queue.put_nowait(message)
+
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+
+
+class MongoBroadcast(Broadcast):
+    """Fans out across workers through a capped collection that every worker tails."""
+
+    def __init__(self, db, collection_name: str = "trip_events"):
+        self.db = db
+        self.collection_name = collection_name
+
+    async def setup(self):
+        if self.collection_name not in await self.db.list_collection_names():
+            await self.db.create_collection(self.collection_name, capped=True, size=EVENT_LOG_BYTES)
+
+    async def publish(self, message):
+        await self.db[self.collection_name].insert_one(dict(message))
+
+    async def listen(self):
+        collection = self.db[self.collection_name]
+        started = False
+        last_id = None
+        while True:
+            try:
+                if not started:
+                    # Only messages published after this worker started listening are delivered
+                    latest = await collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+                    last_id = latest["_id"] if latest else None
+                    started = True
+                query = {"_id": {"$gt": last_id}} if last_id else {}
+                cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for message in cursor:
+                        last_id = message.pop("_id")
+                        yield message
+            except Exception:
+                # A network blip, failover or CappedPositionLost ends the cursor; tail again
+                # from the last message delivered rather than letting the bus task die
+                logger.exception("Trip event tail on %s failed; retrying from %s", self.collection_name, last_id)
+            # A tailable cursor dies on an empty collection; wait for the first message
+            await asyncio.sleep(TAIL_RETRY_SECONDS)
+
+
+class TripEventBus:
+    """In-process pub/sub of trip change events, fed by a Broadcast backend.
+
+    Handlers publish after they write; every worker's bus hears the message back
+    from the backend and hands the events to the sockets subscribed to that trip.
+    A subscriber that falls MAX_PENDING_EVENTS behind has its backlog replaced by a
+    single resync event, so one slow client never holds up the rest.
+    """
+
+    def __init__(self, backend: Broadcast):
+        self.backend = backend
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, trip_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(MAX_PENDING_EVENTS)
+        self.subscribers.setdefault(trip_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, trip_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(trip_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[trip_id]
+
+    async def publish(self, trip_id: str, events: List[dict]):
+        if not events:
+            return
+        try:
+            await self.backend.publish({"trip_id": trip_id, "events": events})
+        except Exception:
+            # The write already succeeded; a missed push only costs clients a refetch
+            logger.exception("Could not publish %s events for trip %s", len(events), trip_id)
+
+    def deliver(self, message: dict):
+        for queue in self.subscribers.get(message["trip_id"], ()):
+            for event in message["events"]:
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait({"op": "resync"})
+                    break
+
+    async def run(self):
+        while True:
+            try:
+                await self.backend.setup()
+                async for message in self.backend.listen():
+                    self.deliver(message)
+            except Exception:
+                logger.exception("Trip event bus stopped; restarting in %ss", TAIL_RETRY_SECONDS)
+            await asyncio.sleep(TAIL_RETRY_SECONDS)
@@ -1,7 +1,11 @@
+import base64
 import requests
 import sys
 import json
+import tempfile
+import time
 from datetime import datetime, timedelta
+from pathlib import Path
 
 class TravelPlannerAPITester:
     def __init__(self, base_url="https://api-explorer-27.preview.emergentagent.com"):
@@ -46,6 +50,8 @@ class TravelPlannerAPITester:
                 response = requests.post(url, json=data, headers=test_headers)
             elif method == 'PUT':
                 response = requests.put(url, json=data, headers=test_headers)
+            elif method == 'PATCH':
+                response = requests.patch(url, json=data, headers=test_headers)
             elif method == 'DELETE':
                 response = requests.delete(url, headers=test_headers)
 
@@ -67,6 +73,33 @@ class TravelPlannerAPITester:
             self.log_test(name, False, f"Exception: {str(e)}")
             return False, {}
 
+    def run_raw_test(self, name, method, endpoint, expected_status, headers=None, **kwargs):
+        """Run a single API test and return the raw response, for bodies that are not JSON"""
+        url = f"{self.api_base}/{endpoint}"
+        test_headers = {'Authorization': f'Bearer {self.token}'} if self.token else {}
+        
+        if headers:
+            test_headers.update(headers)
+        
+        try:
+            response = requests.request(method, url, headers=test_headers, **kwargs)
+        except Exception as e:
+            self.log_test(name, False, f"Exception: {str(e)}")
+            return False, None
+        
+        success = response.status_code == expected_status
+        self.log_test(name, success, "" if success else f"Expected {expected_status}, got {response.status_code} - {response.text[:100]}")
+        return success, response
+
+    def test_health(self):
+        """Test liveness and readiness probes"""
+        success, response = self.run_test("Liveness Probe", "GET", "health/live", 200)
+        if not success or response.get('status') != "alive":
+            return False
+        
+        success, response = self.run_test("Readiness Probe", "GET", "health/ready", 200)
+        return success and response.get('status') == "ready"
+
     def test_auth_signup(self):
         """Test user signup"""
         timestamp = datetime.now().strftime('%H%M%S')
@@ -139,6 +172,53 @@ class TravelPlannerAPITester:
             return True
         return False
 
+    def test_cities_nearby(self):
+        """Test nearby city search"""
+        success, response = self.run_test(
+            "Get Nearby Cities",
+            "GET",
+            "cities/nearby?lat=48.8566&lng=2.3522&radius_km=1500&limit=5",
+            200
+        )
+        
+        if success and isinstance(response, list):
+            distances = [city['distance_m'] for city in response]
+            return distances == sorted(distances)
+        return False
+
+    def test_cities_compare(self):
+        """Test destination cost comparison"""
+        success, cities = self.run_test("Get Cities To Compare", "GET", "cities?fields=id", 200)
+        if not success or not cities:
+            return False
+        
+        success, response = self.run_test(
+            "Compare City Costs",
+            "POST",
+            "cities/compare",
+            200,
+            data={"city_ids": [city['id'] for city in cities[:5]], "days": 5, "style": "budget"}
+        )
+        
+        if success:
+            totals = [result['total'] for result in response['results']]
+            return len(totals) == min(len(cities), 5) and totals == sorted(totals)
+        return False
+
+    def test_search_activities(self):
+        """Test full-text activity search"""
+        success, response = self.run_test(
+            "Search Activities",
+            "GET",
+            "search/activities?q=museum&limit=5",
+            200
+        )
+        
+        if success and 'results' in response:
+            scores = [hit['score'] for hit in response['results']]
+            return scores == sorted(scores, reverse=True)
+        return False
+
     def test_activities_get_all(self):
         """Test get all activities"""
         success, response = self.run_test(
@@ -153,6 +233,21 @@ class TravelPlannerAPITester:
             return True
         return False
 
+    def test_activities_filter_sort(self):
+        """Test activity cost and duration filters with sorting"""
+        success, response = self.run_test(
+            "Filter And Sort Activities",
+            "GET",
+            "activities?max_cost=50&max_duration=180&sort=-cost&fields=id,cost,duration_max",
+            200
+        )
+        
+        if success and isinstance(response, list):
+            costs = [activity['cost'] for activity in response]
+            fits = all(activity['cost'] <= 50 and activity['duration_max'] is not None and activity['duration_max'] <= 180 for activity in response)
+            return fits and costs == sorted(costs, reverse=True)
+        return False
+
     def test_trip_create(self):
         """Test create trip"""
         start_date = datetime.now().date()
@@ -189,6 +284,35 @@ class TravelPlannerAPITester:
         )
         return success
 
+    def test_trip_get_sparse_fields(self):
+        """Test get trips with a sparse fieldset"""
+        success, response = self.run_test(
+            "Get Trips with Sparse Fields",
+            "GET",
+            "trips?fields=name,start_date,end_date",
+            200
+        )
+        
+        if success and isinstance(response, list):
+            return all(set(trip.keys()) == {"id", "name", "start_date", "end_date"} for trip in response)
+        return False
+
+    def test_trips_upcoming(self):
+        """Test upcoming trips include the new trip"""
+        if not hasattr(self, 'test_trip_id'):
+            return False
+            
+        success, response = self.run_test(
+            "Get Upcoming Trips",
+            "GET",
+            "trips/upcoming?limit=100",
+            200
+        )
+        
+        if success and isinstance(response, list):
+            return any(trip['id'] == self.test_trip_id for trip in response)
+        return False
+
     def test_trip_get_by_id(self):
         """Test get trip by ID"""
         if not hasattr(self, 'test_trip_id'):
@@ -221,6 +345,37 @@ class TravelPlannerAPITester:
         )
         return success
 
+    def test_trip_update_if_match(self):
+        """Test that a stale If-Match version is refused"""
+        if not hasattr(self, 'test_trip_id'):
+            return False
+        
+        success, response = self.run_raw_test("Update Trip For ETag", "PUT", f"trips/{self.test_trip_id}", 200, json={"description": "Versioned"})
+        if not success or 'ETag' not in response.headers:
+            return False
+        
+        stale = response.headers['ETag']
+        success, response = self.run_raw_test(
+            "Update Trip With If-Match",
+            "PUT",
+            f"trips/{self.test_trip_id}",
+            200,
+            headers={'If-Match': stale},
+            json={"description": "Versioned again"}
+        )
+        if not success or response.headers.get('ETag') == stale:
+            return False
+        
+        success, _ = self.run_raw_test(
+            "Reject Stale If-Match",
+            "PUT",
+            f"trips/{self.test_trip_id}",
+            412,
+            headers={'If-Match': stale},
+            json={"description": "Lost update"}
+        )
+        return success
+
     def test_stop_create(self):
         """Test create stop"""
         if not hasattr(self, 'test_trip_id') or not hasattr(self, 'test_city_id'):
@@ -262,6 +417,84 @@ class TravelPlannerAPITester:
         )
         return success
 
+    def test_stops_reorder(self):
+        """Test appending a stop and reordering the trip's stops in one request"""
+        if not hasattr(self, 'test_trip_id') or not hasattr(self, 'test_stop_id'):
+            return False
+        
+        start_date = datetime.now().date() + timedelta(days=4)
+        success, appended = self.run_test(
+            "Append Stop",
+            "POST",
+            f"trips/{self.test_trip_id}/stops",
+            200,
+            data={"city_id": self.test_city_id, "start_date": start_date.isoformat(), "end_date": (start_date + timedelta(days=2)).isoformat()}
+        )
+        if not success:
+            return False
+        
+        success, response = self.run_test(
+            "Reorder Stops",
+            "PATCH",
+            f"trips/{self.test_trip_id}/stops/order",
+            200,
+            data={"stop_ids": [appended['id'], self.test_stop_id]}
+        )
+        if not success or response.get('moved') != 1:
+            return False
+        
+        success, stops = self.run_test("Get Reordered Stops", "GET", f"trips/{self.test_trip_id}/stops", 200)
+        return success and [stop['id'] for stop in stops] == [appended['id'], self.test_stop_id]
+
+    def test_optimize_route(self):
+        """Test route optimization keeps the first stop and never lengthens the route"""
+        success, cities = self.run_test("Get Cities For Route", "GET", "cities?fields=id,lat,lng", 200)
+        cities = [city for city in cities if city.get('lat') is not None][:5] if success else []
+        if len(cities) < 3:
+            return False
+        
+        success, trip = self.run_test(
+            "Create Trip For Route",
+            "POST",
+            "trips",
+            200,
+            data={"name": "Route Trip", "start_date": "2030-03-01", "end_date": "2030-03-10"}
+        )
+        if not success:
+            return False
+        
+        stop_ids = []
+        for city in cities:
+            success, stop = self.run_test(
+                "Add Route Stop",
+                "POST",
+                f"trips/{trip['id']}/stops",
+                200,
+                data={"city_id": city['id'], "start_date": "2030-03-01", "end_date": "2030-03-02"}
+            )
+            if not success:
+                break
+            stop_ids.append(stop['id'])
+        
+        if success:
+            success, response = self.run_test(
+                "Optimize Route",
+                "POST",
+                f"trips/{trip['id']}/optimize-route",
+                200,
+                data={"keep_start": True, "keep_end": False}
+            )
+            success = success and sorted(stop['id'] for stop in response['stops']) == sorted(stop_ids)
+            success = success and response['stops'][0]['id'] == stop_ids[0]
+            success = success and response['total_distance_km'] <= response['previous_distance_km'] + 1e-6
+        
+        if success:
+            success, stops = self.run_test("Get Optimized Stops", "GET", f"trips/{trip['id']}/stops", 200)
+            success = success and [stop['id'] for stop in stops] == [stop['id'] for stop in response['stops']]
+        
+        self.run_test("Delete Route Trip", "DELETE", f"trips/{trip['id']}", 202)
+        return success
+
     def test_trip_activity_create(self):
         """Test add activity to stop"""
         if not hasattr(self, 'test_stop_id') or not hasattr(self, 'test_activity_id'):
@@ -290,6 +523,36 @@ class TravelPlannerAPITester:
             return True
         return False
 
+    def test_trip_activity_conflict(self):
+        """Test overlapping activities are rejected"""
+        if not hasattr(self, 'test_trip_activity_id'):
+            return False
+            
+        activity_data = {
+            "activity_id": self.test_activity_id,
+            "date": datetime.now().date().isoformat(),
+            "time": "10:30",
+            "cost": 50.00
+        }
+        
+        success, _ = self.run_test(
+            "Reject Overlapping Activity",
+            "POST",
+            f"stops/{self.test_stop_id}/activities",
+            409,
+            data=activity_data
+        )
+        if not success:
+            return False
+        
+        success, response = self.run_test(
+            "Get Free Slots",
+            "GET",
+            f"trips/{self.test_trip_id}/free-slots?date={activity_data['date']}",
+            200
+        )
+        return success and all(slot['end'] <= "10:00" or slot['start'] >= "10:00" for slot in response)
+
     def test_trip_activities_get_all(self):
         """Test get all activities for stop"""
         if not hasattr(self, 'test_stop_id'):
@@ -303,6 +566,36 @@ class TravelPlannerAPITester:
         )
         return success
 
+    def test_auto_plan(self):
+        """Test auto-planning fills a stop around its bookings without overlaps"""
+        if not hasattr(self, 'test_stop_id'):
+            return False
+        
+        success, planned = self.run_test(
+            "Auto-Plan Stop",
+            "POST",
+            f"stops/{self.test_stop_id}/auto-plan",
+            200,
+            data={"daily_budget": 150, "max_minutes_per_day": 480, "day_start": "09:00"}
+        )
+        if not success or not planned or not all(item['time'] and item['duration_minutes'] for item in planned):
+            return False
+        
+        success, booked = self.run_test("Get Planned Activities", "GET", f"stops/{self.test_stop_id}/activities", 200)
+        if not success:
+            return False
+        
+        def minutes(clock):
+            hours, mins = clock.split(":")
+            return int(hours) * 60 + int(mins)
+        
+        days = {}
+        for item in booked:
+            if item.get('time') and item.get('duration_minutes'):
+                start = minutes(item['time'])
+                days.setdefault(item['date'], []).append((start, start + item['duration_minutes']))
+        return all(end <= start for slots in days.values() for (_, end), (start, _) in zip(sorted(slots), sorted(slots)[1:]))
+
     def test_cost_create(self):
         """Test add cost to trip"""
         if not hasattr(self, 'test_trip_id'):
@@ -340,6 +633,103 @@ class TravelPlannerAPITester:
         )
         return success
 
+    def test_costs_currency_conversion(self):
+        """Test costs converted to a display currency"""
+        if not hasattr(self, 'test_trip_id'):
+            return False
+        
+        success, rates = self.run_test("Get Currency Rates", "GET", "currencies", 200)
+        if not success or "EUR" not in rates['rates']:
+            return False
+        
+        success, response = self.run_test(
+            "Get Trip Costs In EUR",
+            "GET",
+            f"trips/{self.test_trip_id}/costs?currency=EUR",
+            200
+        )
+        if success and response:
+            expected = round(response[0]['amount'] * rates['rates']['EUR'] / rates['rates'][response[0]['currency']], 2)
+            return response[0]['display_currency'] == "EUR" and abs(response[0]['display_amount'] - expected) < 0.01
+        return False
+
+    def test_delta_sync(self):
+        """Test delta sync returns changed rows and tombstones since a cursor"""
+        if not hasattr(self, 'test_trip_id'):
+            return False
+        
+        cursor = ""
+        trip_ids = set()
+        for _ in range(20):
+            success, page = self.run_test("Full Sync", "GET", f"sync?since={cursor}" if cursor else "sync", 200)
+            if not success:
+                return False
+            trip_ids.update(trip['id'] for trip in page['trips'])
+            cursor = page['cursor']
+            if not page['has_more']:
+                break
+        if self.test_trip_id not in trip_ids:
+            return False
+        
+        success, cost = self.run_test(
+            "Add Cost For Sync",
+            "POST",
+            f"trips/{self.test_trip_id}/costs",
+            200,
+            data={"category": "food", "amount": 12.50, "description": "Sync check"}
+        )
+        if not success:
+            return False
+        
+        success, _ = self.run_test("Delete Cost For Sync", "DELETE", f"costs/{cost['id']}", 200)
+        if not success:
+            return False
+        
+        success, page = self.run_test("Delta Sync", "GET", f"sync?since={cursor}", 200)
+        return success and not page['reset'] and any(gone['id'] == cost['id'] for gone in page['deleted'])
+
+    def test_exports(self):
+        """Test trip exports as NDJSON, CSV and iCalendar"""
+        if not hasattr(self, 'test_trip_id') or not hasattr(self, 'test_stop_id'):
+            return False
+        
+        endpoint = f"trips/{self.test_trip_id}/export"
+        success, response = self.run_raw_test("Export Trip NDJSON", "GET", f"{endpoint}?format=ndjson", 200)
+        if not success:
+            return False
+        
+        records = [json.loads(line) for line in response.text.splitlines() if line]
+        if not records or records[0]['type'] != "trip" or records[0]['id'] != self.test_trip_id:
+            return False
+        if not any(record['type'] == "stop" and record['id'] == self.test_stop_id for record in records):
+            return False
+        
+        success, response = self.run_raw_test("Export Trip CSV", "GET", f"{endpoint}?format=csv", 200)
+        rows = response.text.splitlines() if success else []
+        if not rows or not rows[0].startswith("type,trip_id,trip_name") or not any(self.test_stop_id in row for row in rows[1:]):
+            return False
+        
+        success, response = self.run_raw_test("Export Trip iCalendar", "GET", f"{endpoint}?format=ics", 200)
+        lines = response.text.splitlines() if success else []
+        if not lines or lines[0] != "BEGIN:VCALENDAR" or lines[-1] != "END:VCALENDAR" or f"UID:stop-{self.test_stop_id}@globaltrotters" not in lines:
+            return False
+        
+        success, _ = self.run_raw_test("Export Missing Trip", "GET", "trips/missing-trip/export?format=csv", 404)
+        return success
+
+    def test_user_summary(self):
+        """Test dashboard summary counters"""
+        success, response = self.run_test(
+            "Get User Summary",
+            "GET",
+            "users/summary",
+            200
+        )
+        
+        if success:
+            return response.get('trips', 0) >= 1 and response.get('costs', 0) >= 1
+        return False
+
     def test_user_profile_get(self):
         """Test get user profile"""
         success, response = self.run_test(
@@ -389,9 +779,169 @@ class TravelPlannerAPITester:
                 f"trips/shared/{share_token}",
                 200
             )
+            if success:
+                self.test_share_token = share_token
             return success
         return False
 
+    def test_shared_trip_clone(self):
+        """Test clone shared trip"""
+        if not hasattr(self, 'test_share_token'):
+            return False
+            
+        success, response = self.run_test(
+            "Clone Shared Trip",
+            "POST",
+            f"trips/shared/{self.test_share_token}/clone",
+            200,
+            data={"name": "Cloned Test Trip", "start_date": "2030-01-01"}
+        )
+        
+        if success and 'id' in response:
+            # Remove the clone right away; cleanup only knows about the original trip
+            self.run_test("Delete Cloned Trip", "DELETE", f"trips/{response['id']}", 202)
+            return response['start_date'] == "2030-01-01" and not response['is_public']
+        return False
+
+    def test_discovery_feeds(self):
+        """Test the popular cities and public trips feeds"""
+        success, cities = self.run_test("Get Popular Cities", "GET", "cities/popular?limit=10", 200)
+        if not success:
+            return False
+        
+        scores = [city['score'] for city in cities]
+        if scores != sorted(scores, reverse=True) or any(city['trip_count'] < 1 for city in cities):
+            return False
+        
+        success, trips = self.run_test("Get Public Trips", "GET", "trips/public?limit=10", 200)
+        if not success:
+            return False
+        
+        published = [trip['published_at'] or "" for trip in trips]
+        if published != sorted(published, reverse=True):
+            return False
+        
+        return all(trip['share_token'] and trip['stop_count'] >= 0 for trip in trips)
+
+    def test_import(self):
+        """Test bulk import upload and status"""
+        url = f"{self.api_base}/imports"
+        # A row of unknown type is reported as a row error without writing anything
+        body = "type,trip_id,trip_name\nbogus,t1,Imported Trip\n"
+        try:
+            response = requests.post(
+                url,
+                files={"file": ("itinerary.csv", body, "text/csv")},
+                headers={'Authorization': f'Bearer {self.token}'}
+            )
+        except Exception as e:
+            self.log_test("Create Import", False, f"Exception: {str(e)}")
+            return False
+        
+        success = response.status_code == 202
+        self.log_test("Create Import", success, "" if success else f"Expected 202, got {response.status_code}")
+        if not success:
+            return False
+        
+        import_id = response.json()['id']
+        for _ in range(10):
+            success, status = self.run_test("Get Import", "GET", f"imports/{import_id}", 200)
+            if not success or status['status'] in ("completed", "failed"):
+                break
+            time.sleep(1)
+        return success and status['status'] == "completed" and status['errors'][0]['row'] == 1
+
+    def test_media_range(self):
+        """Test media upload and authorized byte-range reads"""
+        # A 1x1 PNG; the server types uploads by their bytes, not the declared type
+        image = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==")
+        success, response = self.run_raw_test(
+            "Upload Media",
+            "POST",
+            "media",
+            200,
+            files={"file": ("pixel.bin", image, "application/octet-stream")}
+        )
+        if not success:
+            return False
+        
+        media = response.json()
+        if media['content_type'] != "image/png" or media['length'] != len(image):
+            self.log_test("Upload Media Type", False, f"Got {media['content_type']}, {media['length']} bytes")
+            return False
+        
+        success, _ = self.run_raw_test("Get Media Without Token", "GET", f"media/{media['id']}", 401, headers={'Authorization': ''})
+        if not success:
+            return False
+        
+        success, response = self.run_raw_test(
+            "Get Media Range",
+            "GET",
+            f"media/{media['id']}?token={self.token}",
+            206,
+            headers={'Authorization': '', 'Range': 'bytes=0-9'}
+        )
+        return success and response.content == image[:10] and response.headers.get('Content-Range') == f"bytes 0-9/{len(image)}"
+
+    def test_analytics_export(self):
+        """Test the analytics export keeps the latest version of each row and drops deleted rows"""
+        # The export is a CLI over MongoDB, so this drives its module directly on a scratch directory
+        sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+        try:
+            import analytics
+        except ImportError as e:
+            self.log_test("Analytics Rollups", False, f"Exception: {str(e)}")
+            return False
+        
+        def cost(cost_id, amount, updated_at):
+            return {"id": cost_id, "trip_id": "t1", "user_id": "u1", "category": "transport", "amount": amount, "updated_at": updated_at}
+        
+        with tempfile.TemporaryDirectory() as scratch:
+            out = Path(scratch)
+            trip = {"id": "t1", "user_id": "u1", "name": "Analytics Trip", "start_date": "2030-06-01T00:00:00+00:00", "updated_at": "2030-01-05T00:00:00+00:00"}
+            analytics.write_partitioned("trips", [trip], out, "parquet", "first")
+            analytics.write_partitioned("trip_costs", [cost("c1", 100.0, "2030-01-05T00:00:00+00:00"), cost("c2", 50.0, "2030-01-05T00:00:00+00:00")], out, "parquet", "first")
+            # A later incremental run: c1 was edited and c2 deleted
+            analytics.write_partitioned("trip_costs", [cost("c1", 120.0, "2030-02-01T00:00:00+00:00")], out, "parquet", "second")
+            analytics.write_partitioned("tombstones", [{"id": "c2", "collection": "trip_costs", "user_id": "u1", "updated_at": "2030-02-02T00:00:00+00:00"}], out, "parquet", "second")
+            frames = analytics.load_current(out, "parquet")
+            by_month = analytics.build_rollups(frames)["trip_spend_by_month"]
+        
+        success = frames["trip_costs"]["id"].tolist() == ["c1"] and by_month["spend"].tolist() == [120.0]
+        self.log_test("Analytics Rollups", success, "" if success else f"Got {by_month.to_dict('records')}")
+        return success
+
+    def test_delete_job(self):
+        """Test that a trip delete hands its children to a background job"""
+        success, trip = self.run_test(
+            "Create Trip For Delete Job",
+            "POST",
+            "trips",
+            200,
+            data={"name": "Short-lived Trip", "start_date": "2030-02-01", "end_date": "2030-02-03"}
+        )
+        if not success:
+            return False
+        
+        success, response = self.run_test("Delete Trip With Job", "DELETE", f"trips/{trip['id']}", 202)
+        if not success or 'job_id' not in response:
+            return False
+        
+        for _ in range(10):
+            success, job = self.run_test("Get Job", "GET", f"jobs/{response['job_id']}", 200)
+            if not success or job['status'] in ("completed", "failed"):
+                break
+            time.sleep(1)
+        return success and job['status'] == "completed"
+
+    def test_profiling_requires_admin(self):
+        """Test that profiling endpoints refuse accounts not listed in ADMIN_EMAILS"""
+        success, _ = self.run_test("Loop Stats As Non-Admin", "GET", "admin/profile/loop", 403)
+        if not success:
+            return False
+        success, _ = self.run_test("Memory Snapshot As Non-Admin", "POST", "admin/profile/memory/snapshots", 403)
+        return success
+
     def test_cleanup(self):
         """Clean up test data"""
         cleanup_success = True
@@ -432,7 +982,7 @@ class TravelPlannerAPITester:
                 "Delete Trip",
                 "DELETE",
                 f"trips/{self.test_trip_id}",
-                200
+                202
             )
             cleanup_success = cleanup_success and success
         
@@ -444,6 +994,12 @@ class TravelPlannerAPITester:
         print(f"📍 Backend URL: {self.base_url}")
         print("=" * 60)
         
+        # Health tests
+        print("\n💓 Health Tests")
+        if not self.test_health():
+            print("❌ Backend is not ready, stopping tests")
+            return False
+        
         # Authentication tests
         print("\n🔐 Authentication Tests")
         if not self.test_auth_signup():
@@ -459,7 +1015,11 @@ class TravelPlannerAPITester:
         # Data retrieval tests (cities and activities)
         print("\n🏙️ Cities and Activities Tests")
         self.test_cities_get_all()
+        self.test_cities_nearby()
+        self.test_cities_compare()
         self.test_activities_get_all()
+        self.test_activities_filter_sort()
+        self.test_search_activities()
         
         # Trip management tests
         print("\n✈️ Trip Management Tests")
@@ -468,29 +1028,68 @@ class TravelPlannerAPITester:
             return False
         
         self.test_trip_get_all()
+        self.test_trip_get_sparse_fields()
+        self.test_trips_upcoming()
         self.test_trip_get_by_id()
         self.test_trip_update()
+        self.test_trip_update_if_match()
         
         # Stop and activity tests
         print("\n📍 Stops and Activities Tests")
         if self.test_stop_create():
             self.test_stops_get_all()
+            self.test_stops_reorder()
+            self.test_optimize_route()
             self.test_trip_activity_create()
+            self.test_trip_activity_conflict()
             self.test_trip_activities_get_all()
+            self.test_auto_plan()
         
         # Cost management tests
         print("\n💰 Cost Management Tests")
         self.test_cost_create()
         self.test_costs_get_all()
+        self.test_costs_currency_conversion()
+        
+        # Sync tests
+        print("\n🔄 Sync Tests")
+        self.test_delta_sync()
+        
+        # Export tests
+        print("\n📤 Export Tests")
+        self.test_exports()
         
         # User profile tests
         print("\n👤 User Profile Tests")
+        self.test_user_summary()
         self.test_user_profile_get()
         self.test_user_profile_update()
         
         # Sharing tests
         print("\n🔗 Sharing Tests")
         self.test_shared_trip_get()
+        self.test_shared_trip_clone()
+        self.test_discovery_feeds()
+        
+        # Import tests
+        print("\n📥 Import Tests")
+        self.test_import()
+        
+        # Media tests
+        print("\n🖼️ Media Tests")
+        self.test_media_range()
+        
+        # Analytics tests
+        print("\n📈 Analytics Tests")
+        self.test_analytics_export()
+        
+        # Job tests
+        print("\n⚙️ Job Tests")
+        self.test_delete_job()
+        
+        # Profiling tests
+        print("\n🩺 Profiling Tests")
+        self.test_profiling_requires_admin()
         
         # Cleanup
         print("\n🧹 Cleanup Tests")
@@ -0,0 +1,128 @@
+import os
+import sys
+from pathlib import Path
+
+from gridfs.errors import NoFile
+
+import pytest
+from fastapi.testclient import TestClient
+
+# The handlers run against in-process repositories; no MongoDB is needed
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.setdefault("LOOP_MONITOR_ENABLED", "0")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+CITIES = [
+    {"id": "paris", "name": "Paris", "country": "France", "region": "Europe", "lat": 48.8566, "lng": 2.3522, "cost_index": 80},
+    {"id": "lyon", "name": "Lyon", "country": "France", "region": "Europe", "lat": 45.764, "lng": 4.8357, "cost_index": 60},
+    {"id": "nice", "name": "Nice", "country": "France", "region": "Europe", "lat": 43.7102, "lng": 7.262, "cost_index": 70},
+]
+
+ACTIVITIES = [
+    {"id": "louvre", "city_id": "paris", "name": "Louvre", "category": "culture", "cost": 20.0, "currency": "USD", "duration": "4 hours", "duration_max": 240},
+    {"id": "seine", "city_id": "paris", "name": "Seine cruise", "category": "sightseeing", "cost": 15.0, "currency": "USD", "duration": "1 hour", "duration_max": 60},
+    {"id": "orsay", "city_id": "paris", "name": "Musee d'Orsay", "category": "culture", "cost": 16.0, "currency": "USD", "duration": "3 hours", "duration_max": 180},
+    {"id": "food", "city_id": "paris", "name": "Food tour", "category": "food", "cost": 30.0, "currency": "USD", "duration": "2 hours", "duration_max": 120},
+    {"id": "fourviere", "city_id": "lyon", "name": "Fourviere", "category": "culture", "cost": 0.0, "currency": "USD", "duration": "2 hours", "duration_max": 120},
+    {"id": "bouchon", "city_id": "lyon", "name": "Bouchon dinner", "category": "food", "cost": 40.0, "currency": "USD", "duration": "3 hours", "duration_max": 180},
+]
+
+
+class MemoryFile:
+    def __init__(self, data: bytes, metadata: dict):
+        self.data = data
+        self.metadata = metadata
+        self.length = len(data)
+        self.position = 0
+
+    def seek(self, position: int):
+        self.position = position
+
+    async def read(self, size: int = -1) -> bytes:
+        end = None if size < 0 else self.position + size
+        chunk = self.data[self.position:end]
+        self.position += len(chunk)
+        return chunk
+
+
+class MemoryUpload:
+    def __init__(self, bucket: "MemoryBucket", file_id: str, metadata: dict):
+        self.bucket = bucket
+        self.file_id = file_id
+        self.metadata = metadata
+        self.chunks = []
+
+    async def write(self, data: bytes):
+        self.chunks.append(data)
+
+    async def abort(self):
+        self.chunks = []
+
+    async def close(self):
+        self.bucket.files[self.file_id] = (b"".join(self.chunks), self.metadata)
+
+
+class MemoryBucket:
+    """The slice of the GridFS bucket API the media and import code uses, kept in a dict."""
+
+    def __init__(self):
+        self.files = {}
+
+    async def upload_from_stream_with_id(self, file_id, filename, data, metadata=None):
+        self.files[file_id] = (data, metadata or {})
+
+    def open_upload_stream_with_id(self, file_id, filename, metadata=None):
+        return MemoryUpload(self, file_id, metadata or {})
+
+    async def open_download_stream(self, file_id):
+        if file_id not in self.files:
+            raise NoFile(file_id)
+        return MemoryFile(*self.files[file_id])
+
+    async def delete(self, file_id):
+        if self.files.pop(file_id, None) is None:
+            raise NoFile(file_id)
+
+
+@pytest.fixture
+def client():
+    with TestClient(server.app) as test_client:
+        test_client.portal.call(server.repos.cities.insert_many, [dict(city) for city in CITIES])
+        test_client.portal.call(server.repos.activities.insert_many, [dict(activity) for activity in ACTIVITIES])
+        yield test_client
+
+
+@pytest.fixture
+def auth(client):
+    response = client.post("/api/auth/signup", json={"name": "Test User", "email": "test@example.com", "password": "secret123"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+@pytest.fixture
+def make_trip(client, auth):
+    def make(start_date="2025-06-01", end_date="2025-06-05") -> dict:
+        response = client.post("/api/trips", json={"name": "France", "start_date": start_date, "end_date": end_date}, headers=auth)
+        assert response.status_code == 200, response.text
+        return response.json()
+    return make
+
+
+@pytest.fixture
+def make_stop(client, auth):
+    def make(trip_id: str, city_id: str, start_date="2025-06-01", end_date="2025-06-01") -> dict:
+        response = client.post(f"/api/trips/{trip_id}/stops", json={"city_id": city_id, "start_date": start_date, "end_date": end_date}, headers=auth)
+        assert response.status_code == 200, response.text
+        return response.json()
+    return make
+
+
+@pytest.fixture
+def media_store(client, monkeypatch):
+    # Media routes answer 503 under memory storage; this lets them run against a bucket in a dict
+    bucket = MemoryBucket()
+    monkeypatch.setattr(server, "media_bucket", bucket)
+    monkeypatch.setattr(server, "STORAGE_BACKEND", "mongo")
+    return bucket
@@ -0,0 +1,107 @@
+from datetime import datetime
+
+import numpy as np
+
+import activity_planner
+import server
+
+
+def minutes(clock: str) -> int:
+    hours, mins = clock.split(":")
+    return int(hours) * 60 + int(mins)
+
+
+def intervals(items):
+    return sorted((minutes(item["time"]), minutes(item["time"]) + item["duration_minutes"], item["id"]) for item in items)
+
+
+def assert_no_overlaps(items):
+    spans = intervals(items)
+    for (_, end, first), (start, _, second) in zip(spans, spans[1:]):
+        assert end <= start, f"{first} overlaps {second}"
+
+
+def test_auto_plan_places_items_around_bookings(client, auth, make_trip, make_stop):
+    trip = make_trip()
+    stop = make_stop(trip["id"], "paris")
+    booked = client.post(
+        f"/api/stops/{stop['id']}/activities",
+        json={"activity_id": "food", "date": "2025-06-01", "time": "10:00", "cost": 30},
+        headers=auth
+    )
+    assert booked.status_code == 200, booked.text
+
+    response = client.post(f"/api/stops/{stop['id']}/auto-plan", json={"daily_budget": 1000, "day_start": "09:00"}, headers=auth)
+    assert response.status_code == 200, response.text
+    planned = response.json()
+    assert planned
+    assert "food" not in {item["activity_id"] for item in planned}
+
+    catalog = {activity["id"]: activity["duration_max"] for activity in client.portal.call(server.repos.activities.find, {})}
+    for item in planned:
+        assert item["duration_minutes"] == catalog[item["activity_id"]]
+        assert minutes(item["time"]) >= minutes("09:00")
+        assert minutes(item["time"]) + item["duration_minutes"] <= 24 * 60
+    assert_no_overlaps(planned + [booked.json()])
+
+
+def test_auto_plan_charges_catalog_duration_for_legacy_bookings(client, auth, make_trip, make_stop):
+    trip = make_trip()
+    stop = make_stop(trip["id"], "paris")
+    # Written before bookings stored their duration; the Louvre takes 240 minutes in the catalog
+    client.portal.call(server.repos.trip_activities.insert, {
+        "id": "legacy", "stop_id": stop["id"], "trip_id": trip["id"], "user_id": trip["user_id"],
+        "activity_id": "louvre", "date": datetime(2025, 6, 1), "time": None, "cost": 20.0, "currency": "USD",
+        "updated_at": "2025-01-01T00:00:00+00:00"
+    })
+
+    response = client.post(f"/api/stops/{stop['id']}/auto-plan", json={"daily_budget": 1000, "max_minutes_per_day": 300}, headers=auth)
+    assert response.status_code == 200, response.text
+    # Only the hour-long cruise fits in what the booking leaves of the day
+    assert [item["activity_id"] for item in response.json()] == ["seine"]
+
+
+def test_auto_plan_drops_items_that_do_not_fit_before_midnight(client, auth, make_trip, make_stop):
+    trip = make_trip()
+    stop = make_stop(trip["id"], "paris")
+
+    response = client.post(f"/api/stops/{stop['id']}/auto-plan", json={"daily_budget": 1000, "max_minutes_per_day": 960, "day_start": "21:00"}, headers=auth)
+    assert response.status_code == 200, response.text
+    planned = response.json()
+    assert planned
+    assert sum(item["duration_minutes"] for item in planned) <= 180
+    for item in planned:
+        assert minutes(item["time"]) + item["duration_minutes"] <= 24 * 60
+
+
+def test_trip_auto_plan_keeps_stops_on_the_same_day_apart(client, auth, make_trip, make_stop):
+    trip = make_trip()
+    # A day trip to Lyon on the same date as the Paris stop
+    make_stop(trip["id"], "paris")
+    make_stop(trip["id"], "lyon")
+
+    response = client.post(f"/api/trips/{trip['id']}/auto-plan", json={"daily_budget": 1000, "max_minutes_per_day": 480}, headers=auth)
+    assert response.status_code == 200, response.text
+    planned = response.json()
+    assert {item["stop_id"] for item in planned} and len({item["stop_id"] for item in planned}) == 2
+    assert_no_overlaps(planned)
+
+    # Every planned item also passes the conflict check of a manual booking
+    for item in planned:
+        schedule = client.portal.call(server.load_day_schedule, trip["id"], datetime(2025, 6, 1).date())
+        start = minutes(item["time"])
+        assert schedule.overlapping(start, start + item["duration_minutes"]) == [item["id"]]
+
+
+def test_planner_charges_only_activities_that_get_placed():
+    costs = np.array([40.0, 40.0])
+    minutes = np.array([60, 60])
+    scores = np.array([2.0, 1.0])
+
+    # The better activity finds no gap on the only day, which leaves the budget to the other one
+    plan = activity_planner.plan_days(costs, minutes, scores, 1, 50, 480, place=lambda index, day: None if index == 0 else 600)
+    assert plan == [activity_planner.PlannedSlot(index=1, day=0, start_minute=600)]
+
+    # A day without a gap is skipped for the next feasible one
+    plan = activity_planner.plan_days(costs, minutes, scores, 2, 50, 480, place=lambda index, day: None if day == 0 else 540)
+    assert [(slot.index, slot.day) for slot in plan] == [(0, 1)]
@@ -0,0 +1,52 @@
+import server
+
+
+def test_costs_in_a_currency_the_rates_dropped_keep_their_stored_amount(client, auth, make_trip):
+    trip = make_trip()
+    added = client.post(f"/api/trips/{trip['id']}/costs", json={"category": "food", "amount": 92, "currency": "EUR"}, headers=auth)
+    assert added.status_code == 200, added.text
+    # Entered while the rates still quoted the old currency
+    client.portal.call(server.repos.trip_costs.insert, {
+        "id": "legacy", "trip_id": trip["id"], "user_id": trip["user_id"], "category": "food",
+        "amount": 50.0, "currency": "XDR", "base_amount": 66.0, "updated_at": "2025-01-01T00:00:00+00:00"
+    })
+
+    response = client.get(f"/api/trips/{trip['id']}/costs?currency=USD", headers=auth)
+    assert response.status_code == 200, response.text
+    costs = {cost["id"]: cost for cost in response.json()}
+    assert (costs[added.json()["id"]]["display_amount"], costs[added.json()["id"]]["display_currency"]) == (100.0, "USD")
+    assert (costs["legacy"]["display_amount"], costs["legacy"]["display_currency"]) == (50.0, "XDR")
+
+
+def test_auto_plan_leaves_out_activities_priced_in_a_dropped_currency(client, auth, make_trip, make_stop):
+    trip = make_trip()
+    stop = make_stop(trip["id"], "paris")
+    client.portal.call(server.repos.activities.update, {"id": "seine"}, {"currency": "XDR"})
+
+    response = client.post(f"/api/stops/{stop['id']}/auto-plan", json={"daily_budget": 1000, "max_minutes_per_day": 960}, headers=auth)
+    assert response.status_code == 200, response.text
+    planned = {item["activity_id"] for item in response.json()}
+    assert planned and "seine" not in planned
+
+
+def test_costs_and_summaries_convert_to_the_requested_currency(client, auth, make_trip):
+    trip = make_trip()
+    added = client.post(f"/api/trips/{trip['id']}/costs", json={"category": "Food", "amount": 92, "currency": "EUR"}, headers=auth)
+    assert (added.json()["amount"], added.json()["currency"]) == (92.0, "EUR")
+
+    costs = client.get(f"/api/trips/{trip['id']}/costs", params={"currency": "GBP"}, headers=auth).json()
+    assert [(cost["display_amount"], cost["display_currency"]) for cost in costs] == [(79.0, "GBP")]
+    # Summaries are kept in the base currency and converted on the way out
+    summary = client.get(f"/api/trips/{trip['id']}/summary", params={"currency": "EUR"}, headers=auth).json()
+    assert (summary["total_spend"], summary["spend_by_category"], summary["currency"]) == (92.0, {"Food": 92.0}, "EUR")
+    assert summary["rates_version"] == client.get("/api/currencies").json()["version"]
+
+
+def test_profile_currency_is_the_default_and_unknown_codes_are_rejected(client, auth, make_trip):
+    trip = make_trip()
+    assert client.put("/api/users/profile", json={"currency": "eur"}, headers=auth).json()["currency"] == "EUR"
+    added = client.post(f"/api/trips/{trip['id']}/costs", json={"category": "Food", "amount": 10}, headers=auth)
+    assert added.json()["currency"] == "EUR"
+
+    assert client.get(f"/api/trips/{trip['id']}/costs", params={"currency": "XDR"}, headers=auth).status_code == 422
+    assert client.post(f"/api/trips/{trip['id']}/costs", json={"category": "Food", "amount": 10, "currency": "XDR"}, headers=auth).status_code == 422
@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+
+import pytest
+
+import importer
+
+
+@pytest.fixture
+def booked_trip(client, auth, make_trip, make_stop):
+    trip = make_trip()
+    stop = make_stop(trip["id"], "paris", end_date="2025-06-02")
+    booked = client.post(f"/api/stops/{stop['id']}/activities", json={"activity_id": "louvre", "date": "2025-06-01", "time": "10:00", "cost": 20}, headers=auth)
+    assert booked.status_code == 200, booked.text
+    cost = client.post(f"/api/trips/{trip['id']}/costs", json={"category": "Food", "amount": 30}, headers=auth)
+    assert cost.status_code == 200, cost.text
+    return trip, stop
+
+
+def test_ndjson_export_lists_a_trip_parents_first(client, auth, booked_trip):
+    trip, stop = booked_trip
+    response = client.get(f"/api/trips/{trip['id']}/export", headers=auth)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert response.headers["content-disposition"] == f'attachment; filename="trip-{trip["id"]}.ndjson"'
+
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [record["type"] for record in records] == ["trip", "stop", "activity", "cost"]
+    assert records[1]["id"] == stop["id"] and records[1]["city_name"] == "Paris"
+    assert (records[2]["activity_name"], records[2]["date"], records[2]["time"]) == ("Louvre", "2025-06-01", "10:00")
+
+
+def test_csv_export_has_one_row_per_record(client, auth, booked_trip):
+    trip, _ = booked_trip
+    response = client.get(f"/api/trips/{trip['id']}/export", params={"format": "csv"}, headers=auth)
+    assert response.status_code == 200, response.text
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["type"] for row in rows] == ["trip", "stop", "activity", "cost"]
+    assert (rows[2]["name"], rows[2]["amount"], rows[2]["currency"]) == ("Louvre", "20.0", "USD")
+    assert (rows[3]["category"], rows[3]["amount"]) == ("Food", "30.0")
+
+
+def test_ics_export_has_an_event_per_stop_and_timed_activity(client, auth, booked_trip):
+    trip, stop = booked_trip
+    response = client.get(f"/api/trips/{trip['id']}/export", params={"format": "ics"}, headers=auth)
+    assert response.status_code == 200, response.text
+
+    lines = response.text.splitlines()
+    assert lines[0] == "BEGIN:VCALENDAR" and lines[-1] == "END:VCALENDAR"
+    assert lines.count("BEGIN:VEVENT") == 2
+    assert f"UID:stop-{stop['id']}@globaltrotters" in lines
+    # Stops are all-day events, and the end date is exclusive
+    assert "DTEND;VALUE=DATE:20250603" in lines
+    assert "DTSTART:20250601T100000" in lines and "DURATION:PT240M" in lines
+
+
+def test_exports_cover_only_the_callers_trips(client, auth, booked_trip):
+    trip, _ = booked_trip
+    assert client.get("/api/trips/missing/export", headers=auth).status_code == 404
+
+    other = client.post("/api/auth/signup", json={"name": "Other", "email": "other@example.com", "password": "secret123"})
+    other_auth = {"Authorization": f"Bearer {other.json()['token']}"}
+    assert client.get(f"/api/trips/{trip['id']}/export", headers=other_auth).status_code == 404
+    assert client.get("/api/trips/export", headers=other_auth).text == ""
+    assert [json.loads(line)["id"] for line in client.get("/api/trips/export", headers=auth).text.splitlines()][0] == trip["id"]
+
+
+@pytest.mark.parametrize("export_format", ["csv", "ndjson"])
+def test_exported_files_read_back_as_import_rows(client, auth, booked_trip, export_format):
+    trip, stop = booked_trip
+    exported = client.get(f"/api/trips/{trip['id']}/export", params={"format": export_format}, headers=auth).text
+
+    rows = list(importer.read_rows(io.StringIO(exported), export_format))
+    assert [row["type"] for row in rows] == ["trip", "stop", "activity", "cost"]
+    trip_row, stop_row, activity_row, cost_row = rows
+    assert (trip_row["ref"], trip_row["name"], trip_row["start_date"], trip_row["end_date"]) == (trip["id"], "France", "2025-06-01", "2025-06-05")
+    assert (stop_row["ref"], stop_row["trip_ref"], stop_row["city"], stop_row["country"]) == (stop["id"], trip["id"], "Paris", "France")
+    assert (activity_row["stop_ref"], activity_row["name"], activity_row["date"], activity_row["time"]) == (stop["id"], "Louvre", "2025-06-01", "10:00")
+    assert (cost_row["trip_ref"], cost_row["category"], float(cost_row["amount"])) == (trip["id"], "Food", 30.0)
+
+
+def test_import_rows_report_bad_lines_instead_of_failing():
+    rows = list(importer.read_rows(io.StringIO('{"type": "trip"\n[1, 2]\n\n{"type": "cost"}\n'), "ndjson"))
+    assert len(rows) == 3
+    assert rows[0]["error"].startswith("Invalid JSON")
+    assert rows[1]["error"] == "Each line must be a JSON object"
+    assert rows[2]["type"] == "cost" and "error" not in rows[2]
+    assert importer.detect_format("trip.JSONL") == "ndjson" and importer.detect_format("trip.xlsx") is None
+
+
+def test_imports_need_mongo_storage(client, auth):
+    response = client.post("/api/imports", files={"file": ("trip.csv", b"type\n", "text/csv")}, headers=auth)
+    assert response.status_code == 503
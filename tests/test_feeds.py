@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import feeds
+
+
+def visit_weight(start: datetime) -> float:
+    # What the _visit_weight pipeline stage stores for a stop starting at start
+    return 2 ** ((start - feeds.RECENCY_EPOCH) / feeds.RECENCY_HALF_LIFE)
+
+
+def test_decay_halves_every_half_life():
+    assert feeds.decay_factor(feeds.RECENCY_EPOCH) == 1.0
+    assert feeds.decay_factor(feeds.RECENCY_EPOCH + feeds.RECENCY_HALF_LIFE) == pytest.approx(0.5)
+    assert feeds.decay_factor(feeds.RECENCY_EPOCH + 3 * feeds.RECENCY_HALF_LIFE) == pytest.approx(0.125)
+
+
+def test_a_visit_starting_now_scores_one_and_older_visits_fade():
+    now = datetime(2026, 10, 19, tzinfo=timezone.utc)
+    assert visit_weight(now) * feeds.decay_factor(now) == pytest.approx(1.0)
+    assert visit_weight(now - feeds.RECENCY_HALF_LIFE) * feeds.decay_factor(now) == pytest.approx(0.5)
+
+
+def test_decaying_to_a_later_day_keeps_the_ranking():
+    # Every stored weight scales by the same factor, so refreshes never need to rewrite them
+    weights = [visit_weight(datetime(2025, 1, 1, tzinfo=timezone.utc)) * 3, visit_weight(datetime(2026, 1, 1, tzinfo=timezone.utc))]
+    for days in (0, 30, 400):
+        factor = feeds.decay_factor(datetime(2026, 6, 1, tzinfo=timezone.utc) + timedelta(days=days))
+        scores = [weight * factor for weight in weights]
+        assert scores[1] > scores[0]
+        assert scores[0] / scores[1] == pytest.approx(weights[0] / weights[1])
+
+
+@pytest.mark.parametrize("path", ["/api/trips/public", "/api/cities/popular"])
+def test_feeds_need_mongo_storage(client, path):
+    # Both read collections that only the MongoDB aggregation refresh writes
+    assert client.get(path).status_code == 503
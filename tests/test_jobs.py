@@ -0,0 +1,19 @@
+import asyncio
+
+import jobs
+import repositories
+
+
+def test_worker_stops_when_cancelled_as_it_wakes():
+    async def scenario():
+        worker = jobs.JobWorker(repositories.memory_repositories().jobs, {}, {})
+        task = asyncio.create_task(worker.run())
+        await asyncio.sleep(0.01)
+        # The wakeup lands first, so the cancel reaches a worker that is already due to resume
+        worker.notify()
+        await asyncio.sleep(0)
+        task.cancel()
+        done, _ = await asyncio.wait([task], timeout=1)
+        assert done, "worker kept running after it was cancelled"
+
+    asyncio.run(scenario())
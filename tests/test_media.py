@@ -0,0 +1,70 @@
+import io
+
+import pytest
+from PIL import Image
+
+
+@pytest.fixture
+def upload(client, auth, media_store):
+    image = io.BytesIO()
+    Image.new("RGB", (64, 64), (200, 40, 40)).save(image, format="PNG")
+    response = client.post("/api/media", files={"file": ("red.png", image.getvalue(), "image/png")}, headers=auth)
+    assert response.status_code == 200, response.text
+    return response.json(), image.getvalue()
+
+
+def test_media_is_served_whole_to_its_owner(client, auth, upload):
+    stored, data = upload
+    assert (stored["content_type"], stored["length"]) == ("image/png", len(data))
+
+    response = client.get(stored["url"], headers=auth)
+    assert response.status_code == 200
+    assert response.content == data
+    assert (response.headers["content-type"], response.headers["accept-ranges"]) == ("image/png", "bytes")
+    # Image tags cannot send headers, so the JWT also works as a query parameter
+    token = auth["Authorization"].split()[1]
+    assert client.get(stored["url"], params={"token": token}).content == data
+
+
+@pytest.mark.parametrize("header, start, end", [("bytes=0-9", 0, 9), ("bytes=10-", 10, None), ("bytes=-5", -5, None), ("bytes=0-999999", 0, None)])
+def test_media_answers_range_requests(client, auth, upload, header, start, end):
+    stored, data = upload
+    expected = data[start:None if end is None else end + 1]
+
+    response = client.get(stored["url"], headers={**auth, "Range": header})
+    assert response.status_code == 206
+    assert response.content == expected
+    first = start % len(data)
+    assert response.headers["content-range"] == f"bytes {first}-{first + len(expected) - 1}/{len(data)}"
+    assert response.headers["content-length"] == str(len(expected))
+
+
+@pytest.mark.parametrize("header", ["bytes=5-2", "bytes=999999-", "bytes=-", "items=0-1"])
+def test_media_rejects_unsatisfiable_ranges(client, auth, upload, header):
+    stored, data = upload
+    response = client.get(stored["url"], headers={**auth, "Range": header})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(data)}"
+
+
+def test_media_revalidates_and_has_a_thumbnail(client, auth, upload):
+    stored, _ = upload
+    etag = client.get(stored["url"], headers=auth).headers["etag"]
+    assert client.get(stored["url"], headers={**auth, "If-None-Match": etag}).status_code == 304
+
+    thumb = client.get(stored["thumbnail_url"], headers=auth)
+    assert thumb.status_code == 200 and thumb.headers["content-type"] == "image/jpeg"
+
+
+def test_media_stays_private_to_its_owner(client, upload):
+    stored, _ = upload
+    other = client.post("/api/auth/signup", json={"name": "Other", "email": "other@example.com", "password": "secret123"})
+    assert client.get(stored["url"]).status_code == 401
+    assert client.get(stored["url"], headers={"Authorization": f"Bearer {other.json()['token']}"}).status_code == 404
+    assert client.get("/api/media/missing", params={"token": other.json()["token"]}).status_code == 404
+
+
+def test_media_refuses_files_that_are_not_images(client, auth, media_store):
+    response = client.post("/api/media", files={"file": ("notes.png", b"not an image", "image/png")}, headers=auth)
+    assert response.status_code == 415
+    assert media_store.files == {}
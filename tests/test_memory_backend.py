@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/api/trips/public", "/api/cities/popular", "/api/cities/nearby?lat=48.8&lng=2.3", "/api/media/anything"])
+def test_mongo_only_endpoints_answer_503(client, path):
+    response = client.get(path)
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Not available with in-memory storage"
+
+
+def test_inline_images_need_the_media_store(client, auth, make_trip):
+    trip = make_trip()
+    pixel = "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+    assert client.put(f"/api/trips/{trip['id']}", json={"cover_photo": pixel}, headers=auth).status_code == 503
+    response = client.put(f"/api/trips/{trip['id']}", json={"cover_photo": "https://example.com/cover.jpg"}, headers=auth)
+    assert response.status_code == 200
+    assert response.json()["cover_photo"] == "https://example.com/cover.jpg"
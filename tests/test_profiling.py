@@ -0,0 +1,79 @@
+import json
+import pickle
+import tracemalloc
+from collections import Counter
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture
+def admin(client, auth, monkeypatch):
+    # The signup behind auth uses test@example.com; the list is read on every request
+    monkeypatch.setenv("ADMIN_EMAILS", "ops@example.com, Test@Example.com")
+    return auth
+
+
+def test_profiling_is_for_admins_only(client, auth, monkeypatch):
+    monkeypatch.setenv("ADMIN_EMAILS", "ops@example.com")
+    for path in ["/api/admin/profile/cpu?seconds=0.05", "/api/admin/profile/loop", "/api/admin/profile/models"]:
+        assert client.get(path, headers=auth).status_code == 403, path
+    assert client.post("/api/admin/profile/memory/snapshots", headers=auth).status_code == 403
+    assert client.get("/api/admin/profile/models").status_code in (401, 403)
+
+
+def test_cpu_profile_comes_in_both_formats(client, admin):
+    collapsed = client.get("/api/admin/profile/cpu", params={"seconds": 0.05, "interval_ms": 5, "idle": True}, headers=admin)
+    assert collapsed.status_code == 200, collapsed.text
+    assert collapsed.headers["content-disposition"].endswith('.folded"')
+    # One "frame;frame;frame count" line per distinct stack
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed.text.splitlines())
+
+    speedscope = client.get("/api/admin/profile/cpu", params={"seconds": 0.05, "interval_ms": 5, "format": "speedscope", "idle": True}, headers=admin)
+    assert speedscope.status_code == 200, speedscope.text
+    assert "speedscope" in json.loads(speedscope.text)["$schema"]
+
+    assert client.get("/api/admin/profile/cpu", params={"seconds": 0.05, "format": "pprof"}, headers=admin).status_code == 422
+    assert client.get("/api/admin/profile/cpu", params={"seconds": 3600}, headers=admin).status_code == 422
+
+
+def test_memory_snapshots_diff_and_download(client, admin):
+    try:
+        first = client.post("/api/admin/profile/memory/snapshots", headers=admin)
+        assert first.status_code == 200, first.text
+        ballast = [bytearray(1024) for _ in range(512)]
+        second = client.post("/api/admin/profile/memory/snapshots", params={"limit": 5}, headers=admin).json()
+        assert len(second["top"]) <= 5
+
+        diff = client.get(f"/api/admin/profile/memory/snapshots/{second['id']}/diff", params={"against": first.json()["id"]}, headers=admin)
+        assert diff.status_code == 200, diff.text
+        assert any(row["file"].endswith("test_profiling.py") and row["size_diff_kb"] >= 512 for row in diff.json()["top"])
+        del ballast
+
+        by_file = client.get(f"/api/admin/profile/memory/snapshots/{second['id']}", params={"group_by": "filename"}, headers=admin)
+        assert by_file.status_code == 200, by_file.text
+        assert client.get(f"/api/admin/profile/memory/snapshots/{second['id']}", params={"group_by": "module"}, headers=admin).status_code == 422
+        assert client.get("/api/admin/profile/memory/snapshots/missing", headers=admin).status_code == 404
+
+        download = client.get(f"/api/admin/profile/memory/snapshots/{second['id']}/download", headers=admin)
+        assert download.status_code == 200
+        assert isinstance(pickle.loads(download.content), tracemalloc.Snapshot)
+    finally:
+        assert client.delete("/api/admin/profile/memory", headers=admin).status_code == 200
+    assert not tracemalloc.is_tracing()
+
+
+def test_live_model_counts_and_loop_monitor(client, admin, make_trip):
+    make_trip()
+    models = client.get("/api/admin/profile/models", params={"limit": 500}, headers=admin)
+    assert models.status_code == 200, models.text
+    assert models.json()["total"] == sum(model["count"] for model in models.json()["models"])
+
+    # The suite runs without the event loop monitor
+    assert client.get("/api/admin/profile/loop", headers=admin).status_code == 503
+
+
+def test_collapsed_stacks_put_the_hottest_first():
+    samples = Counter({("main",): 1, ("main", "work"): 3})
+    assert profiling.collapsed(samples).splitlines() == ["main;work 3", "main 1"]
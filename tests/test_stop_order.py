@@ -0,0 +1,40 @@
+def stop_ids(client, auth, trip_id: str):
+    response = client.get(f"/api/trips/{trip_id}/stops", headers=auth)
+    assert response.status_code == 200, response.text
+    return [stop["id"] for stop in response.json()]
+
+
+def test_reorder_rewrites_only_moved_stops(client, auth, make_trip, make_stop):
+    trip = make_trip()
+    stops = [make_stop(trip["id"], city) for city in ("paris", "lyon", "nice")]
+    first, second, third = (stop["id"] for stop in stops)
+
+    response = client.patch(f"/api/trips/{trip['id']}/stops/order", json={"stop_ids": [third, first, second]}, headers=auth)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["moved"] == 1
+    keys = [entry["order"] for entry in body["stops"]]
+    assert keys == sorted(keys)
+    assert stop_ids(client, auth, trip["id"]) == [third, first, second]
+
+
+def test_reorder_rejects_a_stale_stop_list(client, auth, make_trip, make_stop):
+    trip = make_trip()
+    first, second = (make_stop(trip["id"], city)["id"] for city in ("paris", "lyon"))
+    make_stop(trip["id"], "nice")
+
+    response = client.patch(f"/api/trips/{trip['id']}/stops/order", json={"stop_ids": [second, first]}, headers=auth)
+    assert response.status_code == 409
+    assert client.patch(f"/api/trips/{trip['id']}/stops/order", json={"stop_ids": [second, first, first]}, headers=auth).status_code == 409
+
+
+def test_stops_inserted_between_neighbours_keep_their_place(client, auth, make_trip, make_stop):
+    trip = make_trip()
+    first, second = (make_stop(trip["id"], city) for city in ("paris", "lyon"))
+    middle = client.post(
+        f"/api/trips/{trip['id']}/stops",
+        json={"city_id": "nice", "start_date": "2025-06-01", "end_date": "2025-06-01", "order": (first["order"] + second["order"]) / 2},
+        headers=auth
+    )
+    assert middle.status_code == 200, middle.text
+    assert stop_ids(client, auth, trip["id"]) == [first["id"], middle.json()["id"], second["id"]]
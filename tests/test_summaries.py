@@ -0,0 +1,31 @@
+def test_summaries_follow_bookings_costs_and_deletes(client, auth, make_trip, make_stop):
+    trip = make_trip()
+    stop = make_stop(trip["id"], "paris")
+    booked = client.post(f"/api/stops/{stop['id']}/activities", json={"activity_id": "louvre", "date": "2025-06-01", "time": "10:00", "cost": 20}, headers=auth)
+    assert booked.status_code == 200, booked.text
+    cost = client.post(f"/api/trips/{trip['id']}/costs", json={"category": "Food", "amount": 30}, headers=auth)
+    assert cost.status_code == 200, cost.text
+
+    summary = client.get(f"/api/trips/{trip['id']}/summary", headers=auth).json()
+    assert (summary["stops"], summary["activities"], summary["costs"]) == (1, 1, 1)
+    assert summary["spend_by_category"] == {"Activities": 20.0, "Food": 30.0}
+    assert summary["total_spend"] == 50.0
+    user_summary = client.get("/api/users/summary", headers=auth).json()
+    assert (user_summary["trips"], user_summary["total_spend"]) == (1, 50.0)
+
+    assert client.delete(f"/api/costs/{cost.json()['id']}", headers=auth).status_code == 200
+    summary = client.get(f"/api/trips/{trip['id']}/summary", headers=auth).json()
+    assert (summary["costs"], summary["total_spend"]) == (0, 20.0)
+
+    # Deleting the trip takes back everything it contributed to the user's summary
+    assert client.delete(f"/api/trips/{trip['id']}", headers=auth).status_code == 202
+    user_summary = client.get("/api/users/summary", headers=auth).json()
+    assert (user_summary["trips"], user_summary["stops"], user_summary["activities"], user_summary["total_spend"]) == (0, 0, 0, 0.0)
+    assert client.get(f"/api/trips/{trip['id']}/summary", headers=auth).status_code == 404
+
+
+def test_summary_of_an_untouched_trip_is_empty(client, auth, make_trip):
+    trip = make_trip()
+    summary = client.get(f"/api/trips/{trip['id']}/summary", headers=auth)
+    assert summary.status_code == 200, summary.text
+    assert (summary.json()["trip_id"], summary.json()["total_spend"], summary.json()["spend_by_category"]) == (trip["id"], 0.0, {})
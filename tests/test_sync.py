@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone
+
+import server
+
+
+def test_sync_reports_deletes_as_tombstones(client, auth, make_trip, make_stop):
+    trip = make_trip()
+    stop = make_stop(trip["id"], "paris")
+    first = client.get("/api/sync", headers=auth).json()
+    assert [item["id"] for item in first["stops"]] == [stop["id"]]
+    assert first["deleted"] == []
+
+    assert client.delete(f"/api/stops/{stop['id']}", headers=auth).status_code == 200
+    response = client.get("/api/sync", params={"since": first["cursor"]}, headers=auth)
+    assert response.status_code == 200, response.text
+    changes = response.json()
+    assert changes["stops"] == []
+    assert [(item["id"], item["collection"]) for item in changes["deleted"]] == [(stop["id"], "stops")]
+    assert not changes["reset"]
+
+
+def test_sync_keeps_tombstones_to_their_owner(client, auth, make_trip):
+    trip = make_trip()
+    other = client.post("/api/auth/signup", json={"name": "Other", "email": "other@example.com", "password": "secret123"})
+    assert client.delete(f"/api/trips/{trip['id']}", headers=auth).status_code == 202
+
+    mine = client.get("/api/sync", headers=auth).json()
+    theirs = client.get("/api/sync", headers={"Authorization": f"Bearer {other.json()['token']}"}).json()
+    assert [(item["id"], item["collection"]) for item in mine["deleted"]] == [(trip["id"], "trips")]
+    assert theirs["deleted"] == []
+
+
+def test_sync_past_the_tombstone_retention_starts_over(client, auth, make_trip):
+    trip = make_trip()
+    # Older than any tombstone still kept, so deletes since then may have been forgotten
+    stale = (datetime.now(timezone.utc) - server.TOMBSTONE_RETENTION - timedelta(days=1)).isoformat()
+    cursor = server.encode_sync_cursor({name: (stale, "") for name in server.SYNC_COLLECTIONS + ["tombstones"]})
+
+    response = client.get("/api/sync", params={"since": cursor}, headers=auth)
+    assert response.status_code == 200, response.text
+    assert response.json()["reset"]
+    assert [item["id"] for item in response.json()["trips"]] == [trip["id"]]
+
+
+def test_sync_rejects_a_garbled_cursor(client, auth):
+    assert client.get("/api/sync", params={"since": "not-a-cursor"}, headers=auth).status_code == 400
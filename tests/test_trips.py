@@ -0,0 +1,104 @@
+import base64
+import time
+
+import pytest
+
+import server
+
+PIXEL_PNG = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==")
+
+
+def wait_for_job(client, auth, job_id: str, timeout: float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/api/jobs/{job_id}", headers=auth).json()
+        if job["status"] in ("completed", "failed") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+def test_delete_trip_clears_children_in_a_job(client, auth, make_trip, make_stop):
+    trip = make_trip()
+    stop = make_stop(trip["id"], "paris")
+    booked = client.post(f"/api/stops/{stop['id']}/activities", json={"activity_id": "seine", "date": "2025-06-01", "cost": 15}, headers=auth)
+    assert booked.status_code == 200, booked.text
+    cost = client.post(f"/api/trips/{trip['id']}/costs", json={"category": "transport", "amount": 120}, headers=auth)
+    assert cost.status_code == 200, cost.text
+
+    response = client.delete(f"/api/trips/{trip['id']}", headers=auth)
+    assert response.status_code == 202, response.text
+    assert client.get(f"/api/trips/{trip['id']}", headers=auth).status_code == 404
+
+    job = wait_for_job(client, auth, response.json()["job_id"])
+    assert job["status"] == "completed", job
+    # Released only after the delete, so it never runs into the trip still being there
+    assert job["attempts"] == 1 and job["error"] is None, job
+    assert job["result"] == {"stops": 1, "trip_activities": 1, "trip_costs": 1}
+    for name in ("stops", "trip_activities", "trip_costs"):
+        assert client.portal.call(getattr(server.repos, name).count, {"trip_id": trip["id"]}) == 0
+
+    summary = client.get("/api/users/summary", headers=auth).json()
+    assert summary["trips"] == 0
+    assert summary["activities"] == 0
+
+
+def test_delete_trip_of_another_user_is_not_found(client, auth, make_trip):
+    trip = make_trip()
+    other = client.post("/api/auth/signup", json={"name": "Other", "email": "other@example.com", "password": "secret123"}).json()
+    response = client.delete(f"/api/trips/{trip['id']}", headers={"Authorization": f"Bearer {other['token']}"})
+    assert response.status_code == 404
+    assert client.get(f"/api/trips/{trip['id']}", headers=auth).status_code == 200
+
+
+def test_delete_job_waits_for_the_trip_to_be_deleted(client, auth, make_trip, make_stop):
+    trip = make_trip()
+    make_stop(trip["id"], "paris")
+    job = {"payload": {"trip_id": trip["id"]}, "user_id": trip["user_id"]}
+
+    with pytest.raises(RuntimeError):
+        client.portal.call(server.delete_trip_children, job)
+    assert client.portal.call(server.repos.stops.count, {"trip_id": trip["id"]}) == 1
+
+
+def test_published_at_follows_publishing(client, auth, make_trip):
+    trip = make_trip()
+
+    def published_at():
+        return client.portal.call(server.repos.trips.get, {"id": trip["id"]})["published_at"]
+
+    def update(changes):
+        response = client.put(f"/api/trips/{trip['id']}", json=changes, headers=auth)
+        assert response.status_code == 200, response.text
+
+    assert published_at() is None
+    update({"is_public": True})
+    first = published_at()
+    assert first is not None
+
+    # Edits and repeated publishes keep the original stamp
+    update({"name": "Renamed"})
+    update({"is_public": True})
+    assert published_at() == first
+
+    update({"is_public": False})
+    assert published_at() is None
+    update({"is_public": True})
+    assert published_at() > first
+
+
+def test_clone_gets_its_own_cover_and_no_publish_stamp(client, auth, make_trip, media_store):
+    trip = make_trip()
+    cover = client.post(f"/api/trips/{trip['id']}/cover-photo", files={"file": ("cover.png", PIXEL_PNG, "image/png")}, headers=auth)
+    assert cover.status_code == 200, cover.text
+    assert client.put(f"/api/trips/{trip['id']}", json={"is_public": True}, headers=auth).status_code == 200
+
+    other = client.post("/api/auth/signup", json={"name": "Other", "email": "other@example.com", "password": "secret123"}).json()["token"]
+    response = client.post(f"/api/trips/shared/{trip['share_token']}/clone", headers={"Authorization": f"Bearer {other}"})
+    assert response.status_code == 200, response.text
+    clone = response.json()
+
+    assert clone["cover_photo"] not in (None, cover.json()["cover_photo"])
+    read = client.get(clone["cover_photo"], params={"token": other})
+    assert read.status_code == 200
+    assert read.content == PIXEL_PNG
+    assert client.portal.call(server.repos.trips.get, {"id": clone["id"]})["published_at"] is None